@@ -0,0 +1,300 @@
+"""
+Module for turning work away when a worker has more than it can do.
+
+Under a burst of traffic the workers take requests faster than they finish
+them, requests queue without limit and everything times out together. An
+AdmissionControl keeps count of the requests each worker has in flight, how
+long they waited to get there and how slow redis has been, and when that's
+too much it sheds the expensive requests to keep the cheap ones quick:
+
+    >>> from admission import AdmissionControl
+    >>> app = AppFactory(admission=AdmissionControl(max_in_flight=16))
+
+A worker is overloaded when it has max_in_flight requests in flight or a
+request waited more than max_queue_seconds to get to it. That wait is only
+known with a proxy in front stamping when the request came in, as
+"X-Request-Start: t=<unix time>" (nginx: proxy_set_header X-Request-Start
+"t=${msec}";). Sync gunicorn workers have one request in flight at a time,
+the queue is all there is to go by for them.
+
+When overloaded, saves, batch edits, the whole reading list, queries for
+more than one tag and requests that have a password to check (pbkdf2 is
+slow on purpose, see hashing) get a 503 with a Retry-After header. Listing
+and tag pages are answered with the last copy of them this worker sent, if
+it has one, so they don't touch redis at all. Everything else is let in.
+
+The same copies are sent when redis is slow (the average round trip, from
+the request's tracing.Trace, is over slow_redis_seconds) whether or not the
+worker is overloaded, with one request every probe_seconds let through to
+see if redis has got better. Copies have an Age header and "Warning: 110"
+to say they're stale.
+
+AppFactory puts this outside the compression middleware, so the copies are
+kept as they were sent, compressed, one for each encoding (see
+compression.choose_encoding). A copy is sent without compressing it again.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from compression import choose_encoding
+
+# the pages answered with the last copy when overloaded or redis is slow.
+CACHED_ROUTES = ('listing', 'tag')
+
+# the pages that are shed when overloaded, whatever they're asked.
+EXPENSIVE_ROUTES = ('save', 'api/links:batch', 'reading-list/all')
+
+# how much the average redis round trip moves towards each new request's.
+LATENCY_WEIGHT = 0.2
+
+
+def queue_seconds(environ, now):
+    """
+    How long ago the proxy in front got the request, from X-Request-Start
+    (in seconds, milliseconds or microseconds since the epoch), 0 without.
+    """
+    stamp = environ.get('HTTP_X_REQUEST_START', '')
+
+    if stamp.startswith('t='):
+        stamp = stamp[2:]
+
+    try:
+        started = float(stamp)
+    except ValueError:
+        return 0.0
+
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+
+    return max(0.0, now - started)
+
+
+def is_expensive(environ, route, params):
+    """
+    Whether a request is one to shed when overloaded.
+    """
+    if route.name in EXPENSIVE_ROUTES:
+        return True
+
+    # api/v1/tags/a/b, or api/v1/counts?tags=a,b
+    tags = params.get('tags') or parse_qs(environ.get('QUERY_STRING', '')).get('tags', [''])[0].split(',')
+
+    if len(tags) > 1:
+        return True
+
+    handler = route.handlers.get(environ.get('REQUEST_METHOD', 'GET'))
+
+    # a password to check, not a session that's already logged in.
+    return 'HTTP_AUTHORIZATION' in environ and getattr(handler, 'checks_password', False)
+
+
+class AdmissionControl:
+    """
+    The counts and thresholds for one worker (AppFactory makes one app per
+    worker), see the module docs. stats() has what it's seen.
+    """
+    def __init__(self, max_in_flight=32, max_queue_seconds=2.0, slow_redis_seconds=0.05,
+                 retry_after=5, probe_seconds=1.0, stale_pages=256, max_page_bytes=256 * 1024):
+        self.max_in_flight = max_in_flight
+        self.max_queue_seconds = max_queue_seconds
+        self.slow_redis_seconds = slow_redis_seconds
+        self.retry_after = retry_after
+        self.probe_seconds = probe_seconds
+        self.stale_pages = stale_pages
+        self.max_page_bytes = max_page_bytes
+
+        self.in_flight = 0
+        self.redis_seconds = 0.0
+        self.last_probe = 0.0
+        self.shed = 0
+        self.stale_sent = 0
+        self.pages = OrderedDict()
+        self.lock = threading.Lock()
+
+    def middleware(self, application, router):
+        return AdmissionMiddleware(application, self, router)
+
+    def redis_slow(self):
+        return self.redis_seconds > self.slow_redis_seconds
+
+    def admit(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def done(self, trace):
+        with self.lock:
+            self.in_flight -= 1
+
+            if trace is not None and trace.round_trips:
+                latency = trace.seconds / trace.round_trips
+                self.redis_seconds += (latency - self.redis_seconds) * LATENCY_WEIGHT
+
+    def probe(self, now):
+        """
+        Whether to let this request through to redis to see how it's doing.
+        """
+        with self.lock:
+            if now - self.last_probe < self.probe_seconds:
+                return False
+
+            self.last_probe = now
+            return True
+
+    def stale_page(self, key):
+        """
+        The last copy of a page, key being its (path, encoding).
+        """
+        with self.lock:
+            page = self.pages.get(key)
+
+            if page is not None:
+                self.pages.move_to_end(key)
+                self.stale_sent += 1
+
+            return page
+
+    def keep_page(self, key, status, headers, body, now):
+        with self.lock:
+            self.pages[key] = (status, headers, body, now)
+            self.pages.move_to_end(key)
+
+            while len(self.pages) > self.stale_pages:
+                self.pages.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'in_flight': self.in_flight,
+                'redis_seconds': self.redis_seconds,
+                'shed': self.shed,
+                'stale_sent': self.stale_sent,
+                'stale_pages': len(self.pages),
+            }
+
+
+class AdmissionMiddleware:
+    """
+    Sheds, answers from the copies or lets in each request, see the module
+    docs. router is the one the app routes with, to know what's asked for.
+    """
+    def __init__(self, application, control, router):
+        self.application = application
+        self.control = control
+        self.router = router
+
+    def __call__(self, environ, start_response):
+        control = self.control
+        now = time.time()
+
+        matched = self.router.match(environ.get('PATH_INFO', ''))
+
+        if matched is None:
+            return self.admitted(environ, start_response, None)
+
+        route, params = matched
+
+        overloaded = (control.in_flight >= control.max_in_flight or
+                      queue_seconds(environ, now) > control.max_queue_seconds)
+
+        if overloaded and is_expensive(environ, route, params):
+            with control.lock:
+                control.shed += 1
+
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain'), ('Retry-After', str(control.retry_after))])
+            return [b'Service Unavailable, Try Again Shortly']
+
+        cached = route.name in CACHED_ROUTES and environ.get('REQUEST_METHOD') == 'GET'
+        key = None
+
+        if cached:
+            key = (environ.get('PATH_INFO'), choose_encoding(environ.get('HTTP_ACCEPT_ENCODING', '')))
+
+        if cached and (overloaded or (control.redis_slow() and not control.probe(now))):
+            page = control.stale_page(key)
+
+            if page is not None:
+                status, headers, body, kept = page
+
+                start_response(status, headers + [
+                    ('Age', str(int(now - kept))),
+                    ('Warning', '110 - "Response is Stale"')])
+                return [body]
+
+        return self.admitted(environ, start_response, key)
+
+    def admitted(self, environ, start_response, keep_key):
+        control = self.control
+        started = []
+
+        def recording_start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+            return start_response(status, headers, exc_info)
+
+        control.admit()
+
+        try:
+            result = self.application(environ, recording_start_response)
+        except BaseException:
+            control.done(environ.get('linkapp.redis_trace'))
+            raise
+
+        return AdmittedBody(result, control, environ, started, keep_key)
+
+
+class AdmittedBody:
+    """
+    The body of a request that was let in: counts it out of flight once
+    the server closes it, keeping a copy of it first if it's a page to keep.
+    """
+    def __init__(self, result, control, environ, started, keep_key):
+        self.result = result
+        self.chunks = iter(result)
+        self.control = control
+        self.environ = environ
+        self.started = started
+        self.keep_key = keep_key
+        self.kept = [] if keep_key is not None else None
+        self.kept_bytes = 0
+        self.complete = False
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.complete = True
+            raise
+
+        if self.kept is not None:
+            self.kept.append(chunk)
+            self.kept_bytes += len(chunk)
+
+            if self.kept_bytes > self.control.max_page_bytes:
+                self.kept = None
+
+        return chunk
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+
+        try:
+            if hasattr(self.result, 'close'):
+                self.result.close()
+        finally:
+            self.control.done(self.environ.get('linkapp.redis_trace'))
+
+            if self.kept is not None and self.complete and self.started and self.started[0].startswith('200'):
+                status, headers = self.started
+                headers = [(key, value) for key, value in headers if key.lower() != 'set-cookie']
+                self.control.keep_page(self.keep_key, status, headers, b''.join(self.kept), time.time())
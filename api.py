@@ -0,0 +1,175 @@
+"""
+Module for the JSON API (version 1), served under <prefix>api/v1/:
+
+    GET links                   newest links, one page at a time
+    GET links?ids=a,b,c         the links with those ids, in that order 
+                                (null for ones that don't exist)
+    GET links/<id>              one link
+    GET tags/<tag>[/<tag>...]   newest links with all of the tags
+    GET counts[?tags=a,b]       how many links there are (with all the tags)
+    GET reading-list[?read=1]   the logged in user's unread (read) links
+    
+The listings take:
+
+    count     how many links per page (default 20, at most MAX_COUNT)
+    cursor    where to start, the "next" from the page before
+    fields    which fields to send, e.g. fields=key,page_title (default all)
+    
+and reply with {"links": [...], "next": cursor or null}. Links are sent as 
+the fields that came back from Redis, straight into JSON.
+
+Every reply has an ETag, a request with a matching If-None-Match gets a 304 
+and no body.
+
+The paths are routed to these functions by wsgilinkapp.routes, which also
+puts AuthenticationMiddleware around reading_list.
+"""
+
+import hashlib
+import json
+from urllib.parse import parse_qs
+
+from edit import LINK_FIELDS
+
+DEFAULT_COUNT = 20
+MAX_COUNT = 100
+MAX_IDS = 500
+
+
+def json_response(environ, start_response, body, status='200 OK'):
+    """
+    Send body as JSON, or a 304 if the client already has it.
+    """
+    data = json.dumps(body, separators=(',', ':')).encode('utf-8')
+    etag = '"%s"' % (hashlib.sha1(data).hexdigest(),)
+
+    matches = [x.strip() for x in environ.get('HTTP_IF_NONE_MATCH', '').split(',')]
+
+    if etag in matches or 'W/' + etag in matches or '*' in matches:
+        start_response('304 Not Modified', [('ETag', etag)])
+        return []
+
+    start_response(status, [('Content-Type', 'application/json'), ('ETag', etag)])
+    return [data]
+
+
+def error_response(environ, start_response, status, message):
+    data = json.dumps({'error': message}).encode('utf-8')
+    start_response(status, [('Content-Type', 'application/json')])
+    return [data]
+
+
+def query(environ):
+    """
+    The query string as a dictionary of the first value given for each name.
+    """
+    return {name: values[0] for name, values in parse_qs(environ.get('QUERY_STRING', '')).items()}
+
+
+def listing_options(params):
+    """
+    The cursor, count and fields asked for. Raises ValueError for a bad one.
+    """
+    count = int(params.get('count', DEFAULT_COUNT))
+
+    if not 0 < count <= MAX_COUNT:
+        raise ValueError("count must be between 1 and %s" % (MAX_COUNT,))
+
+    cursor = params.get('cursor') or None
+
+    if 'fields' in params:
+        fields = tuple(x for x in params['fields'].split(",") if x)
+
+        unknown = set(fields) - set(LINK_FIELDS)
+        if unknown or not fields:
+            raise ValueError("fields must be from %s" % (", ".join(LINK_FIELDS),))
+    else:
+        fields = LINK_FIELDS
+
+    return cursor, count, fields
+
+
+def links(environ, start_response, tags=()):
+    params = query(environ)
+    link_manager = environ['linkapp.link_manager']
+    memo = environ.get('linkapp.link_memo')
+
+    try:
+        cursor, count, fields = listing_options(params)
+
+        if 'ids' in params and not tags:
+            raw_ids = [x for x in params['ids'].split(",") if x]
+
+            if len(raw_ids) > MAX_IDS:
+                raise ValueError("at most %s ids at a time" % (MAX_IDS,))
+
+            found = link_manager.list_many(raw_ids, fields=fields, memo=memo, as_dicts=True)
+            return json_response(environ, start_response, {'links': found})
+
+        found, next_cursor = link_manager.page(
+            *tags, cursor=cursor, count=count, fields=fields, memo=memo, as_dicts=True)
+
+    except ValueError as e:
+        return error_response(environ, start_response, '400 Bad Request', str(e))
+
+    return json_response(environ, start_response, {'links': found, 'next': next_cursor})
+
+
+def one_link(environ, start_response, raw_id):
+    params = query(environ)
+
+    try:
+        cursor, count, fields = listing_options(params)
+    except ValueError as e:
+        return error_response(environ, start_response, '400 Bad Request', str(e))
+
+    link = environ['linkapp.link_manager'].list_many(
+        [raw_id], fields=fields, memo=environ.get('linkapp.link_memo'), as_dicts=True)[0]
+
+    if link is None:
+        return error_response(environ, start_response, '404 Not Found', "no such link")
+
+    return json_response(environ, start_response, {'link': link})
+
+
+def counts(environ, start_response):
+    params = query(environ)
+    tags = [x for x in params.get('tags', '').split(",") if x]
+
+    return json_response(environ, start_response, {
+        'links': environ['linkapp.link_manager'].count(*tags)
+    })
+
+
+def not_found(environ, start_response, path):
+    """
+    Any other path under api/v1/, so those 404s are JSON too.
+    """
+    return error_response(environ, start_response, '404 Not Found', "no such endpoint")
+
+
+def reading_list(environ, start_response):
+    """
+    The logged in user's reading list, needs AuthenticationMiddleware around 
+    it for the session.
+    """
+    params = query(environ)
+    user = environ['beaker.session']['username']
+    read = params.get('read') in ('1', 'true')
+    rl_manager = environ['linkapp.rl_manager']
+
+    try:
+        cursor, count, fields = listing_options(params)
+
+        found, next_cursor = rl_manager.page(
+            user, cursor=cursor, count=count, read=read, fields=fields,
+            memo=environ.get('linkapp.link_memo'), as_dicts=True)
+
+    except ValueError as e:
+        return error_response(environ, start_response, '400 Bad Request', str(e))
+
+    return json_response(environ, start_response, {
+        'links': found,
+        'next': next_cursor,
+        'count': rl_manager.count(user, read=read),
+    })
@@ -0,0 +1,536 @@
+"""
+ASGI version of the app, for running under an asyncio server, e.g.
+
+    $ uvicorn asynclinkapp:app
+
+It serves the same pages at the same paths as wsgilinkapp, rendered with the
+same templates. The pages people read
+most (the listings, a single link and the reading list) are served natively:
+Redis is used through redis.asyncio, so while one request waits on Redis the
+worker gets on with others. Checking passwords (pbkdf2, slow on purpose) is
+done in a thread pool so it doesn't hold up the event loop, or in a
+hashing.HashPool if you give it one.
+
+Everything else (the forms, saving, static files, the JSON and batch APIs) is
+handed to the WSGI app, run in the same thread pool. Those pages write to the
+database or are rarely used, the async managers only do the reading.
+"""
+
+import asyncio
+import base64
+import binascii
+import io
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import redis.asyncio
+from passlib.hash import pbkdf2_sha256
+
+import forms
+import wsgilinkapp
+from edit import (HYDRATE_CHUNK_SIZE, LINK_FIELDS, parse_hydrate, plan_hydrate,
+                  queue_hydrate)
+from hashing import PoolBusy, verify_password
+from wsgilinkapp import renderer
+
+
+async def hydrate_links(connection, raw_ids, fields=None, memo=None,
+                        chunk_size=HYDRATE_CHUNK_SIZE, as_dicts=False):
+    """
+    asyncio version of edit.hydrate_links, see there.
+    """
+    if fields is not None:
+        fields = tuple(fields)
+
+    if memo is None:
+        memo = {}
+
+    memo_keys, chunks_to_fetch = plan_hydrate(raw_ids, fields, memo, chunk_size, as_dicts)
+
+    for chunk in chunks_to_fetch:
+        async with connection.pipeline(transaction=False) as pipe:
+            queue_hydrate(pipe, chunk, fields)
+            result = await pipe.execute()
+
+        memo.update(zip(chunk, parse_hydrate(result, fields, as_dicts)))
+
+    return [memo[x] for x in memo_keys]
+
+
+def async_connection(host, port, db):
+    return redis.asyncio.StrictRedis(
+        decode_responses=True,
+        host=host,
+        port=port,
+        db=db)
+
+
+class AsyncLinkManager:
+    """
+    The reading half of edit.LinkManager, for asyncio.
+    """
+    def __init__(self, host="localhost", port=6379, db=0):
+        self.connection = async_connection(host, port, db)
+
+    def prefix_key(self, raw_id):
+        """Put the prefix on the key"""
+        return "link:%s" % (raw_id,)
+
+    async def _tag_intersect(self, tags, command, start=0, stop=-1):
+        """
+        See LinkManager._tag_intersect.
+        """
+        async with self.connection.pipeline() as pipe:
+            tag_keys = ['tag:%s' % (x,) for x in tags]
+            stored_at = "tag:%s:sorted" % ("|".join(tags))
+            pipe.zinterstore(stored_at, tag_keys, "MAX")
+
+            if command == 'count':
+                pipe.zcard(stored_at)
+            else:
+                pipe.zrevrange(stored_at, start, stop)
+
+            pipe.delete(stored_at)
+            result = await pipe.execute()
+
+            return result[1]
+
+    async def count(self, *tags):
+        """
+        See LinkManager.count.
+        """
+        if len(tags) > 1:
+            return await self._tag_intersect(tags, 'count')
+        elif len(tags) == 1:
+            return await self.connection.zcard('tag:%s' % (tags[0],))
+        else:
+            return await self.connection.zcard("sorted:date")
+
+    async def listing(self, *tags, start=0, stop=-1, fields=None, memo=None):
+        """
+        See LinkManager.listing.
+        """
+        if len(tags) > 1:
+            raw_ids = await self._tag_intersect(tags, 'keys', start=start, stop=stop)
+        elif len(tags) == 1:
+            raw_ids = await self.connection.zrevrange('tag:%s' % (tags[0],), start, stop)
+        else:
+            raw_ids = await self.connection.zrevrange("sorted:date", start, stop)
+
+        links = await hydrate_links(self.connection, raw_ids, fields=fields, memo=memo)
+
+        if fields is not None:
+            links = [x for x in links if x is not None]
+
+        return links
+
+    async def list_one(self, raw_id, fields=None, memo=None):
+        """
+        See LinkManager.list_one.
+        """
+        return await hydrate_links(self.connection, [raw_id], fields=fields, memo=memo)
+
+
+class AsyncReadingListManager:
+    """
+    The reading half of edit.ReadingListManager, for asyncio.
+    """
+    def __init__(self, host="localhost", port=6379, db=0):
+        self.connection = async_connection(host, port, db)
+
+    def key(self, user):
+        return "unread:{}".format(user)
+
+    async def count(self, user):
+        return await self.connection.zcard(self.key(user))
+
+    async def to_read(self, user, start=0, stop=-1, fields=None, memo=None):
+        """
+        See ReadingListManager.to_read.
+        """
+        raw_ids = await self.connection.zrevrange(self.key(user), start, stop)
+
+        links = await hydrate_links(self.connection, raw_ids, fields=fields, memo=memo)
+
+        if fields is not None:
+            links = [x for x in links if x is not None]
+
+        return links
+
+
+class AsyncUserManager:
+    """
+    user.UserManager.authenticate for asyncio, the password is checked in
+    hash_pool (a hashing.HashPool) if there is one, otherwise in executor (a 
+    thread pool).
+    """
+    def __init__(self, host="localhost", port=6379, db=0, executor=None, hash_pool=None):
+        self.connection = async_connection(host, port, db)
+        self.executor = executor
+        self.hash_pool = hash_pool
+
+    def prefix_key(self, username):
+        return "user:%s" % (username,)
+
+    async def authenticate(self, username, password):
+        user = await self.connection.hgetall(self.prefix_key(username))
+
+        if not user:
+            return False
+
+        if self.hash_pool is not None:
+            return await self.hash_pool.submit(verify_password, password, user['password'])
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, pbkdf2_sha256.verify, password, user['password'])
+
+
+def html_response(name, context):
+    html = renderer.render_name(name, context)
+    return '200 OK', [('Content-Type', 'text/html')], html.encode('utf-8')
+
+
+def redirect(location):
+    return '302 Found', [('Location', location)], b''
+
+
+UNAUTHORIZED = (
+    '401 Unauthorized',
+    [('Content-Type', 'text/plain'), ('WWW-Authenticate', 'Basic realm="Test Thing"')],
+    b'Unauthorized')
+
+
+async def authenticated_user(environ):
+    """
+    The username if the request has good Basic auth credentials, or None.
+    Same check as wsgilinkapp.AuthenticationMiddleware.
+    """
+    if 'HTTP_AUTHORIZATION' not in environ:
+        return None
+
+    try:
+        auth_type, hashed_pass = environ['HTTP_AUTHORIZATION'].split(' ')
+        username, password = base64.b64decode(hashed_pass).decode('utf-8').split(':')
+    except (ValueError, binascii.Error):
+        return None
+
+    if await environ['linkapp.user_manager'].authenticate(username, password):
+        return username
+
+    return None
+
+
+async def listing(environ, page=1, tag=None):
+    """
+    wsgilinkapp.listing, and listing_by_tag when tag is given.
+    """
+    if page <= 0:
+        return redirect('http://%s%s' % (environ['HTTP_HOST'], environ['linkapp.path_prefix']))
+
+    per_page = 10
+    stop = page*per_page-1
+    start = page*per_page-per_page
+
+    tags = () if tag is None else (tag,)
+    link_manager = environ['linkapp.link_manager']
+
+    count, links = await asyncio.gather(
+        link_manager.count(*tags),
+        link_manager.listing(*tags, start=start, stop=stop, fields=LINK_FIELDS,
+                             memo=environ['linkapp.link_memo']))
+
+    last = int(math.ceil(count/per_page))
+
+    context = {
+        'links': links,
+        'count': count,
+        'last': last,
+        'prefix': environ['linkapp.path_prefix'],
+    }
+
+    if tag is not None:
+        context['tag'] = tag
+
+    if page > 1:
+        # making previous a string so mustache won't think its false.
+        context['previous'] = str(page-1)
+
+    if page != last:
+        context['next'] = str(page+1)
+
+    return html_response('list', context)
+
+
+async def listing_by_tag(environ, tag, page=1):
+    """
+    wsgilinkapp.listing_by_tag
+    """
+    return await listing(environ, page=page, tag=tag)
+
+
+async def one_post(environ, key):
+    """
+    wsgilinkapp.one_post
+    """
+    context = {
+        'one_post': await environ['linkapp.link_manager'].list_one(
+            key, fields=LINK_FIELDS, memo=environ['linkapp.link_memo']),
+        'prefix': environ['linkapp.path_prefix'],
+        'key': key
+    }
+
+    return html_response('one_post', context)
+
+
+async def my_reading_list(environ, page=1):
+    """
+    wsgilinkapp.my_reading_list, behind the same Basic auth.
+    """
+    try:
+        user = await authenticated_user(environ)
+    except PoolBusy as e:
+        return ('503 Service Unavailable',
+                [('Content-Type', 'text/plain'), ('Retry-After', str(e.retry_after))],
+                b'Service Unavailable, Try Again Shortly')
+
+    if user is None:
+        return UNAUTHORIZED
+
+    per_page = 20
+
+    if page <= 0:
+        return redirect('http://%s%sreading-list' % (environ['HTTP_HOST'], environ['linkapp.path_prefix']))
+
+    stop = page*per_page-1
+    start = page*per_page-per_page
+
+    rl_manager = environ['linkapp.rl_manager']
+
+    count, links = await asyncio.gather(
+        rl_manager.count(user),
+        rl_manager.to_read(user, start=start, stop=stop, fields=LINK_FIELDS,
+                           memo=environ['linkapp.link_memo']))
+
+    last = int(math.ceil(count/per_page))
+
+    context = {
+        "user": user,
+        'prefix': environ['linkapp.path_prefix'],
+        "links": links,
+        'count': count,
+        'last': last,
+    }
+
+    if page > 1:
+        context['previous'] = str(page-1)
+
+    if page < last:
+        context['next'] = str(page+1)
+
+    return html_response('reading-list', context)
+
+
+# the pages served natively, by the WSGI page the router has for them.
+NATIVE = {
+    wsgilinkapp.listing: listing,
+    wsgilinkapp.listing_by_tag: listing_by_tag,
+    wsgilinkapp.one_post: one_post,
+    wsgilinkapp.auth_my_reading_list: my_reading_list,
+}
+
+
+def route(router, environ):
+    """
+    (handler, params) for the pages served natively, None for the ones left
+    to the WSGI app. The router is wsgilinkapp.routes, so both apps take the
+    same paths and parameters, and the 404s and 405s come from the WSGI app.
+    """
+    found = router.match(environ['PATH_INFO'])
+
+    if found is None:
+        return None
+
+    matched, params = found
+    handler = NATIVE.get(matched.handlers.get(environ['REQUEST_METHOD']))
+
+    if handler is None:
+        return None
+
+    environ['linkapp.route'] = matched.name
+    return handler, params
+
+
+def file_wrapper(filelike, block_size=4096):
+    return iter(lambda: filelike.read(block_size), b'')
+
+
+class AsyncAppFactory:
+    """
+    Configure and return the ASGI app, takes the same settings as
+    wsgilinkapp.AppFactory plus the number of threads for password checks
+    and the pages run by the WSGI app. Request bodies over max_form_bytes
+    get a 413 before they're read, or as soon as they go over.
+    """
+
+    def __init__(self, redis_host='localhost', redis_port=6379, redis_db=0,
+                 path_prefix="/linkapp/", session_opts=None, threads=None,
+                 hash_pool=None, max_form_bytes=forms.MAX_FORM_BYTES):
+        if threads is None:
+            threads = min(32, (os.cpu_count() or 1) + 4)
+
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+        self.link_manager = AsyncLinkManager(redis_host, redis_port, redis_db)
+        self.rl = AsyncReadingListManager(redis_host, redis_port, redis_db)
+        self.um = AsyncUserManager(redis_host, redis_port, redis_db, self.executor, hash_pool)
+        self.path_prefix = path_prefix
+        self.max_form_bytes = max_form_bytes
+        self.router = wsgilinkapp.routes(path_prefix)
+
+        self.wsgi_app = wsgilinkapp.AppFactory(
+            redis_host, redis_port, redis_db, path_prefix, session_opts, hash_pool,
+            max_form_bytes=max_form_bytes)
+
+    def environ(self, scope, body):
+        """
+        A WSGI environ for the request, what both kinds of handler take.
+        """
+        server = scope.get('server') or ('localhost', 80)
+
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': '',
+            # WSGI paths are the bytes as latin-1, see PEP 3333.
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/%s' % (scope.get('http_version', '1.1'),),
+            'HTTP_HOST': "%s:%s" % (server[0], server[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': file_wrapper,
+        }
+
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+
+            if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+                environ[name] = value
+            else:
+                environ['HTTP_' + name] = value
+
+        environ['linkapp.link_manager'] = self.link_manager
+        environ['linkapp.rl_manager'] = self.rl
+        environ['linkapp.user_manager'] = self.um
+        environ['linkapp.path_prefix'] = self.path_prefix
+        environ['linkapp.link_memo'] = {}
+
+        return environ
+
+    def call_wsgi(self, environ):
+        """
+        Run the WSGI app (in a thread), returns (status, headers, body).
+        """
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = status
+            started['headers'] = headers
+
+        result = self.wsgi_app(environ, start_response)
+
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+        return started['status'], started['headers'], body
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] != 'http':
+            return
+
+        body = await self.read_body(scope, receive)
+
+        if body is None:
+            status, headers, body = ('413 Content Too Large', 
+                                     [('Content-Type', 'text/plain'), ('Connection', 'close')], 
+                                     b'Content Too Large')
+        else:
+            environ = self.environ(scope, body)
+            found = route(self.router, environ)
+
+            if found is not None:
+                handler, params = found
+                status, headers, body = await handler(environ, **params)
+            else:
+                loop = asyncio.get_running_loop()
+                status, headers, body = await loop.run_in_executor(
+                    self.executor, self.call_wsgi, environ)
+
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(" ", 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def read_body(self, scope, receive):
+        """
+        The request body, or None if it's over max_form_bytes: going by
+        Content-Length before anything is read, then by what actually comes
+        in, which stops being read once it's too much.
+        """
+        for name, value in scope.get('headers', []):
+            if name.lower() == b'content-length':
+                try:
+                    if int(value) > self.max_form_bytes:
+                        return None
+                except ValueError:
+                    pass
+
+        chunks = []
+        size = 0
+
+        while True:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+
+            if size > self.max_form_bytes:
+                return None
+
+            chunks.append(chunk)
+
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = AsyncAppFactory(path_prefix="/")
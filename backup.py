@@ -0,0 +1,499 @@
+"""
+Module for streaming backups of the database.
+
+A backup is a directory with one NDJSON file (one JSON object per line) per
+section, optionally compressed, plus a manifest:
+
+    links.ndjson            one link hash per line
+    users.ndjson            one user hash per line
+    reading_lists.ndjson    one {"user", "link", "state", "score"} per line,
+                            state is "unread" or "read"
+    manifest.json           counts and sha256 checksums of the files above
+
+Keys are found with SCAN and read in chunks through non-transactional
+pipelines, and every record is written out as soon as it is read, so memory
+use doesn't depend on the size of the database. The sections are written in
+parallel, one thread each.
+
+Every backup records in its manifest (changes_until) the id of the newest
+entry in the change log (see the changes module) when it started. An
+incremental backup goes through the change log from there and only writes out
+what was touched since: the links and users as they are now, the reading list
+entries as they are now, and a fourth section for what is gone:
+
+    deleted.ndjson          {"kind": "link"|"user", "id"} or 
+                            {"kind": "reading_list", "user", "id"}
+                            
+Its manifest has type "incremental" and changes_from, the changes_until of
+the backup it follows. A full backup and the incrementals after it, in order,
+restore the database (see the restore module).
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from changes import CHANGES_KEY, MAX_CHANGES
+from edit import chunks
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+SECTIONS = ('links', 'users', 'reading_lists')
+INCREMENTAL_SECTIONS = SECTIONS + ('deleted',)
+
+# compression name -> file extension
+COMPRESSION = {
+    'none': '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+# how many keys SCAN is asked for at a time, and how many records are read
+# in one pipeline.
+BATCH_SIZE = 1000
+
+
+class HashingFile:
+    """
+    Write-only file wrapper that keeps a sha256 of everything written to it.
+    """
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def close(self):
+        self.fileobj.close()
+
+
+class SectionWriter:
+    """
+    Writes records to one section file, counting them and checksumming the
+    bytes that end up on disk.
+    """
+    def __init__(self, directory, section, compression='gzip'):
+        if compression not in COMPRESSION:
+            raise ValueError("compression must be one of %s" % (", ".join(COMPRESSION),))
+
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+
+        self.filename = "%s.ndjson%s" % (section, COMPRESSION[compression])
+        self.count = 0
+
+        self.raw = HashingFile(open(os.path.join(directory, self.filename), 'wb'))
+
+        if compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode='wb')
+        elif compression == 'zstd':
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = None
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':')).encode('utf-8') + b"\n"
+
+        if self.stream is not None:
+            self.stream.write(line)
+        else:
+            self.raw.write(line)
+
+        self.count += 1
+
+    def close(self):
+        """
+        Finish the file, returns its entry for the manifest.
+        """
+        if self.stream is not None:
+            self.stream.close()
+
+        self.raw.close()
+
+        return {
+            'file': self.filename,
+            'count': self.count,
+            'sha256': self.raw.sha256.hexdigest()
+        }
+
+
+def open_section(path):
+    """
+    Open a section file for reading as text, whatever it was compressed with.
+    """
+    if path.endswith(COMPRESSION['gzip']):
+        return gzip.open(path, 'rt', encoding='utf-8')
+
+    if path.endswith(COMPRESSION['zstd']):
+        if zstandard is None:
+            raise ValueError("reading %s needs the zstandard package" % (path,))
+
+        raw = open(path, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True), encoding='utf-8')
+
+    return open(path, 'r', encoding='utf-8')
+
+
+def file_sha256(path, block_size=1024*1024):
+    """
+    sha256 hex digest of a file on disk.
+    """
+    sha256 = hashlib.sha256()
+
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(block_size), b''):
+            sha256.update(block)
+
+    return sha256.hexdigest()
+
+
+def read_manifest(directory):
+    """
+    Load a backup's manifest.
+    """
+    with open(os.path.join(directory, MANIFEST), 'r') as source:
+        return json.load(source)
+
+
+def verify(directory, manifest=None):
+    """
+    Check every section file against the checksum in the manifest.
+
+    Returns a list of the sections that don't match (empty if all is well).
+    """
+    if manifest is None:
+        manifest = read_manifest(directory)
+
+    bad = []
+
+    for section, entry in manifest['sections'].items():
+        if file_sha256(os.path.join(directory, entry['file'])) != entry['sha256']:
+            bad.append(section)
+
+    return bad
+
+
+def read_lines(directory, section, manifest=None):
+    """
+    Iterate over the lines of one section of a backup, each one record's
+    JSON, without decoding them (see restore.restore_partition).
+    """
+    if manifest is None:
+        manifest = read_manifest(directory)
+
+    entry = manifest['sections'].get(section)
+
+    if entry is None:
+        return
+
+    with open_section(os.path.join(directory, entry['file'])) as source:
+        for line in source:
+            if line.strip():
+                yield line
+
+
+def read_section(directory, section, manifest=None):
+    """
+    Iterate over the records in one section of a backup.
+    """
+    for line in read_lines(directory, section, manifest):
+        yield json.loads(line)
+
+
+def _hashes(connection, pattern, batch_size):
+    """
+    Every non-empty hash whose key matches pattern, read batch_size at a time.
+    """
+    keys = connection.scan_iter(pattern, count=batch_size)
+
+    for batch in chunks(keys, batch_size):
+        with connection.pipeline(transaction=False) as pipe:
+            for key in batch:
+                pipe.hgetall(key)
+
+            for record in pipe.execute():
+                if record:
+                    yield record
+
+
+def iter_links(link_manager, batch_size=BATCH_SIZE):
+    """
+    Every link hash in the database.
+    """
+    return _hashes(link_manager.connection, link_manager.prefix_key("*"), batch_size)
+
+
+def iter_users(user_manager, batch_size=BATCH_SIZE):
+    """
+    Every user hash in the database.
+    """
+    return _hashes(user_manager.connection, user_manager.prefix_key("*"), batch_size)
+
+
+def iter_reading_lists(rl_manager, batch_size=BATCH_SIZE):
+    """
+    Every entry on every reading list, unread and read.
+    """
+    connection = rl_manager.connection
+
+    for state, prefix in (('unread', rl_manager.key("")), ('read', rl_manager.key_read(""))):
+        for key in connection.scan_iter(prefix + "*", count=batch_size):
+            user = key[len(prefix):]
+
+            for link_id, score in connection.zscan_iter(key, count=batch_size):
+                yield {'user': user, 'link': link_id, 'state': state, 'score': score}
+
+
+def write_section(directory, section, records, compression):
+    """
+    Write every record from an iterable into a section file, returns the
+    manifest entry.
+    """
+    writer = SectionWriter(directory, section, compression)
+
+    try:
+        for record in records:
+            writer.write(record)
+    finally:
+        entry = writer.close()
+
+    return entry
+
+
+def backup(directory, link_manager, user_manager, rl_manager,
+           compression='gzip', batch_size=BATCH_SIZE):
+    """
+    Write a full backup of links, users and reading lists into directory.
+
+    Returns the manifest, which is also written to the directory last - a
+    backup without a manifest didn't finish.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    sources = {
+        'links': iter_links(link_manager, batch_size),
+        'users': iter_users(user_manager, batch_size),
+        'reading_lists': iter_reading_lists(rl_manager, batch_size),
+    }
+
+    started = datetime.now()
+    
+    # anything changed after this may or may not be in the backup, the next
+    # incremental picks it up either way.
+    changes_until = last_change(link_manager.connection)
+
+    with ThreadPoolExecutor(max_workers=len(SECTIONS)) as executor:
+        futures = {
+            section: executor.submit(write_section, directory, section, sources[section], compression)
+            for section in SECTIONS
+        }
+
+        sections = {section: future.result() for section, future in futures.items()}
+
+    manifest = {
+        'format': FORMAT_VERSION,
+        'type': 'full',
+        'started': started.isoformat(),
+        'finished': datetime.now().isoformat(),
+        'changes_until': changes_until,
+        'compression': compression,
+        'sections': sections,
+    }
+
+    write_manifest(directory, manifest)
+
+    return manifest
+
+
+def write_manifest(directory, manifest):
+    with open(os.path.join(directory, MANIFEST), 'w') as target:
+        json.dump(manifest, target, indent=2)
+
+
+def last_change(connection):
+    """
+    The id of the newest entry in the change log, "0-0" if it's empty.
+    """
+    entries = connection.xrevrange(CHANGES_KEY, count=1)
+
+    if entries:
+        return entries[0][0]
+
+    return "0-0"
+
+
+def check_changes_kept(connection, since):
+    """
+    Raise a ValueError if the change log may no longer have every change made
+    after since, because it was trimmed.
+    """
+    if since == "0-0":
+        # nothing to look for, it was trimmed if it ever filled up.
+        trimmed = connection.xlen(CHANGES_KEY) >= MAX_CHANGES
+    else:
+        # nothing but trimming removes entries, so if the last one we saw is
+        # still there everything after it is too.
+        trimmed = not connection.xrange(CHANGES_KEY, min=since, max=since)
+
+    if trimmed:
+        raise ValueError(
+            "the change log no longer goes back to %s, make a full backup" % (since,))
+
+
+def changes_between(connection, after, until, batch_size=BATCH_SIZE):
+    """
+    The (id, entry) pairs in the change log after the id after, up to and 
+    including until, read batch_size at a time.
+    """
+    last = after
+
+    while True:
+        entries = connection.xrange(CHANGES_KEY, min=last, max=until, count=batch_size + 1)
+        entries = [x for x in entries if x[0] != last]
+
+        if not entries:
+            return
+
+        yield from entries
+
+        last = entries[-1][0]
+
+
+def touched_since(connection, since, until, batch_size=BATCH_SIZE):
+    """
+    What the change log says was changed after since: a set of link ids, a
+    set of usernames and a set of (user, link id) reading list entries.
+    """
+    links = set()
+    users = set()
+    entries = set()
+
+    for change_id, change in changes_between(connection, since, until, batch_size):
+        kind = change.get('kind')
+
+        if kind == 'link':
+            links.add(change['id'])
+        elif kind == 'user':
+            users.add(change['id'])
+        elif kind == 'reading_list':
+            entries.add((change['user'], change['id']))
+
+    return links, users, entries
+
+
+def _current_hashes(connection, keys, batch_size, missing):
+    """
+    The hashes at the given keys, keys that are gone are added to missing.
+    """
+    for batch in chunks(keys, batch_size):
+        with connection.pipeline(transaction=False) as pipe:
+            for key in batch:
+                pipe.hgetall(key)
+
+            for key, record in zip(batch, pipe.execute()):
+                if record:
+                    yield record
+                else:
+                    missing.append(key)
+
+
+def _current_entries(rl_manager, entries, batch_size, missing):
+    """
+    The reading list entries as they are now, the ones that are on neither of
+    the user's lists anymore are added to missing.
+    """
+    for batch in chunks(entries, batch_size):
+        with rl_manager.connection.pipeline(transaction=False) as pipe:
+            for user, link_id in batch:
+                pipe.zscore(rl_manager.key(user), link_id)
+                pipe.zscore(rl_manager.key_read(user), link_id)
+
+            scores = pipe.execute()
+
+        for (user, link_id), unread, read in zip(batch, scores[0::2], scores[1::2]):
+            if unread is not None:
+                yield {'user': user, 'link': link_id, 'state': 'unread', 'score': unread}
+            elif read is not None:
+                yield {'user': user, 'link': link_id, 'state': 'read', 'score': read}
+            else:
+                missing.append((user, link_id))
+
+
+def incremental_backup(directory, since, link_manager, user_manager, rl_manager,
+                       compression='gzip', batch_size=BATCH_SIZE):
+    """
+    Write out what changed after since (the changes_until of the previous
+    backup in the chain) into directory.
+    
+    The time taken depends on how much changed, not on the size of the 
+    database. Raises a ValueError if the change log has been trimmed past 
+    since, there's no telling what changed then.
+
+    Returns the manifest, written last like backup's.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    connection = link_manager.connection
+    started = datetime.now()
+
+    check_changes_kept(connection, since)
+
+    changes_until = last_change(connection)
+    links, users, entries = touched_since(connection, since, changes_until, batch_size)
+
+    gone = {'links': [], 'users': [], 'reading_lists': []}
+
+    sources = {
+        'links': _current_hashes(
+            connection, [link_manager.prefix_key(x) for x in sorted(links)],
+            batch_size, gone['links']),
+        'users': _current_hashes(
+            connection, [user_manager.prefix_key(x) for x in sorted(users)],
+            batch_size, gone['users']),
+        'reading_lists': _current_entries(
+            rl_manager, sorted(entries), batch_size, gone['reading_lists']),
+    }
+
+    sections = {
+        section: write_section(directory, section, sources[section], compression)
+        for section in SECTIONS
+    }
+
+    deleted = [
+        {'kind': 'link', 'id': x[len(link_manager.prefix_key("")):]} for x in gone['links']
+    ] + [
+        {'kind': 'user', 'id': x[len(user_manager.prefix_key("")):]} for x in gone['users']
+    ] + [
+        {'kind': 'reading_list', 'user': user, 'id': link_id} for user, link_id in gone['reading_lists']
+    ]
+
+    sections['deleted'] = write_section(directory, 'deleted', deleted, compression)
+
+    manifest = {
+        'format': FORMAT_VERSION,
+        'type': 'incremental',
+        'started': started.isoformat(),
+        'finished': datetime.now().isoformat(),
+        'changes_from': since,
+        'changes_until': changes_until,
+        'compression': compression,
+        'sections': sections,
+    }
+
+    write_manifest(directory, manifest)
+
+    return manifest
@@ -1,18 +1,45 @@
 #!/usr/bin/env python
 """
-Script to backup the database as a JSON file.
+Script to backup the database.
 
-File contains single list of links stored as a dictionary.
+Writes links, users and reading lists as (compressed) NDJSON files plus a 
+manifest with counts and checksums into a directory, see the backup module.
+
+With --incremental-from only what changed since that backup is written.
 """
 
+import argparse
+import backup
 import edit
-import json
 import user
 
+parser = argparse.ArgumentParser(description="Backup the linkapp database.")
+parser.add_argument("directory", nargs="?", default="data_backup",
+                    help="where to write the backup (default: data_backup)")
+parser.add_argument("--compress", choices=sorted(backup.COMPRESSION), default="gzip")
+parser.add_argument("--batch-size", type=int, default=backup.BATCH_SIZE)
+parser.add_argument("--incremental-from", metavar="PREVIOUS", default=None,
+                    help="only back up what changed since the backup in PREVIOUS")
+args = parser.parse_args()
+
 lm = edit.LinkManager()
 um = user.UserManager()
+rl = edit.ReadingListManager()
 
-with open("data_backup.json", "w") as backup:
-    export = {"users":um.listing(), "links":lm.listing()}
-    json.dump(export, backup)
+if args.incremental_from:
+    since = backup.read_manifest(args.incremental_from).get('changes_until')
     
+    if since is None:
+        parser.error("%s was made before incremental backups, make a full backup" % (
+            args.incremental_from,))
+    
+    manifest = backup.incremental_backup(args.directory, since, lm, um, rl,
+                                         compression=args.compress,
+                                         batch_size=args.batch_size)
+else:
+    manifest = backup.backup(args.directory, lm, um, rl, 
+                             compression=args.compress, 
+                             batch_size=args.batch_size)
+
+for section, entry in sorted(manifest["sections"].items()):
+    print("%s: %s records in %s" % (section, entry["count"], entry["file"]))
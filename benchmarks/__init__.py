@@ -0,0 +1,9 @@
+"""
+Benchmarks for linkapp.
+
+These need a running redis server and use their own database (15 by default),
+which gets FLUSHED, so don't point them at real data (suite starts a redis
+server of its own). Run them as modules from the top of the repository, e.g.:
+
+    $ python -m benchmarks.listing_fields
+"""
@@ -0,0 +1,127 @@
+"""
+Synthetic data for the benchmarks: links with Zipf distributed tags (a few
+tags on most links, a long tail of rare ones, like real tagging) and users
+with reading lists.
+
+Everything comes from one random.Random(seed), so the same arguments give
+the same database every time, which is what makes results comparable
+between commits.
+"""
+
+import bisect
+import itertools
+import random
+from datetime import datetime, timedelta
+
+import edit
+import user
+
+# every benchmark user has this password
+PASSWORD = "bench"
+
+
+def zipf_weights(count, exponent):
+    """
+    Cumulative weights for ranks 1..count, rank k being 1/k**exponent as
+    likely as rank 1.
+    """
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class TagPicker:
+    """
+    Picks tags tag0, tag1, ... with tag0 the most popular.
+    """
+    def __init__(self, rng, count, exponent):
+        self.rng = rng
+        self.tags = ["tag%s" % (x,) for x in range(count)]
+        self.weights = zipf_weights(count, exponent)
+
+    def pick(self, number):
+        """
+        number different tags (fewer if there aren't that many).
+        """
+        number = min(number, len(self.tags))
+        picked = set()
+
+        while len(picked) < number:
+            spot = self.rng.random() * self.weights[-1]
+            picked.add(self.tags[bisect.bisect(self.weights, spot)])
+
+        return sorted(picked)
+
+
+def description(rng, size):
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+    text = []
+    length = 0
+
+    while length < size:
+        word = rng.choice(words)
+        text.append(word)
+        length += len(word) + 1
+
+    return " ".join(text)[:size]
+
+
+def generate_links(rng, count, tags, tags_per_link=3, desc_size=400):
+    """
+    count link dictionaries for LinkManager.add_many, one a minute going
+    back from now, each with 1 to tags_per_link tags.
+    """
+    now = datetime.now()
+
+    for number in range(count):
+        yield {
+            'page_title': "Benchmark link number %s" % (number,),
+            'desc_text': description(rng, desc_size),
+            'url_address': "http://www.example.com/articles/%s" % (number,),
+            'tags': tags.pick(rng.randint(1, tags_per_link)),
+            'created': now - timedelta(minutes=number),
+        }
+
+
+def seed(redis_settings, links=10000, tags=200, zipf=1.1, tags_per_link=3,
+         desc_size=400, users=100, reading_list=50, seed=0, batch_size=5000):
+    """
+    FLUSH the database at redis_settings, then fill it with links (written
+    with add_many) and users bench0, bench1, ... (password PASSWORD) with
+    reading_list links each.
+
+    Returns what the benchmarks need to know about it: some link ids, the
+    tags by popularity and the user names.
+    """
+    rng = random.Random(seed)
+
+    lm = edit.LinkManager(*redis_settings)
+    rl = edit.ReadingListManager(*redis_settings)
+    um = user.UserManager(*redis_settings)
+
+    lm.connection.flushdb()
+
+    picker = TagPicker(rng, tags, zipf)
+    link_ids = []
+    generated = generate_links(rng, links, picker, tags_per_link, desc_size)
+
+    while True:
+        batch = list(itertools.islice(generated, batch_size))
+        if not batch:
+            break
+
+        link_ids.extend(x['key'] for x in lm.add_many(batch, author="benchmark"))
+
+    # hashing is slow on purpose, one hash does for everybody
+    hashed = um.encrypt(PASSWORD)
+    usernames = ["bench%s" % (x,) for x in range(users)]
+
+    for username in usernames:
+        um.add(username, hashed, encrypted=True)
+
+        for link_id in rng.sample(link_ids, min(reading_list, len(link_ids))):
+            rl.add(username, link_id)
+
+    return {
+        'link_ids': link_ids[:1000],
+        'tags': picker.tags,
+        'users': usernames,
+    }
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Benchmark: reading the link form save gets, with forms.parse_form and with
+the cgi.FieldStorage it replaced, urlencoded and multipart, for a typical
+form and one with a long description. No redis needed.
+
+    $ python -m benchmarks.form_parsing
+
+cgi is gone in Python 3.13, there only parse_form is timed.
+"""
+
+import argparse
+import io
+import timeit
+import warnings
+from urllib.parse import urlencode
+
+import forms
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    try:
+        import cgi
+    except ImportError:
+        cgi = None
+
+FIELDS = ('page_title', 'desc_text', 'url_address', 'tags')
+
+BOUNDARY = "----formboundary7MA4YWxkTrZu0gW"
+
+
+def form(desc_size):
+    return {
+        'page_title': "Something as a Title",
+        'desc_text': ("Whole bunch of things. Talking about stuff. " * (desc_size // 44 + 1))[:desc_size],
+        'url_address': "http://www.sillygooses.com/some/path?with=query",
+        'tags': "python|redis|wsgi|benchmarks",
+    }
+
+
+def urlencoded(values):
+    return forms.URLENCODED, urlencode(values).encode('ascii')
+
+
+def multipart(values):
+    body = b''
+
+    for name, value in values.items():
+        body += ('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % (BOUNDARY, name, value)).encode('utf-8')
+
+    body += ('--%s--\r\n' % (BOUNDARY,)).encode('ascii')
+
+    return 'multipart/form-data; boundary=%s' % (BOUNDARY,), body
+
+
+def environ(content_type, body):
+    return {
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+
+
+def with_parse_form(content_type, body):
+    return forms.parse_form(environ(content_type, body), FIELDS)
+
+
+def with_field_storage(content_type, body):
+    post = cgi.FieldStorage(fp=io.BytesIO(body), environ=environ(content_type, body), keep_blank_values=True)
+    return {name: post.getvalue(name) for name in FIELDS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5000)
+    args = parser.parse_args()
+
+    print("%-32s %14s %14s" % ("form", "parse_form us", "FieldStorage us"))
+
+    for desc_size in (200, 20000):
+        for encode in (urlencoded, multipart):
+            content_type, body = encode(form(desc_size))
+            label = "%s, %s byte desc" % (encode.__name__, desc_size)
+
+            assert with_parse_form(content_type, body) == form(desc_size)
+            ours = min(timeit.repeat(lambda: with_parse_form(content_type, body), number=args.rounds, repeat=3))
+
+            if cgi is not None:
+                assert with_field_storage(content_type, body) == form(desc_size)
+                theirs = min(timeit.repeat(lambda: with_field_storage(content_type, body), number=args.rounds, repeat=3))
+                theirs = "%14.1f" % (theirs / args.rounds * 1e6,)
+            else:
+                theirs = "%14s" % ("-",)
+
+            print("%-32s %14.1f %s" % (label, ours / args.rounds * 1e6, theirs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Fill a redis database with synthetic links and users for load testing, see
+dataset for what it looks like. The database gets FLUSHED first.
+
+    $ python -m benchmarks.generate --links 100000 --tags 2000 --zipf 1.2 \\
+          --users 500 --db 15 --summary data.json
+
+The links go in through LinkManager.add_many. --summary writes what the load
+driver needs to make up requests (some link ids, the tags by popularity, the
+user names and their password) to a JSON file.
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks import dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--links", type=int, default=10000)
+    parser.add_argument("--tags", type=int, default=200, help="how many different tags")
+    parser.add_argument("--zipf", type=float, default=1.1,
+                        help="tag popularity skew, higher is more skewed")
+    parser.add_argument("--tags-per-link", type=int, default=3, help="most tags on a link")
+    parser.add_argument("--desc-size", type=int, default=400, help="description length")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--reading-list", type=int, default=50, help="links on each reading list")
+    parser.add_argument("--batch-size", type=int, default=5000, help="links per add_many")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--summary", default="benchmark-data.json")
+    args = parser.parse_args()
+
+    started = time.time()
+
+    summary = dataset.seed(
+        (args.host, args.port, args.db),
+        links=args.links,
+        tags=args.tags,
+        zipf=args.zipf,
+        tags_per_link=args.tags_per_link,
+        desc_size=args.desc_size,
+        users=args.users,
+        reading_list=args.reading_list,
+        seed=args.seed,
+        batch_size=args.batch_size)
+
+    summary['links'] = args.links
+    summary['zipf'] = args.zipf
+    summary['password'] = dataset.PASSWORD
+
+    with open(args.summary, 'w') as target:
+        json.dump(summary, target)
+
+    print("%d links, %d tags, %d users in %.1fs, summary in %s" % (
+        args.links, args.tags, args.users, time.time() - started, args.summary))
+
+
+if __name__ == "__main__":
+    main()
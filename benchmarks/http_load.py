@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Benchmark: requests per second and latency of a running server, to compare
+the WSGI app on sync workers with the ASGI app.
+
+Start one of them with the same number of worker processes (so they use
+about the same memory, check with ps -o rss), e.g.
+
+    $ gunicorn --workers 4 --worker-class sync --bind :8000 wsgilinkapp:app
+    $ uvicorn --workers 4 --port 8000 asynclinkapp:app
+
+then load it with a mix of the listing and the (logged in) reading list:
+
+    $ python -m benchmarks.http_load --seed --users 50
+    $ python -m benchmarks.http_load --concurrency 64 --duration 30 \\
+          --path / --path /reading-list --auth bench:bench
+
+Each request is a new connection (sync workers don't keep connections open),
+--seed fills the benchmark database (which gets FLUSHED) with links and a
+user bench/bench first. Point the server at the same database, e.g. with
+AppFactory(redis_db=15).
+"""
+
+import argparse
+import asyncio
+import base64
+import time
+from urllib.parse import urlsplit
+
+import edit
+import user
+
+
+def seed(redis_settings, links):
+    lm = edit.LinkManager(*redis_settings)
+    rl = edit.ReadingListManager(*redis_settings)
+    um = user.UserManager(*redis_settings)
+
+    lm.connection.flushdb()
+
+    results = lm.add_many([
+        {'page_title': "Benchmark link %s" % (i,),
+         'desc_text': "lorem ipsum dolor sit amet " * 8,
+         'url_address': "http://www.example.com/load/%s" % (i,),
+         'tags': ["benchmark", "tag%s" % (i % 7,)]}
+        for i in range(links)
+    ], author="benchmark")
+
+    um.add("bench", "bench")
+
+    for result in results[:40]:
+        rl.add("bench", result['key'])
+
+
+async def one_request(host, port, request):
+    started = time.perf_counter()
+
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(request)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+
+    status = int(response.split(b" ", 2)[1]) if response else 0
+    return status, time.perf_counter() - started
+
+
+async def worker(host, port, requests, deadline, latencies, errors):
+    number = 0
+
+    while time.perf_counter() < deadline:
+        request = requests[number % len(requests)]
+        number += 1
+
+        try:
+            status, latency = await one_request(host, port, request)
+        except OSError:
+            errors.append(0)
+            continue
+
+        if status >= 400 or status == 0:
+            errors.append(status)
+        else:
+            latencies.append(latency)
+
+
+async def run(url, paths, auth, concurrency, duration):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+
+    headers = "Host: %s:%s\r\nConnection: close\r\n" % (host, port)
+
+    if auth:
+        headers += "Authorization: Basic %s\r\n" % (base64.b64encode(auth.encode()).decode(),)
+
+    requests = [("GET %s HTTP/1.1\r\n%s\r\n" % (x, headers)).encode() for x in paths]
+
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+
+    await asyncio.gather(*[
+        worker(host, port, requests, deadline, latencies, errors)
+        for x in range(concurrency)
+    ])
+
+    return latencies, errors
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", action="append", dest="paths")
+    parser.add_argument("--auth", default=None, help="user:password for Basic auth")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--seed", action="store_true", help="fill the database and stop")
+    parser.add_argument("--links", type=int, default=2000)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--db", type=int, default=15)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed((args.host, args.port, args.db), args.links)
+        print("seeded %d links" % (args.links,))
+        return
+
+    latencies, errors = asyncio.run(run(
+        args.url, args.paths or ["/"], args.auth, args.concurrency, args.duration))
+
+    latencies.sort()
+
+    print("requests: %d ok, %d failed in %.0fs" % (len(latencies), len(errors), args.duration))
+
+    if latencies:
+        print("rate:     %.1f requests/s" % (len(latencies) / args.duration,))
+        print("p50:      %.1fms" % (percentile(latencies, 0.50) * 1000,))
+        print("p99:      %.1fms" % (percentile(latencies, 0.99) * 1000,))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+Benchmark: what one listing page costs with HGETALL vs HMGET field projection.
+
+For each variant it reports the bytes sent to and received from redis, the
+memory allocated while building the page (peak) and what is still held by the
+page afterwards (live blocks/bytes), plus the time per page.
+
+    $ python -m benchmarks.listing_fields --links 2000 --per-page 10
+"""
+
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import edit
+
+
+def resp_size(value):
+    """
+    Number of bytes value takes up in the redis protocol (RESP).
+    """
+    if value is None:
+        return len(b"$-1\r\n")
+
+    if isinstance(value, dict):
+        value = [x for pair in value.items() for x in pair]
+
+    if isinstance(value, (list, tuple)):
+        return len(("*%d\r\n" % (len(value),)).encode()) + sum(resp_size(x) for x in value)
+
+    data = str(value).encode('utf-8')
+    return len(("$%d\r\n" % (len(data),)).encode()) + len(data) + 2
+
+
+def seed(lm, count, desc_size):
+    """
+    Fill the (empty) database with count links.
+    """
+    now = datetime.now()
+    description = ("lorem ipsum dolor sit amet " * (desc_size // 27 + 1))[:desc_size]
+
+    for i in range(count):
+        lm.add(
+            page_title="Benchmark link number %s" % (i,),
+            desc_text=description,
+            url_address="http://www.example.com/articles/%s" % (i,),
+            author="benchmark",
+            tags=["tag%s" % (i % 7,), "tag%s" % (i % 13,), "benchmark"],
+            created=now - timedelta(minutes=i))
+
+
+def hgetall_page(lm, start, stop):
+    """
+    What the listing page used to do: HGETALL everything, wrap each hash.
+    """
+    hashes = lm.listing(start=start, stop=stop)
+    return [edit.LinkRecord.from_hash(x) for x in hashes]
+
+
+def traffic(lm, start, stop, fields):
+    """
+    Bytes (sent, received) for one page, not counting the ZREVRANGE for ids.
+    """
+    raw_ids = lm.connection.zrevrange("sorted:date", start, stop)
+    keys = [lm.prefix_key(x) for x in raw_ids]
+
+    sent = received = 0
+
+    for key in keys:
+        if fields is None:
+            sent += resp_size(["HGETALL", key])
+            received += resp_size(lm.connection.hgetall(key))
+        else:
+            sent += resp_size(["HMGET", key] + list(fields))
+            received += resp_size(lm.connection.hmget(key, fields))
+
+    return sent, received
+
+
+def measure(func, rounds):
+    """
+    Returns (seconds per call, peak bytes allocated, live blocks, live bytes).
+    """
+    func()
+
+    started = time.perf_counter()
+    for x in range(rounds):
+        func()
+    elapsed = (time.perf_counter() - started) / rounds
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+
+    page = func()
+
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    live_blocks = sum(x.count_diff for x in stats)
+    live_bytes = sum(x.size_diff for x in stats)
+
+    del page
+
+    return elapsed, peak, live_blocks, live_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--links", type=int, default=2000)
+    parser.add_argument("--per-page", type=int, default=10)
+    parser.add_argument("--desc-size", type=int, default=400)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    lm = edit.LinkManager(args.host, args.port, args.db)
+    lm.connection.flushdb()
+    seed(lm, args.links, args.desc_size)
+
+    start, stop = 0, args.per_page - 1
+
+    variants = [
+        ("HGETALL", None, lambda: hgetall_page(lm, start, stop)),
+        ("HMGET all fields", edit.LINK_FIELDS,
+            lambda: lm.listing(start=start, stop=stop, fields=edit.LINK_FIELDS)),
+        ("HMGET key/title/url", ('key', 'page_title', 'url_address'),
+            lambda: lm.listing(start=start, stop=stop, fields=('key', 'page_title', 'url_address'))),
+    ]
+
+    print("%d links, %d per page, %d byte descriptions\n" % (args.links, args.per_page, args.desc_size))
+    print("%-22s %9s %9s %10s %10s %10s %10s" % (
+        "variant", "sent", "received", "ms/page", "peak", "live blks", "live bytes"))
+
+    for label, fields, func in variants:
+        sent, received = traffic(lm, start, stop, fields)
+        elapsed, peak, live_blocks, live_bytes = measure(func, args.rounds)
+
+        print("%-22s %9d %9d %10.3f %10d %10d %10d" % (
+            label, sent, received, elapsed * 1000, peak, live_blocks, live_bytes))
+
+    lm.connection.flushdb()
+
+
+if __name__ == "__main__":
+    main()
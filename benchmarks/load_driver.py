@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+"""
+Load driver: replay a weighted mix of requests (a scenario file) against a
+running app from several processes, and report throughput and latency
+histograms for each kind of request.
+
+    $ python -m benchmarks.generate --db 15 --summary data.json
+    $ gunicorn --workers 4 --bind :8000 'wsgilinkapp:AppFactory(redis_db=15, path_prefix="/")'
+    $ python -m benchmarks.load_driver --scenario benchmarks/scenarios/mixed.json \\
+          --data data.json --processes 4 --concurrency 16 --duration 60
+
+A scenario is a JSON file with a list of requests, each with a name, a
+weight and a path (see scenarios/mixed.json). Optional are method (GET),
+auth (log in as one of the generated users) and form (POSTed urlencoded).
+Paths and form values can have placeholders, filled in for every request
+from the --data summary that generate wrote:
+
+    {page}      a listing page number
+    {tag}       a tag, popular ones more often (same skew as the data)
+    {link_id}   a link id
+    {user}      a user name
+    {n}         a number nobody else used in this run, for new urls
+
+Each process runs --concurrency threads, each sending one request at a time
+on a new connection, like a browser talking to sync workers. The latencies
+go in histograms (buckets 5% apart) so it doesn't matter how long it runs.
+--output writes everything as JSON.
+"""
+
+import argparse
+import base64
+import bisect
+import http.client
+import itertools
+import json
+import math
+import multiprocessing
+import random
+import re
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks.dataset import zipf_weights
+
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+class Histogram:
+    """
+    Latency histogram with buckets GROWTH apart, from SMALLEST seconds up.
+    """
+    SMALLEST = 0.0001
+    GROWTH = 1.05
+    BUCKETS = 300
+
+    def __init__(self, counts=None):
+        self.counts = counts or [0] * (self.BUCKETS + 1)
+
+    def bucket(self, seconds):
+        if seconds <= self.SMALLEST:
+            return 0
+
+        return min(self.BUCKETS, int(math.log(seconds / self.SMALLEST, self.GROWTH)) + 1)
+
+    def upper_bound(self, bucket):
+        return self.SMALLEST * self.GROWTH ** bucket
+
+    def record(self, seconds):
+        self.counts[self.bucket(seconds)] += 1
+
+    def merge(self, other):
+        self.counts = [x + y for x, y in zip(self.counts, other.counts)]
+
+    @property
+    def total(self):
+        return sum(self.counts)
+
+    def percentile(self, fraction):
+        """
+        The latency fraction of requests were under (to within a bucket).
+        """
+        wanted = fraction * self.total
+        seen = 0
+
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted and count:
+                return self.upper_bound(bucket)
+
+        return 0.0
+
+    def lines(self, width=40):
+        """
+        The histogram as text, buckets merged to about 10 rows.
+        """
+        used = [x for x, count in enumerate(self.counts) if count]
+        if not used:
+            return []
+
+        step = max(1, math.ceil((used[-1] - used[0] + 1) / 10))
+        rows = []
+
+        for first in range(used[0], used[-1] + 1, step):
+            count = sum(self.counts[first:first + step])
+            rows.append((self.upper_bound(min(first + step - 1, self.BUCKETS)), count))
+
+        most = max(x[1] for x in rows)
+        return ["  <%9.2fms %8d %s" % (bound * 1000, count, "#" * math.ceil(count / most * width))
+                for bound, count in rows]
+
+
+class RequestMaker:
+    """
+    Fills in the scenario's requests from the data summary.
+    """
+    def __init__(self, scenario, data, rng, process):
+        self.entries = scenario['requests']
+        self.weights = list(itertools.accumulate(x['weight'] for x in self.entries))
+        self.data = data
+        self.rng = rng
+        self.process = process
+        self.numbers = itertools.count()
+        self.tag_weights = zipf_weights(len(data['tags']), data.get('zipf', 1.1))
+        self.pages = max(1, data.get('links', len(data['link_ids'])) // 10)
+
+        self.values = {
+            'page': lambda: str(self.rng.randint(1, self.pages)),
+            'tag': self.tag,
+            'link_id': lambda: self.rng.choice(self.data['link_ids']),
+            'user': lambda: self.rng.choice(self.data['users']),
+            'n': lambda: "%s-%s" % (self.process, next(self.numbers)),
+        }
+
+    def tag(self):
+        spot = self.rng.random() * self.tag_weights[-1]
+        return self.data['tags'][bisect.bisect(self.tag_weights, spot)]
+
+    def fill(self, template):
+        return PLACEHOLDER.sub(lambda match: self.values[match.group(1)](), template)
+
+    def make(self):
+        """
+        Returns (name, method, path, headers, body) for a request.
+        """
+        spot = self.rng.random() * self.weights[-1]
+        entry = self.entries[bisect.bisect(self.weights, spot)]
+
+        headers = {}
+        body = None
+
+        if entry.get('auth'):
+            credentials = "%s:%s" % (self.rng.choice(self.data['users']), self.data['password'])
+            headers['Authorization'] = "Basic %s" % (base64.b64encode(credentials.encode()).decode(),)
+
+        if 'form' in entry:
+            body = urlencode({x: self.fill(y) for x, y in entry['form'].items()})
+            headers['Content-Type'] = "application/x-www-form-urlencoded"
+
+        return entry['name'], entry.get('method', 'GET'), self.fill(entry['path']), headers, body
+
+
+def client(host, port, maker, lock, deadline, histograms, statuses):
+    while time.perf_counter() < deadline:
+        with lock:
+            name, method, path, headers, body = maker.make()
+
+        started = time.perf_counter()
+
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            status = 0
+
+        elapsed = time.perf_counter() - started
+
+        with lock:
+            statuses[name][status] = statuses[name].get(status, 0) + 1
+
+            if 0 < status < 400:
+                histograms[name].record(elapsed)
+
+
+def process_main(number, url, scenario, data, concurrency, duration, seed, results):
+    parts = urlsplit(url)
+    rng = random.Random("%s-%s" % (seed, number))
+    maker = RequestMaker(scenario, data, rng, number)
+    lock = threading.Lock()
+
+    names = [x['name'] for x in scenario['requests']]
+    histograms = {x: Histogram() for x in names}
+    statuses = {x: {} for x in names}
+
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client, args=(
+            parts.hostname, parts.port or 80, maker, lock, deadline, histograms, statuses))
+        for x in range(concurrency)
+    ]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results.put({name: (histograms[name].counts, statuses[name]) for name in names})
+
+
+def run(url, scenario, data, processes, concurrency, duration, seed):
+    """
+    Returns ({name: Histogram}, {name: {status: count}}) for the whole run.
+    """
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=process_main, args=(
+            number, url, scenario, data, concurrency, duration, seed, results))
+        for number in range(processes)
+    ]
+
+    for worker in workers:
+        worker.start()
+
+    histograms = {x['name']: Histogram() for x in scenario['requests']}
+    statuses = {x['name']: {} for x in scenario['requests']}
+
+    for worker in workers:
+        for name, (counts, codes) in results.get().items():
+            histograms[name].merge(Histogram(counts))
+            for status, count in codes.items():
+                statuses[name][status] = statuses[name].get(status, 0) + count
+
+    for worker in workers:
+        worker.join()
+
+    return histograms, statuses
+
+
+def report(histograms, statuses, duration):
+    everything = Histogram()
+    summary = {}
+
+    for name, histogram in histograms.items():
+        everything.merge(histogram)
+        failed = sum(count for status, count in statuses[name].items() if not 0 < status < 400)
+
+        summary[name] = {
+            'ok': histogram.total,
+            'failed': failed,
+            'statuses': {str(x): y for x, y in statuses[name].items()},
+            'requests_per_sec': histogram.total / duration,
+            'p50_ms': histogram.percentile(0.50) * 1000,
+            'p90_ms': histogram.percentile(0.90) * 1000,
+            'p99_ms': histogram.percentile(0.99) * 1000,
+            'histogram': histogram.counts,
+        }
+
+        print("%s: %d ok, %d failed, %.1f/s, p50 %.1fms, p90 %.1fms, p99 %.1fms" % (
+            name, histogram.total, failed, summary[name]['requests_per_sec'],
+            summary[name]['p50_ms'], summary[name]['p90_ms'], summary[name]['p99_ms']))
+
+        for line in histogram.lines():
+            print(line)
+
+    print("\nall: %d ok, %.1f requests/s, p50 %.1fms, p99 %.1fms" % (
+        everything.total, everything.total / duration,
+        everything.percentile(0.50) * 1000, everything.percentile(0.99) * 1000))
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--scenario", default="benchmarks/scenarios/mixed.json")
+    parser.add_argument("--data", default="benchmark-data.json", help="summary from generate")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--concurrency", type=int, default=8, help="threads per process")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the results here (JSON)")
+    args = parser.parse_args()
+
+    with open(args.scenario) as source:
+        scenario = json.load(source)
+
+    with open(args.data) as source:
+        data = json.load(source)
+
+    histograms, statuses = run(
+        args.url, scenario, data, args.processes, args.concurrency, args.duration, args.seed)
+
+    summary = report(histograms, statuses, args.duration)
+
+    if args.output:
+        with open(args.output, 'w') as target:
+            json.dump({
+                'url': args.url,
+                'scenario': scenario,
+                'processes': args.processes,
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'histogram_buckets': [Histogram().upper_bound(x) for x in range(Histogram.BUCKETS + 1)],
+                'results': summary,
+            }, target, indent=2)
+
+
+if __name__ == "__main__":
+    main()
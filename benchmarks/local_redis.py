@@ -0,0 +1,85 @@
+"""
+Start a throwaway redis-server for a benchmark run.
+
+    >>> with LocalRedis() as server:
+    ...     lm = edit.LinkManager(*server.settings)
+
+It listens on a free port on localhost with persistence turned off and its
+working directory in a temporary directory, which is removed (with the
+server) when the with block ends.
+"""
+
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+import redis
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalRedis:
+
+    def __init__(self, executable="redis-server", port=None, db=0, timeout=10):
+        self.executable = executable
+        self.port = port or free_port()
+        self.db = db
+        self.timeout = timeout
+        self.process = None
+        self.directory = None
+
+    @property
+    def settings(self):
+        """(host, port, db), what the managers take."""
+        return ("127.0.0.1", self.port, self.db)
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp(prefix="linkapp-bench-")
+
+        try:
+            self.process = subprocess.Popen(
+                [self.executable,
+                 "--port", str(self.port),
+                 "--bind", "127.0.0.1",
+                 "--dir", self.directory,
+                 "--save", "",
+                 "--appendonly", "no"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL)
+        except OSError as e:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            raise RuntimeError("can't start %s: %s" % (self.executable, e))
+
+        self.wait_until_up()
+        return self
+
+    def wait_until_up(self):
+        client = redis.StrictRedis(host="127.0.0.1", port=self.port)
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            try:
+                client.ping()
+                return
+            except redis.ConnectionError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.__exit__(None, None, None)
+                    raise RuntimeError("redis-server didn't start on port %s" % (self.port,))
+
+                time.sleep(0.05)
+
+    def __exit__(self, *exc_info):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Benchmark: memory allocated and time taken to create a pipeline.
+
+Compares redis-py's own pipeline() with the old monkeypatch from edit.py, which
+copied the client's whole response_callbacks dictionary for every pipeline so
+a response callback could be overridden per pipeline. No redis server is
+needed, creating a pipeline doesn't connect.
+
+    $ python -m benchmarks.pipeline_alloc
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import redis
+
+
+def copying_pipeline(client, transaction=True, shard_hint=None):
+    """
+    What edit.pipeline_monkeypatch used to do.
+    """
+    return redis.client.Pipeline(
+        client.connection_pool,
+        client.response_callbacks.copy(),
+        transaction,
+        shard_hint)
+
+
+def measure(make, rounds):
+    """
+    Returns (bytes allocated per pipeline, microseconds per pipeline).
+    """
+    make().reset()
+
+    tracemalloc.start()
+    pipes = [make() for x in range(rounds)]
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    for pipe in pipes:
+        pipe.reset()
+    del pipes
+
+    started = time.perf_counter()
+    for x in range(rounds):
+        make().reset()
+    elapsed = time.perf_counter() - started
+
+    return allocated / rounds, elapsed / rounds * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=10000)
+    args = parser.parse_args()
+
+    client = redis.StrictRedis(decode_responses=True)
+
+    variants = [
+        ("pipeline()", lambda: client.pipeline()),
+        ("pipeline(transaction=False)", lambda: client.pipeline(transaction=False)),
+        ("copied callbacks (old)", lambda: copying_pipeline(client)),
+    ]
+
+    print("%d response callbacks on the client\n" % (len(client.response_callbacks),))
+    print("%-30s %14s %10s" % ("variant", "bytes/pipeline", "us/pipeline"))
+
+    for label, make in variants:
+        allocated, elapsed = measure(make, args.rounds)
+        print("%-30s %14.0f %10.2f" % (label, allocated, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Benchmark: restore throughput for a large backup (1M links by default).
+
+Writes a synthetic backup, then times restore.restore loading it into an
+empty database, split into the load phase and the index rebuild.
+
+    $ python -m benchmarks.restore_throughput --links 1000000 --workers 4
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import backup
+import edit
+import restore
+
+
+def write_backup(directory, count, desc_size):
+    """
+    A backup with count links and nothing else.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    description = ("lorem ipsum dolor sit amet " * (desc_size // 27 + 1))[:desc_size]
+    now = datetime.now()
+
+    def links():
+        for i in range(count):
+            created = now - timedelta(minutes=i)
+            yield {
+                'page_title': "Benchmark link number %s" % (i,),
+                'desc_text': description,
+                'url_address': "http://www.example.com/articles/%s" % (i,),
+                'key': "bench%s" % (i,),
+                'author': "benchmark",
+                'created': created.strftime(edit.CREATED_TIME_FORMAT),
+                'tags': "benchmark|tag%s|tag%s" % (i % 13, i % 101),
+            }
+
+    entry = backup.write_section(directory, 'links', links(), 'gzip')
+
+    manifest = {
+        'format': backup.FORMAT_VERSION,
+        'type': 'full',
+        'compression': 'gzip',
+        'sections': {'links': entry},
+    }
+
+    with open(os.path.join(directory, backup.MANIFEST), 'w') as target:
+        json.dump(manifest, target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--links", type=int, default=1000000)
+    parser.add_argument("--desc-size", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=restore.BATCH_SIZE)
+    args = parser.parse_args()
+
+    redis_settings = (args.host, args.port, args.db)
+    lm = edit.LinkManager(*redis_settings)
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        write_backup(directory, args.links, args.desc_size)
+        print("wrote backup of %d links in %.1fs" % (args.links, time.perf_counter() - started))
+
+        lm.connection.flushdb()
+
+        # the load and index phases, timed separately.
+        original = edit.LinkManager.rebuild_indexes
+        timings = {}
+
+        def timed_rebuild(self, *args, **kwargs):
+            timings['load'] = time.perf_counter() - started
+            index_started = time.perf_counter()
+            result = original(self, *args, **kwargs)
+            timings['index'] = time.perf_counter() - index_started
+            return result
+
+        edit.LinkManager.rebuild_indexes = timed_rebuild
+
+        started = time.perf_counter()
+        restore.restore(directory, redis_settings, workers=args.workers,
+                        batch_size=args.batch_size, verify=False)
+        total = time.perf_counter() - started
+
+        edit.LinkManager.rebuild_indexes = original
+
+    print("workers: %d, batch size: %d" % (args.workers, args.batch_size))
+    print("load:    %7.1fs %10.0f links/s" % (timings['load'], args.links / timings['load']))
+    print("indexes: %7.1fs %10.0f links/s" % (timings['index'], args.links / timings['index']))
+    print("total:   %7.1fs %10.0f links/s" % (total, args.links / total))
+
+    lm.connection.flushdb()
+
+
+if __name__ == "__main__":
+    main()
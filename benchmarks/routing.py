@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Benchmark: what finding the page for a path costs, for a path to each route.
+Compares routing.Router (as wsgilinkapp.routes builds it) with the
+check_path chain wsgilinkapp.main used to walk (copied here), plus the
+re.search/int() the pages then did to get their ids and page numbers back
+out of the path. No redis needed.
+
+    $ python -m benchmarks.routing
+"""
+
+import argparse
+import re
+import timeit
+
+import wsgilinkapp
+
+PREFIX = "/linkapp/"
+
+PATHS = [
+    "/linkapp/",
+    "/linkapp/page/3",
+    "/linkapp/tag/python,2",
+    "/linkapp/static/style.css",
+    "/linkapp/new",
+    "/linkapp/save/",
+    "/linkapp/edit/jR5zE",
+    "/linkapp/view/jR5zE",
+    "/linkapp/reading-list",
+    "/linkapp/reading-list/page/2",
+    "/linkapp/reading-list/add/jR5zE",
+    "/linkapp/reading-list/read/jR5zE",
+    "/linkapp/api/links:batch",
+    "/linkapp/api/v1/reading-list",
+    "/linkapp/api/v1/links/jR5zE",
+    "/linkapp/metrics",
+    "/linkapp/no/such/page",
+]
+
+
+def check_path(environ, path, start=False):
+    """
+    What wsgilinkapp used to route with, before routing.Router.
+
+    Return true if path is requested in the given environ dictionary.
+    
+    If start is True, match if path provided is the BEGINNING of the path info.
+       useful if you are doing something with the parts of the path AFTER the 
+       initial path (e.g. /edit/[id of thing to edit])
+    """
+    check = "%s%s" % (environ['linkapp.path_prefix'], path)
+    
+    if start:
+        if environ['PATH_INFO'].startswith(check+"/"):
+            return True
+        else:
+            return False
+    else:
+        if environ['PATH_INFO'] == check:
+            return True
+        else:
+            return False
+
+
+def page_number(path):
+    try:
+        return int(path.split("/")[-1])
+    except ValueError:
+        return 1
+
+
+def key(path):
+    match = re.search("/([^/]+)$", path)
+    return match.group(1) if match else None
+
+
+def legacy(environ):
+    """
+    The old main, returning what the page would have worked out instead of
+    running it.
+    """
+    path = environ['PATH_INFO']
+
+    if check_path(environ, ""):
+        return "listing", page_number(path)
+    if check_path(environ, "page", True):
+        return "listing", page_number(path)
+    elif check_path(environ, "tag", True):
+        tag = path.encode("ISO-8859-1").decode('utf-8').split("/")[-1]
+        tag, comma, page = tag.partition(",")
+        return "tag", tag, page
+    elif path.startswith("%sstatic" % (environ['linkapp.path_prefix'],)):
+        return "static", path.replace(environ['linkapp.path_prefix'], "", 1).split("/")[1:]
+    elif check_path(environ, "new"):
+        return "new",
+    elif check_path(environ, "save", True):
+        return "save", key(path)
+    elif check_path(environ, "edit", True):
+        return "edit", key(path)
+    elif check_path(environ, "view", True):
+        return "view", key(path)
+    elif check_path(environ, "reading-list", False):
+        return "reading-list", page_number(path)
+    elif check_path(environ, "reading-list/page", True):
+        return "reading-list", page_number(path)
+    elif check_path(environ, "reading-list/add", True):
+        return "reading-list/add", key(path)
+    elif check_path(environ, "reading-list/read", True):
+        return "reading-list/read", key(path)
+    elif check_path(environ, "api/links:batch"):
+        return "api/links:batch",
+    elif check_path(environ, "api/v1/reading-list"):
+        return "api/v1/reading-list",
+    elif check_path(environ, "api/v1", True):
+        return "api/v1", [x for x in path[len(PREFIX + "api/v1/"):].split("/") if x]
+    elif check_path(environ, "metrics"):
+        return "metrics",
+    else:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=100000)
+    args = parser.parse_args()
+
+    router = wsgilinkapp.routes(PREFIX)
+
+    print("%-36s %12s %12s" % ("path", "router ns", "chain ns"))
+
+    for path in PATHS:
+        environ = {'PATH_INFO': path, 'linkapp.path_prefix': PREFIX}
+
+        routed = min(timeit.repeat(lambda: router.match(path), number=args.rounds, repeat=3))
+        chained = min(timeit.repeat(lambda: legacy(environ), number=args.rounds, repeat=3))
+
+        print("%-36s %12.0f %12.0f" % (path, routed / args.rounds * 1e9, chained / args.rounds * 1e9))
+
+
+if __name__ == "__main__":
+    main()
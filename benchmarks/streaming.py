@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Benchmark: a long reading list rendered whole (renderer.render_name, what
+my_reading_list did) and streamed (wsgilinkapp.stream_page), for the time
+to the first chunk, the time to the whole page and the peak memory. The
+links are made up in batches like ReadingListManager.iter_all_to_read
+hands them out, with a sleep standing in for each redis round trip. No
+redis needed.
+
+    $ python -m benchmarks.streaming --links 10000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import wsgilinkapp
+from edit import LinkRecord, STREAM_BATCH_SIZE
+
+
+def link(number):
+    return LinkRecord(
+        key="k%d" % (number,),
+        page_title="Something as a Title %d" % (number,),
+        desc_text="Whole bunch of things. Talking about stuff. " * 5,
+        url_address="http://www.sillygooses.com/%d" % (number,),
+        tags="python|redis|wsgi",
+        author="someone",
+        created="2020-01-01")
+
+
+def batches(count, round_trip):
+    for start in range(0, count, STREAM_BATCH_SIZE):
+        time.sleep(round_trip)
+        yield [link(x) for x in range(start, min(start + STREAM_BATCH_SIZE, count))]
+
+
+def context(count):
+    return {'user': "someone", 'prefix': "/linkapp/", 'count': count, 'last': 1}
+
+
+def whole(count, round_trip):
+    links = [x for batch in batches(count, round_trip) for x in batch]
+    yield wsgilinkapp.renderer.render_name('reading-list', dict(context(count), links=links)).encode('utf-8')
+
+
+def streamed(count, round_trip):
+    return wsgilinkapp.stream_page('reading-list', context(count), batches(count, round_trip))
+
+
+def measure(render, count, round_trip):
+    tracemalloc.start()
+    started = time.perf_counter()
+    first = None
+    size = 0
+
+    for chunk in render(count, round_trip):
+        if first is None:
+            first = time.perf_counter() - started
+
+        size += len(chunk)
+
+    total = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return first, total, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--links", type=int, default=10000)
+    parser.add_argument("--round-trip", type=float, default=0.0005, help="seconds per batch")
+    args = parser.parse_args()
+
+    print("%-10s %14s %12s %12s %12s" % ("render", "first chunk ms", "total ms", "peak KB", "page KB"))
+
+    for render in (whole, streamed):
+        first, total, peak, size = measure(render, args.links, args.round_trip)
+        print("%-10s %14.1f %12.1f %12d %12d" % (render.__name__, first * 1000, total * 1000, peak // 1024, size // 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""
+Benchmark suite: every manager method and page the app serves, on a seeded
+database, with results saved as JSON to compare between commits.
+
+It starts its own redis-server (see local_redis, or use --no-server to run
+against --host/--port/--db, which gets FLUSHED), seeds it (see dataset) and
+measures for each case:
+
+    ops/s          calls per second, one call at a time
+    p50, p99       latency of a call, in ms
+    round trips    requests sent to redis per call
+    alloc          peak bytes allocated during one call (tracemalloc)
+
+The pages are requested through WebTest, so they include the WSGI stack
+(sessions, routing, templates) but not a server.
+
+    $ python -m benchmarks.suite --output before.json
+    $ git checkout my-branch
+    $ python -m benchmarks.suite --output after.json --compare before.json
+
+--only takes a substring of the case names to run just some of them.
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from contextlib import contextmanager
+from unittest.mock import patch
+
+import redis
+from webtest import TestApp
+
+import edit
+import user
+import wsgilinkapp
+from benchmarks import dataset
+from benchmarks.local_redis import LocalRedis
+
+
+class RoundTrips:
+    """
+    Counts the requests sent to redis, a pipeline being one.
+    """
+    def __init__(self):
+        self.count = 0
+
+    @contextmanager
+    def counting(self):
+        original = redis.connection.AbstractConnection.send_packed_command
+        counter = self
+
+        def send_packed_command(connection, *args, **kwargs):
+            counter.count += 1
+            return original(connection, *args, **kwargs)
+
+        with patch.object(redis.connection.AbstractConnection, 'send_packed_command', send_packed_command):
+            yield self
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(func, rounds):
+    """
+    Run func rounds times (after one warm up call), returns the numbers for
+    the results file.
+    """
+    func()
+
+    trips = RoundTrips()
+    timings = []
+
+    with trips.counting():
+        for x in range(rounds):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+
+    return {
+        'ops_per_sec': rounds / sum(timings),
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'round_trips': trips.count / rounds,
+        'alloc_peak_bytes': peak,
+    }
+
+
+def manager_cases(settings, data):
+    """
+    (name, function) for the LinkManager, ReadingListManager and
+    UserManager methods.
+    """
+    lm = edit.LinkManager(*settings)
+    rl = edit.ReadingListManager(*settings)
+    um = user.UserManager(*settings)
+
+    popular, rare = data['tags'][0], data['tags'][-1]
+    link_id = data['link_ids'][0]
+    username = data['users'][0]
+    numbers = itertools.count()
+
+    def add():
+        lm.add(
+            page_title="Added by the benchmark",
+            desc_text="lorem ipsum " * 30,
+            url_address="http://www.example.com/added/%s" % (next(numbers),),
+            author="benchmark",
+            tags=[popular, "added"])
+
+    return [
+        ("LinkManager.count", lambda: lm.count()),
+        ("LinkManager.count(popular tag)", lambda: lm.count(popular)),
+        ("LinkManager.count(two tags)", lambda: lm.count(popular, data['tags'][1])),
+        ("LinkManager.listing(page 1)", lambda: lm.listing(start=0, stop=9, fields=edit.LINK_FIELDS)),
+        ("LinkManager.listing(page 50)", lambda: lm.listing(start=490, stop=499, fields=edit.LINK_FIELDS)),
+        ("LinkManager.listing(popular tag)", lambda: lm.listing(popular, start=0, stop=9, fields=edit.LINK_FIELDS)),
+        ("LinkManager.listing(rare tag)", lambda: lm.listing(rare, start=0, stop=9, fields=edit.LINK_FIELDS)),
+        ("LinkManager._tag_intersect", lambda: lm._tag_intersect((popular, data['tags'][1]), 'keys', 0, 9)),
+        ("LinkManager.page", lambda: lm.page(count=20, fields=edit.LINK_FIELDS)),
+        ("LinkManager.list_one", lambda: lm.list_one(link_id, fields=edit.LINK_FIELDS)),
+        ("LinkManager.add", add),
+        ("ReadingListManager.count", lambda: rl.count(username)),
+        ("ReadingListManager.to_read", lambda: rl.to_read(username, start=0, stop=19, fields=edit.LINK_FIELDS)),
+        ("ReadingListManager.page", lambda: rl.page(username, count=20, fields=edit.LINK_FIELDS)),
+        ("UserManager.authenticate", lambda: um.authenticate(username, dataset.PASSWORD)),
+    ]
+
+
+def page_cases(settings, data):
+    """
+    (name, function) for the pages, requested through WebTest.
+    """
+    app = TestApp(wsgilinkapp.AppFactory(*settings, path_prefix="/"))
+    logged_in = TestApp(wsgilinkapp.AppFactory(*settings, path_prefix="/"))
+    logged_in.authorization = ('Basic', (data['users'][0], dataset.PASSWORD))
+
+    popular = data['tags'][0]
+    link_id = data['link_ids'][0]
+
+    return [
+        ("GET /", lambda: app.get("/")),
+        ("GET /page/50", lambda: app.get("/page/50")),
+        ("GET /tag/<popular>", lambda: app.get("/tag/%s" % (popular,))),
+        ("GET /tag/<popular>,5", lambda: app.get("/tag/%s,5" % (popular,))),
+        ("GET /view/<id>", lambda: app.get("/view/%s" % (link_id,))),
+        ("GET /api/v1/links", lambda: app.get("/api/v1/links")),
+        ("GET /api/v1/tags/<popular>", lambda: app.get("/api/v1/tags/%s" % (popular,))),
+        ("GET /reading-list", lambda: logged_in.get("/reading-list")),
+        ("GET /new", lambda: logged_in.get("/new")),
+    ]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(settings, args):
+    started = time.time()
+    data = dataset.seed(
+        settings, links=args.links, tags=args.tags, zipf=args.zipf,
+        users=args.users, reading_list=args.reading_list, seed=args.seed)
+    seeded = time.time() - started
+
+    cases = manager_cases(settings, data) + page_cases(settings, data)
+    results = {}
+
+    for name, func in cases:
+        if args.only and args.only not in name:
+            continue
+
+        rounds = args.rounds
+        if "authenticate" in name or "reading-list" in name or "/new" in name:
+            # pbkdf2 on every call, these would take all day
+            rounds = max(1, rounds // 20)
+
+        results[name] = measure(func, rounds)
+        print_result(name, results[name])
+
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'redis': redis.StrictRedis(*settings).info('server')['redis_version'],
+        'seconds_to_seed': seeded,
+        'arguments': {
+            'links': args.links, 'tags': args.tags, 'zipf': args.zipf,
+            'users': args.users, 'reading_list': args.reading_list,
+            'seed': args.seed, 'rounds': args.rounds,
+        },
+        'results': results,
+    }
+
+
+def print_result(name, result, baseline=None):
+    line = "%-36s %10.1f %9.3f %9.3f %6.1f %10d" % (
+        name, result['ops_per_sec'], result['p50_ms'], result['p99_ms'],
+        result['round_trips'], result['alloc_peak_bytes'])
+
+    if baseline is not None:
+        line += "  %+6.1f%% ops/s  %+6.1f%% p99" % (
+            (result['ops_per_sec'] / baseline['ops_per_sec'] - 1) * 100,
+            (result['p99_ms'] / baseline['p99_ms'] - 1) * 100)
+
+    print(line)
+
+
+def compare(results, baseline):
+    """
+    Print results next to the baseline run (what was in --compare).
+    """
+    print("\ncompared with %s:" % (baseline.get('commit') or "baseline",))
+
+    for name, result in results['results'].items():
+        if name in baseline['results']:
+            print_result(name, result, baseline['results'][name])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--no-server", action="store_true",
+                        help="use the redis at --host/--port/--db instead of starting one")
+    parser.add_argument("--redis-server", default="redis-server", help="redis-server to start")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--links", type=int, default=10000)
+    parser.add_argument("--tags", type=int, default=200)
+    parser.add_argument("--zipf", type=float, default=1.1, help="tag popularity skew")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--reading-list", type=int, default=50, help="links on each reading list")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rounds", type=int, default=500)
+    parser.add_argument("--only", default=None, help="only run cases with this in their name")
+    parser.add_argument("--output", default=None, help="write the results here (JSON)")
+    parser.add_argument("--compare", default=None, help="results file to compare with")
+    args = parser.parse_args()
+
+    print("%-36s %10s %9s %9s %6s %10s" % ("case", "ops/s", "p50 ms", "p99 ms", "trips", "alloc"))
+
+    if args.no_server:
+        results = run((args.host, args.port, args.db), args)
+    else:
+        with LocalRedis(args.redis_server) as server:
+            results = run(server.settings, args)
+
+    if args.output:
+        with open(args.output, 'w') as target:
+            json.dump(results, target, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as source:
+            compare(results, json.load(source))
+
+
+if __name__ == "__main__":
+    main()
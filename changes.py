@@ -0,0 +1,199 @@
+"""
+Module for the change log: a Redis Stream with an entry for every change made
+to the links, users and reading lists.
+
+The managers add to it with record_change() inside the same MULTI/EXEC as the
+change itself, so an entry is there if and only if the change is. Entries are
+small, just enough to know what to look at again:
+
+    kind    what changed: "link", "user" or "reading_list"
+    action  add, modify, delete (links, users), 
+            add, read, unread, remove (reading lists)
+    id      the link's id, or the username for users
+    user    whose reading list (reading lists only)
+    fields  the fields a modify changed, as "a|b|c" (modify only)
+
+The stream is capped at about MAX_CHANGES entries (trimmed with MAXLEN ~), so
+it is a window of recent changes rather than a history. A consumer that falls
+further behind than that has missed changes and should start over from the
+data itself.
+
+Downstream workers read it with ChangeConsumer, using a consumer group so a
+group's workers split the changes between them, and a change is only done
+once a worker acknowledges it (at least once delivery - a worker that dies
+before acknowledging gets its changes handed out again).
+"""
+
+import redis
+
+CHANGES_KEY = "changes"
+MAX_CHANGES = 100000
+
+
+def record_change(pipe, kind, action, raw_id, user=None, fields=None):
+    """
+    Add a change to the log, pipe should be the pipeline making the change.
+    """
+    entry = {'kind': kind, 'action': action, 'id': raw_id}
+
+    if user is not None:
+        entry['user'] = user
+
+    if fields:
+        entry['fields'] = "|".join(sorted(fields))
+
+    pipe.xadd(CHANGES_KEY, entry, maxlen=MAX_CHANGES, approximate=True)
+
+
+class Change:
+    """
+    One entry from the change log.
+
+    change_id is the stream entry id ("<milliseconds>-<sequence>"), which is
+    also when the change was made.
+    """
+    __slots__ = ('change_id', 'kind', 'action', 'raw_id', 'user', 'fields')
+
+    def __init__(self, change_id, entry):
+        self.change_id = change_id
+        self.kind = entry.get('kind')
+        self.action = entry.get('action')
+        self.raw_id = entry.get('id')
+        self.user = entry.get('user')
+        self.fields = [x for x in entry.get('fields', "").split("|") if x]
+
+    def __repr__(self):
+        return "Change(%r, %r, %r, %r)" % (
+            self.change_id, self.kind, self.action, self.raw_id)
+
+
+class ChangeConsumer:
+    """
+    Reads the change log as one member (consumer) of a consumer group.
+
+    Typical use is a worker that hands each batch to a function and lets
+    process() acknowledge it:
+
+        consumer = ChangeConsumer(connection, "search-index", "worker-1")
+
+        while True:
+            consumer.process(update_search_index)
+
+    A new group starts at the end of the log (start="$"), pass start="0" to
+    have it go through everything still in the log first.
+    """
+    def __init__(self, connection, group, consumer, start="$"):
+        self.connection = connection
+        self.group = group
+        self.consumer = consumer
+        self.start = start
+
+        # anything handed to this consumer before (and never acknowledged) is
+        # read again before new changes.
+        self.pending = True
+
+    def create_group(self):
+        """
+        Make the consumer group (and the stream) if they don't exist yet.
+        """
+        try:
+            self.connection.xgroup_create(
+                CHANGES_KEY, self.group, id=self.start, mkstream=True)
+
+        except redis.ResponseError as e:
+            if not str(e).startswith("BUSYGROUP"):
+                raise
+
+    def read(self, count=100, block=None):
+        """
+        Up to count changes for this consumer, waiting up to block
+        milliseconds for one if there are none.
+
+        Changes this consumer was given before and hasn't acknowledged come
+        first, then new ones.
+        """
+        if self.pending:
+            changes = self._read("0", count, None)
+
+            if changes:
+                return changes
+
+            self.pending = False
+
+        return self._read(">", count, block)
+
+    def _read(self, last_id, count, block):
+        try:
+            reply = self.connection.xreadgroup(
+                self.group, self.consumer, {CHANGES_KEY: last_id},
+                count=count, block=block)
+
+        except redis.ResponseError as e:
+            if not str(e).startswith("NOGROUP"):
+                raise
+
+            # first read by this group, make it and try again.
+            self.create_group()
+
+            reply = self.connection.xreadgroup(
+                self.group, self.consumer, {CHANGES_KEY: last_id},
+                count=count, block=block)
+
+        changes = []
+
+        for stream, entries in reply or []:
+            for change_id, entry in entries:
+                # pending entries that were trimmed away come back empty.
+                if entry:
+                    changes.append(Change(change_id, entry))
+                else:
+                    self.ack([change_id])
+
+        return changes
+
+    def ack(self, change_ids):
+        """
+        Mark changes as done, they won't be handed out again.
+        """
+        if change_ids:
+            self.connection.xack(CHANGES_KEY, self.group, *change_ids)
+
+    def claim(self, min_idle=60000, count=100):
+        """
+        Take over changes another consumer in the group was given over
+        min_idle milliseconds ago and hasn't acknowledged (it probably died).
+
+        They are read again by this consumer's next read(). Returns how many
+        were claimed.
+        """
+        # with justid redis-py gives back just the list of claimed ids.
+        claimed = self.connection.xautoclaim(
+            CHANGES_KEY, self.group, self.consumer, min_idle,
+            start_id="0-0", count=count, justid=True)
+
+        if claimed:
+            self.pending = True
+
+        return len(claimed)
+
+    def process(self, handler, count=100, block=5000):
+        """
+        Read a batch of changes, call handler with the list, then acknowledge
+        them.
+
+        If handler raises, nothing is acknowledged and the same batch comes
+        back from the next read(). Returns how many changes were processed.
+        """
+        changes = self.read(count=count, block=block)
+
+        if changes:
+            try:
+                handler(changes)
+            except Exception:
+                # read the batch again next time.
+                self.pending = True
+                raise
+
+            self.ack([x.change_id for x in changes])
+
+        return len(changes)
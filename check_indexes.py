@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""
+Script to check the link indexes (tag:*, sorted:date, url_index) against the
+links, and optionally fix them. See the consistency module.
+
+Safe to run against the live database, use --rate to keep the load down.
+"""
+
+import argparse
+import consistency
+import edit
+
+parser = argparse.ArgumentParser(description="Check (and repair) the linkapp indexes.")
+parser.add_argument("--repair", action="store_true", 
+                    help="fix what is found, otherwise only report it")
+parser.add_argument("--rate", type=float, default=2000,
+                    help="most keys to look at per second, 0 for no limit (default: 2000)")
+parser.add_argument("--batch-size", type=int, default=500)
+parser.add_argument("--details", action="store_true",
+                    help="list every problem found, not just the totals")
+args = parser.parse_args()
+
+checker = consistency.IndexChecker(
+    edit.LinkManager(), 
+    repair=args.repair, 
+    batch_size=args.batch_size, 
+    max_rate=args.rate or None)
+
+report = checker.run()
+
+if args.details:
+    for kind, key, member, fixed in report.details:
+        print("%s %s %s%s" % (kind, key, member or "", " (fixed)" if fixed else ""))
+
+for line in report.summary():
+    print(line)
@@ -0,0 +1,366 @@
+"""
+Module for compressing responses.
+
+CompressionMiddleware gzips (or, with the brotli package installed,
+brotlis) the responses of clients that say they take it in
+Accept-Encoding. AppFactory puts it around the app unless it's given
+compress=False, e.g. when a proxy in front already does it.
+
+Only text (HTML, CSS, JavaScript, JSON, SVG...) is compressed, and not if
+it's less than min_bytes (there's little to gain and gzip's own header is
+18 bytes), already has a Content-Encoding, or is a 304/204/HEAD with no
+body. The size is known from Content-Length or a list body; a body that
+comes from a generator without one (a streamed page) is always compressed,
+nothing of it is held back to find out. The body is compressed as it's
+sent, a chunk at a time, so a big static file or a streamed page isn't
+held in memory, and each chunk the app gives is flushed out straight away. Responses that could have been
+compressed all get "Vary: Accept-Encoding" so caches keep the versions
+apart.
+
+Responses with an ETag (the JSON API, static files) are the same bytes
+every time for that ETag, so what they compress to is kept in a
+CompressedCache: the next request for it sends the compressed bytes
+without compressing anything. Their ETag is made weak (W/"...") when
+compressed, the compressed bytes aren't the ones it was made from.
+"""
+
+import itertools
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_BYTES = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+
+
+def encodings():
+    """
+    The encodings we can do, best first.
+    """
+    if brotli is not None:
+        return ('br', 'gzip')
+
+    return ('gzip',)
+
+
+def choose_encoding(accept_encoding, available=None):
+    """
+    The best of available the Accept-Encoding header takes, None for none.
+    """
+    if available is None:
+        available = encodings()
+
+    qualities = {}
+
+    for item in accept_encoding.split(','):
+        name, semicolon, params = item.partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+
+        for param in params.split(';'):
+            key, equals, value = param.partition('=')
+
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if name:
+            qualities[name] = quality
+
+    best = None
+
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+
+    return best[0] if best else None
+
+
+class Compressor:
+    """
+    A streaming compressor for one response, both encodings the same way.
+    """
+    def __init__(self, encoding):
+        self.encoding = encoding
+
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # 31 is a gzip header and trailer around the deflate stream.
+            self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self.compressor.process(data) + self.compressor.flush()
+
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self.compressor.finish()
+
+        return self.compressor.flush()
+
+
+class CompressedCache:
+    """
+    Compressed bodies by (path, ETag, encoding), the least recently used
+    are dropped past max_bytes. Bodies over max_entry_bytes aren't kept.
+    """
+    def __init__(self, max_bytes=16 * 1024 * 1024, max_entry_bytes=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+
+            if body is not None:
+                self.entries.move_to_end(key)
+
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_entry_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                return
+
+            self.entries[key] = body
+            self.size += len(body)
+
+            while self.size > self.max_bytes:
+                old_key, old_body = self.entries.popitem(last=False)
+                self.size -= len(old_body)
+
+
+def header(headers, name):
+    name = name.lower()
+
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+
+    return None
+
+
+def without(headers, *names):
+    names = [x.lower() for x in names]
+    return [(key, value) for key, value in headers if key.lower() not in names]
+
+
+def add_vary(headers):
+    vary = header(headers, 'Vary')
+
+    if vary is None:
+        return headers + [('Vary', 'Accept-Encoding')]
+
+    if 'accept-encoding' in vary.lower() or vary.strip() == '*':
+        return headers
+
+    return without(headers, 'Vary') + [('Vary', vary + ', Accept-Encoding')]
+
+
+def weak(etag):
+    return etag if etag.startswith('W/') else 'W/' + etag
+
+
+def compressible(status, headers):
+    """
+    Whether a response is the kind that gets compressed, whoever it's for.
+    """
+    if status[:3] in ('204', '304') or status[:1] == '1':
+        return False
+
+    content_type = (header(headers, 'Content-Type') or '').lower()
+
+    if not content_type.startswith(COMPRESSIBLE):
+        return False
+
+    if header(headers, 'Content-Encoding') is not None:
+        return False
+
+    return 'no-transform' not in (header(headers, 'Cache-Control') or '').lower()
+
+
+def close(result):
+    if hasattr(result, 'close'):
+        result.close()
+
+
+def body_size(headers, result):
+    """
+    How long the body is going to be, from Content-Length or by adding up
+    a list body, None if it can't be known before it's sent.
+    """
+    length = header(headers, 'Content-Length')
+
+    if length is not None and length.isdigit():
+        return int(length)
+
+    if isinstance(result, (list, tuple)):
+        return sum(len(x) for x in result)
+
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Compresses the responses of the application, see the module docs.
+    """
+    def __init__(self, application, min_bytes=MIN_BYTES, cache=None):
+        self.application = application
+        self.min_bytes = min_bytes
+        self.cache = cache
+
+    def __call__(self, environ, start_response):
+        encoding = None
+
+        if environ.get('REQUEST_METHOD') != 'HEAD':
+            encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+
+        started = []
+
+        def capturing_start_response(status, headers, exc_info=None):
+            if exc_info is not None and started:
+                # the app failed after starting, whatever we do next
+                # start_response re-raises it.
+                return start_response(status, headers, exc_info)
+
+            started[:] = [status, headers, exc_info]
+
+            # nothing uses write(), a body written with it would go out
+            # ahead of the headers we haven't sent yet.
+            def write(data):
+                raise NotImplementedError("write() isn't supported under CompressionMiddleware")
+
+            return write
+
+        result = self.application(environ, capturing_start_response)
+        chunks = iter(result)
+
+        # a page may not call start_response until its first chunk is out.
+        held = []
+
+        try:
+            while not started:
+                held.append(next(chunks))
+        except StopIteration:
+            close(result)
+            raise RuntimeError("the application didn't call start_response")
+        except BaseException:
+            close(result)
+            raise
+
+        status, headers, exc_info = started
+
+        try:
+            return self.respond(environ, start_response, status, headers, exc_info, encoding, result, chunks, held)
+        except BaseException:
+            close(result)
+            raise
+
+    def respond(self, environ, start_response, status, headers, exc_info, encoding, result, chunks, held):
+        if not compressible(status, headers):
+            start_response(status, headers, exc_info)
+            return self.passed_on(result, chunks, held)
+
+        headers = add_vary(headers)
+
+        size = body_size(headers, result)
+
+        if encoding is None or (size is not None and size < self.min_bytes):
+            start_response(status, headers, exc_info)
+            return self.passed_on(result, chunks, held)
+
+        etag = header(headers, 'ETag')
+        key = None
+
+        if self.cache is not None and etag is not None and status.startswith('200'):
+            key = (environ.get('PATH_INFO'), etag, encoding)
+            cached = self.cache.get(key)
+
+            if cached is not None:
+                close(result)
+                start_response(status, self.compressed_headers(headers, encoding, len(cached)), exc_info)
+                return [cached]
+
+        # a body of unknown size is a streamed page, it's compressed from the
+        # first chunk rather than held until it's clear it isn't tiny.
+        start_response(status, self.compressed_headers(headers, encoding), exc_info)
+        return self.compressed(result, chunks, held, Compressor(encoding), key)
+
+    def compressed_headers(self, headers, encoding, length=None):
+        etag = header(headers, 'ETag')
+
+        headers = without(headers, 'Content-Length', 'ETag') + [('Content-Encoding', encoding)]
+
+        if etag is not None:
+            headers.append(('ETag', weak(etag)))
+
+        if length is not None:
+            headers.append(('Content-Length', str(length)))
+
+        return headers
+
+    def passed_on(self, result, chunks, held):
+        try:
+            for chunk in itertools.chain(held, chunks):
+                yield chunk
+        finally:
+            close(result)
+
+    def compressed(self, result, chunks, held, compressor, key):
+        # what went out, for the cache, if it isn't too big to keep.
+        sent = [] if key is not None else None
+        sent_bytes = 0
+
+        try:
+            for chunk in itertools.chain(held, chunks):
+                if not chunk:
+                    continue
+
+                data = compressor.compress(chunk)
+
+                if sent is not None:
+                    sent.append(data)
+                    sent_bytes += len(data)
+
+                    if sent_bytes > self.cache.max_entry_bytes:
+                        sent = None
+
+                yield data
+
+            data = compressor.finish()
+
+            if sent is not None:
+                sent.append(data)
+                self.cache.put(key, b''.join(sent))
+
+            yield data
+        finally:
+            close(result)
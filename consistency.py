@@ -0,0 +1,392 @@
+"""
+Module for checking the link indexes against the link hashes, and fixing them.
+
+The link hashes (link:<id>) are the source of truth. The indexes kept from
+them are:
+
+    tag:<tag>       sorted set of the ids of links with that tag, by date
+    sorted:date     sorted set of every link id, by date
+    url_index       hash of normalized url -> link id
+
+IndexChecker first walks the link hashes with SCAN, checking each link is in
+every index it should be with the right score (forward pass). Then it walks
+the indexes, checking everything in them still belongs there (reverse pass) -
+this also empties out leftover intersection keys like tag:a|b:sorted, since no
+link has the tag "a|b:sorted". Last it deletes keys nothing uses anymore.
+
+With repair=True it fixes what it finds. Each fix is made in a transaction
+watching the link's key and re-reads the link inside it, so a link that is
+edited while the checker looks at it is left alone (and reported as not
+fixed) rather than "fixed" with stale data.
+
+Keys are handled batch_size at a time, with a pause after each batch so it
+never goes faster than max_rate keys per second. That makes it safe to leave
+running against the live database.
+"""
+
+import time
+from collections import Counter
+from datetime import datetime
+
+import redis
+
+from edit import CREATED_TIME_FORMAT, URL_INDEX_KEY, chunks, created_score, normalize_url
+
+# keys nothing creates anymore (url_hold, the reading list temp keys from
+# before unread:/read:) - safe to delete when found.
+LEFTOVER_PATTERNS = ("to-read:*:temp", "been-read:*:temp", "url_hold")
+
+# scores have seconds but created only has minutes, so a score within a
+# minute of created is right.
+SCORE_TOLERANCE = 60
+
+
+def expected_score(created):
+    """
+    The date score a link should have going by its created field, or None if
+    created can't be read.
+    """
+    if not created:
+        return None
+
+    try:
+        return created_score(datetime.strptime(created, CREATED_TIME_FORMAT))
+    except ValueError:
+        return None
+
+
+def score_is_wrong(score, expected):
+    return expected is not None and abs(score - expected) >= SCORE_TOLERANCE
+
+
+class Report:
+    """
+    What an IndexChecker found, and what it fixed.
+
+    counts and fixed are Counters keyed by kind of problem, details has the
+    first max_details problems as (kind, key, member, fixed).
+    """
+    def __init__(self, max_details=1000):
+        self.counts = Counter()
+        self.fixed = Counter()
+        self.details = []
+        self.max_details = max_details
+        self.checked = 0
+
+    def problem(self, kind, key, member=None, fixed=False):
+        self.counts[kind] += 1
+
+        if fixed:
+            self.fixed[kind] += 1
+
+        if len(self.details) < self.max_details:
+            self.details.append((kind, key, member, fixed))
+
+    def summary(self):
+        """
+        Lines of text for a person to read.
+        """
+        lines = ["Checked %s keys." % (self.checked,)]
+
+        if not self.counts:
+            lines.append("No problems found.")
+
+        for kind, count in sorted(self.counts.items()):
+            lines.append("%s: %s found, %s fixed" % (kind, count, self.fixed[kind]))
+
+        return lines
+
+
+class RateLimiter:
+    """
+    Sleeps as needed to keep work under max_rate items per second.
+    """
+    def __init__(self, max_rate=None):
+        self.max_rate = max_rate
+        self.started = time.monotonic()
+        self.done = 0
+
+    def wait(self, count):
+        self.done += count
+
+        if not self.max_rate:
+            return
+
+        ahead = self.done / self.max_rate - (time.monotonic() - self.started)
+
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+class IndexChecker:
+    """
+    Checks (and optionally repairs) the link indexes, see the module docs.
+    """
+    def __init__(self, link_manager, repair=False, batch_size=500, max_rate=None):
+        self.lm = link_manager
+        self.connection = link_manager.connection
+        self.repair = repair
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(max_rate)
+        self.report = Report()
+
+    def run(self):
+        """
+        Every pass, returns the Report.
+        """
+        self.check_links()
+        self.check_date_index()
+        self.check_tag_indexes()
+        self.check_url_index()
+        self.remove_leftovers()
+
+        return self.report
+
+    def _batches(self, keys):
+        """
+        Split keys into batches, counting them and keeping to the rate limit.
+        """
+        for batch in chunks(keys, self.batch_size):
+            yield batch
+
+            self.report.checked += len(batch)
+            self.limiter.wait(len(batch))
+
+    def check_links(self):
+        """
+        Forward pass: every link is in sorted:date, its tags and the url index.
+        """
+        keys = self.connection.scan_iter(self.lm.prefix_key("*"), count=self.batch_size)
+
+        for batch in self._batches(keys):
+            with self.connection.pipeline(transaction=False) as pipe:
+                for key in batch:
+                    pipe.hmget(key, "key", "url_address", "tags", "created")
+
+                links = [(key, values) for key, values in zip(batch, pipe.execute()) if values[0]]
+
+            # every index lookup for the whole batch in one round trip.
+            with self.connection.pipeline(transaction=False) as pipe:
+                for key, (raw_id, url_address, tags, created) in links:
+                    pipe.zscore("sorted:date", raw_id)
+
+                    for tag in self._tags(tags):
+                        pipe.zscore("tag:%s" % (tag,), raw_id)
+
+                    if url_address:
+                        pipe.hget(URL_INDEX_KEY, normalize_url(url_address))
+
+                replies = iter(pipe.execute())
+
+            for key, (raw_id, url_address, tags, created) in links:
+                problems = self._link_problems(raw_id, url_address, tags, created, replies)
+
+                if problems:
+                    fixed = self.repair and self._repair_link(key)
+
+                    for kind, index_key in problems:
+                        self.report.problem(kind, index_key, raw_id, fixed)
+
+    def _tags(self, tags):
+        return [x for x in (tags or "").split("|") if x]
+
+    def _link_problems(self, raw_id, url_address, tags, created, replies):
+        """
+        Compare one link with its index replies, returns [(kind, index key)].
+        """
+        problems = []
+        expected = expected_score(created)
+
+        date_score = next(replies)
+
+        if date_score is None:
+            problems.append(("missing_from_date_index", "sorted:date"))
+        elif score_is_wrong(date_score, expected):
+            problems.append(("wrong_date_score", "sorted:date"))
+        else:
+            # the tags should agree with sorted:date to the second.
+            expected = date_score
+
+        for tag in self._tags(tags):
+            tag_key = "tag:%s" % (tag,)
+            tag_score = next(replies)
+
+            if tag_score is None:
+                problems.append(("missing_from_tag_index", tag_key))
+            elif score_is_wrong(tag_score, expected):
+                problems.append(("wrong_tag_score", tag_key))
+
+        if url_address:
+            owner = next(replies)
+
+            if owner is None:
+                problems.append(("missing_from_url_index", URL_INDEX_KEY))
+            elif owner != raw_id:
+                if self.connection.exists(self.lm.prefix_key(owner)):
+                    # two links with one url - a person has to decide.
+                    self.report.problem("duplicate_url", URL_INDEX_KEY, raw_id)
+                else:
+                    problems.append(("stale_url_index_entry", URL_INDEX_KEY))
+
+        return problems
+
+    def _repair_link(self, key):
+        """
+        Re-index one link inside a transaction watching its key. Returns True
+        if the link was re-indexed.
+        """
+        with self.connection.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+
+                raw_id, url_address, tags, created = pipe.hmget(
+                    key, "key", "url_address", "tags", "created")
+
+                if not raw_id:
+                    return False
+
+                score = pipe.zscore("sorted:date", raw_id)
+                expected = expected_score(created)
+
+                if score is None or score_is_wrong(score, expected):
+                    score = expected
+
+                if score is None:
+                    # no date to go by, leave it for a person.
+                    return False
+
+                claim_url = False
+
+                if url_address:
+                    normalized = normalize_url(url_address)
+                    owner = pipe.hget(URL_INDEX_KEY, normalized)
+
+                    claim_url = owner is None or (
+                        owner != raw_id and not pipe.exists(self.lm.prefix_key(owner)))
+
+                pipe.multi()
+                pipe.zadd("sorted:date", {raw_id: score})
+
+                for tag in self._tags(tags):
+                    pipe.zadd("tag:%s" % (tag,), {raw_id: score})
+
+                if claim_url:
+                    pipe.hset(URL_INDEX_KEY, normalized, raw_id)
+
+                pipe.execute()
+                return True
+
+            except redis.WatchError:
+                return False
+
+    def check_date_index(self):
+        """
+        Reverse pass over sorted:date: every id in it is a link.
+        """
+        self._check_sorted_set("sorted:date", None, "stale_date_index_entry")
+
+    def check_tag_indexes(self):
+        """
+        Reverse pass over every tag:* set: every id in it is a link with the tag.
+        """
+        for tag_key in self.connection.scan_iter("tag:*", count=self.batch_size):
+            self._check_sorted_set(tag_key, tag_key[len("tag:"):], "stale_tag_index_entry")
+
+    def _check_sorted_set(self, index_key, tag, kind):
+        members = (x for x, score in self.connection.zscan_iter(index_key, count=self.batch_size))
+
+        for batch in self._batches(members):
+            with self.connection.pipeline(transaction=False) as pipe:
+                for raw_id in batch:
+                    pipe.hmget(self.lm.prefix_key(raw_id), "key", "tags")
+
+                links = pipe.execute()
+
+            for raw_id, (key, tags) in zip(batch, links):
+                if key and (tag is None or tag in self._tags(tags)):
+                    continue
+
+                fixed = self.repair and self._remove_member(index_key, raw_id, tag)
+                self.report.problem(kind, index_key, raw_id, fixed)
+
+    def _remove_member(self, index_key, raw_id, tag):
+        """
+        Take a link out of an index it doesn't belong in, checking again inside
+        a transaction watching the link's key.
+        """
+        link_key = self.lm.prefix_key(raw_id)
+
+        with self.connection.pipeline() as pipe:
+            try:
+                pipe.watch(link_key)
+
+                key, tags = pipe.hmget(link_key, "key", "tags")
+
+                if key and (tag is None or tag in self._tags(tags)):
+                    return False
+
+                pipe.multi()
+                pipe.zrem(index_key, raw_id)
+                pipe.execute()
+                return True
+
+            except redis.WatchError:
+                return False
+
+    def check_url_index(self):
+        """
+        Reverse pass over the url index: every entry points at a link that has
+        that url.
+        """
+        entries = self.connection.hscan_iter(URL_INDEX_KEY, count=self.batch_size)
+
+        for batch in self._batches(entries):
+            with self.connection.pipeline(transaction=False) as pipe:
+                for normalized, raw_id in batch:
+                    pipe.hget(self.lm.prefix_key(raw_id), "url_address")
+
+                urls = pipe.execute()
+
+            for (normalized, raw_id), url_address in zip(batch, urls):
+                if url_address and normalize_url(url_address) == normalized:
+                    continue
+
+                fixed = self.repair and self._remove_url(normalized, raw_id)
+                self.report.problem("stale_url_index_entry", URL_INDEX_KEY, normalized, fixed)
+
+    def _remove_url(self, normalized, raw_id):
+        link_key = self.lm.prefix_key(raw_id)
+
+        with self.connection.pipeline() as pipe:
+            try:
+                pipe.watch(link_key, URL_INDEX_KEY)
+
+                url_address = pipe.hget(link_key, "url_address")
+
+                if url_address and normalize_url(url_address) == normalized:
+                    return False
+
+                if pipe.hget(URL_INDEX_KEY, normalized) != raw_id:
+                    return False
+
+                pipe.multi()
+                pipe.hdel(URL_INDEX_KEY, normalized)
+                pipe.execute()
+                return True
+
+            except redis.WatchError:
+                return False
+
+    def remove_leftovers(self):
+        """
+        Delete keys nothing uses anymore, see LEFTOVER_PATTERNS.
+        """
+        for pattern in LEFTOVER_PATTERNS:
+            keys = self.connection.scan_iter(pattern, count=self.batch_size)
+
+            for batch in self._batches(keys):
+                if self.repair:
+                    self.connection.delete(*batch)
+
+                for key in batch:
+                    self.report.problem("leftover_key", key, fixed=self.repair)
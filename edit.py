@@ -7,23 +7,471 @@ import uuid
 import random
 from hashids import Hashids
 from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit
+from changes import CHANGES_KEY, MAX_CHANGES, record_change
 
 CREATED_TIME_FORMAT = "%m-%d-%Y @ %H:%M"
 BEGINNING_OF_TIME = datetime(1975, 11, 16, 20, 12, 0)
 
 
-def pipeline_monkeypatch(self, transaction=True, shard_hint=None):
+def created_score(created):
+    """
+    The score a link created at the given datetime gets in sorted sets.
+    """
+    return (created - BEGINNING_OF_TIME).total_seconds()
+    
+    
+def chunks(iterable, size):
+    """
+    Split an iterable into lists of at most size items, lazily.
+    """
+    chunk = []
+    
+    for item in iterable:
+        chunk.append(item)
+        
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+            
+    if chunk:
+        yield chunk
+        
+        
+# hash of normalized url -> link id, see normalize_url()
+URL_INDEX_KEY = "url_index"
+
+# query string parameters that only say where a click came from, they don't
+# change what the url points to.
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid',
+                   'mc_cid', 'mc_eid', '_ga', 'ref_src'}
+TRACKING_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url_address):
+    """
+    Reduce a url to the form used as the key in the url index, so trivially
+    different spellings of the same address are caught as duplicates.
+    
+    - scheme and host are lower cased, default ports are dropped
+    - a trailing slash on the path is dropped
+    - tracking parameters (utm_*, fbclid, etc) are stripped from the query
+    
+    Everything else (path case, parameter order, fragment) is left alone.
+    """
+    url_address = url_address.strip()
+    
+    try:
+        parts = urlsplit(url_address)
+        port = parts.port
+    except ValueError:
+        # not something we can take apart, just use it as is.
+        return url_address
+    
+    scheme = parts.scheme.lower()
+    
+    host = parts.hostname or ''
+    if ":" in host:
+        # IPv6 literal, put the brackets back.
+        host = "[%s]" % (host,)
+        
+    if port is not None and DEFAULT_PORTS.get(scheme) != port:
+        host = "%s:%s" % (host, port)
+        
+    if parts.username is not None:
+        # keep the user info exactly as it was given.
+        userinfo = parts.netloc.rsplit("@", 1)[0]
+        host = "%s@%s" % (userinfo, host)
+    
+    path = parts.path.rstrip("/")
+    
+    query = "&".join(
+        x for x in parts.query.split("&") 
+        if x and not _is_tracking_param(x.split("=", 1)[0]))
+    
+    return urlunsplit((scheme, host, path, query, parts.fragment))
+    
+    
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def clean_tags(tags):
+    """
+    Tags as they are stored: stripped, without blanks or repeats, sorted. 
+    
+    Raises TypeError for a string (it has to be a list, set, etc.) and 
+    ValueError if there are no tags left.
+    """
+    if tags is None or isinstance(tags, str):
+        raise TypeError('Tags must be a list, set, tuple, etc.')
+        
+    tags = sorted({x.strip() for x in tags if x.strip()})
+    
+    if not tags:
+        raise ValueError('At least one tag must be provided.')
+        
+    return tags
+    
+    
+# how many links the batch methods (LinkManager.add_many etc) write in one 
+# transaction.
+BATCH_WRITE_SIZE = 500
+
+
+# Moves the links in one tag's sorted set (KEYS[1]) over to another tag
+# (KEYS[2]), at most ARGV[3] of them per call: each link's tags field has the
+# old tag (ARGV[1]) swapped for the new one (ARGV[2]), it's added to the new 
+# tag's set and taken out of the old one, and the change goes in the change 
+# log (KEYS[3], trimmed to ~ARGV[4]). Entries for links that are gone or 
+# don't really have the old tag are just dropped. Link hashes are found with 
+# the prefix in ARGV[5].
+#
+# A script runs atomically, so a link can't be edited halfway through being 
+# retagged. Returns {links looked at, links retagged}.
+RETAG_SCRIPT = """
+local source, target, changes = KEYS[1], KEYS[2], KEYS[3]
+local old, new = ARGV[1], ARGV[2]
+
+local batch = redis.call('ZRANGE', source, 0, tonumber(ARGV[3]) - 1, 'WITHSCORES')
+local retagged = 0
+
+for i = 1, #batch, 2 do
+    local raw_id, score = batch[i], batch[i + 1]
+    local link_key = ARGV[5] .. raw_id
+    local tags = redis.call('HGET', link_key, 'tags')
+    
+    local found, seen, kept = false, {}, {}
+    
+    for tag in string.gmatch(tags or '', '[^|]+') do
+        if tag == old then
+            found = true
+            tag = new
+        end
+        
+        if not seen[tag] then
+            seen[tag] = true
+            table.insert(kept, tag)
+        end
+    end
+    
+    if found then
+        table.sort(kept)
+        redis.call('HSET', link_key, 'tags', table.concat(kept, '|'))
+        redis.call('ZADD', target, score, raw_id)
+        redis.call('XADD', changes, 'MAXLEN', '~', ARGV[4], '*', 
+                   'kind', 'link', 'action', 'modify', 'id', raw_id, 'fields', 'tags')
+        retagged = retagged + 1
+    elseif not seen[new] then
+        -- copied over by the ZUNIONSTORE, but it doesn't belong there.
+        redis.call('ZREM', target, raw_id)
+    end
+    
+    redis.call('ZREM', source, raw_id)
+end
+
+return {#batch / 2, retagged}
+"""
+
+# how many links RETAG_SCRIPT moves per call, small enough not to hold up 
+# other clients for long.
+RETAG_BATCH_SIZE = 500
+
+
+def make_cursor(raw_id, score):
+    """
+    A cursor for paging through a sorted set newest first, pointing just 
+    after the given member. Unlike start/stop it doesn't skip or repeat links
+    when links are added or deleted between pages.
+    """
+    return "%r:%s" % (score, raw_id)
+    
+    
+def read_cursor(cursor):
+    """
+    Split a cursor back into (score, id). Raises ValueError for a cursor 
+    make_cursor didn't make.
+    """
+    try:
+        score, raw_id = cursor.split(":", 1)
+        return float(score), raw_id
+    except ValueError:
+        raise ValueError("'%s' isn't a cursor" % (cursor,))
+    
+    
+def queue_page(pipe, key, cursor, count):
+    """
+    Queue the commands for one page (count ids) of the sorted set key after 
+    cursor (from the top if cursor is None) on a pipeline. Feed the replies 
+    to page_from_replies.
+    
+    Returns how many replies page_from_replies will need.
+    """
+    if cursor is None:
+        pipe.zrevrange(key, 0, count - 1, withscores=True)
+        return 1
+        
+    score, raw_id = read_cursor(cursor)
+    
+    # the links with the same score as the cursor, then the ones after it.
+    pipe.zrevrangebyscore(key, score, score, withscores=True)
+    pipe.zrevrangebyscore(key, "(%r" % (score,), "-inf", start=0, num=count, withscores=True)
+    return 2
+    
+    
+def page_from_replies(replies, cursor, count):
+    """
+    Returns (ids, cursor for the next page or None if this is the last).
+    """
+    if cursor is None:
+        entries = replies[0]
+    else:
+        score, raw_id = read_cursor(cursor)
+        
+        # members with equal scores come in reverse order, so the ones not 
+        # shown yet are the ones that sort before the cursor's.
+        entries = [x for x in replies[0] if x[0] < raw_id] + replies[1]
+        
+    entries = entries[:count]
+    
+    next_cursor = None
+    if len(entries) == count:
+        next_cursor = make_cursor(*entries[-1])
+        
+    return [x[0] for x in entries], next_cursor
+    
+    
+def batch_result(key=None, error=None):
+    """
+    What the batch methods return for each link: its id (if it has one) and 
+    what went wrong, None if it worked.
+    """
+    return {'key': key, 'error': error}
+
+
+# every field kept in a link hash.
+LINK_FIELDS = ('page_title', 'desc_text', 'url_address', 'key', 'author', 'created', 'tags')
+
+
+class LinkRecord:
+    """
+    Lightweight stand-in for a link hash, made for Mustache templates.
+    
+    Only the fields that were fetched are set, anything else is simply missing
+    (which Mustache treats as empty). The tags field is kept as the raw "a|b|c"
+    string in tags_text and is only split into a list the first time tags is 
+    used.
+    """
+    __slots__ = ('page_title', 'desc_text', 'url_address', 'key', 'author', 
+                 'created', 'tags_text', '_tags')
+    
+    def __init__(self, **attributes):
+        for name, value in attributes.items():
+            if name == 'tags':
+                name = 'tags_text'
+                
+            setattr(self, name, value)
+        
+    @classmethod
+    def from_values(cls, fields, values):
         """
-        MONKEYPATCH: callbacks really should be a copy!
+        Build a record from the reply to HMGET key *fields.
+        
+        Returns None if the link doesn't exist (every value is None).
+        """
+        record = None
+        
+        for name, value in zip(fields, values):
+            if value is None:
+                continue
+            
+            if record is None:
+                record = cls()
+                
+            if name == 'tags':
+                record.tags_text = value
+            else:
+                setattr(record, name, value)
+                
+        return record
+        
+    @classmethod
+    def from_hash(cls, attributes):
+        """
+        Build a record from the dictionary HGETALL returns.
+        
+        Returns None if the dictionary is empty (the link doesn't exist).
+        """
+        if not attributes:
+            return None
+            
+        return cls(**{x: attributes[x] for x in LINK_FIELDS if x in attributes})
+        
+    @property
+    def tags(self):
         """
-        return redis.client.StrictPipeline(
-            self.connection_pool,
-            self.response_callbacks.copy(),
-            transaction,
-            shard_hint)
+        Making it easy to get a list out of the tags property.
+        """
+        try:
+            return self._tags
+        except AttributeError:
+            pass
+            
+        try:
+            tags_text = self.tags_text
+        except AttributeError:
+            # tags weren't fetched, look missing like any other field.
+            raise AttributeError('tags')
+            
+        self._tags = [{"name": x} for x in tags_text.split("|")]
+        return self._tags
+        
+    def to_dict(self):
+        """
+        The fields that were fetched, in the same shape HGETALL returns.
+        """
+        result = {}
+        
+        for name in LINK_FIELDS:
+            value = getattr(self, 'tags_text' if name == 'tags' else name, None)
+            if value is not None:
+                result[name] = value
+                
+        return result
+        
+    def __repr__(self):
+        return "LinkRecord(%r)" % (self.to_dict(),)
+        
+        
+def values_to_dict(fields, values):
+    """
+    The reply to HMGET key *fields as a dictionary of the fields that are set,
+    None if the link doesn't exist (every value is None).
+    """
+    result = {name: value for name, value in zip(fields, values) if value is not None}
+    
+    return result or None
+    
+    
+# how many links to ask for in one pipeline when hydrating, so a huge reading
+# list doesn't turn into one enormous request/reply.
+HYDRATE_CHUNK_SIZE = 500
+
+# how many links a streamed page fetches at a time, see iter_hydrate_links.
+STREAM_BATCH_SIZE = 50
 
-redis.StrictRedis.pipeline = pipeline_monkeypatch
 
+def plan_hydrate(raw_ids, fields, memo, chunk_size, as_dicts):
+    """
+    The first part of hydrate_links, shared with the asyncio version: the 
+    memo keys for raw_ids, and the ones that aren't in memo yet split into
+    chunks to fetch.
+    """
+    memo_keys = [(x, fields, as_dicts) for x in raw_ids]
+    
+    # dict.fromkeys keeps the order and drops repeats.
+    to_fetch = [x for x in dict.fromkeys(memo_keys) if x not in memo]
+    
+    chunks_to_fetch = [to_fetch[x:x+chunk_size] for x in range(0, len(to_fetch), chunk_size)]
+    
+    return memo_keys, chunks_to_fetch
+    
+    
+def queue_hydrate(pipe, chunk, fields):
+    """
+    Queue the reads for one chunk from plan_hydrate on a pipeline.
+    """
+    for raw_id, x, y in chunk:
+        if fields is not None:
+            pipe.hmget("link:%s" % (raw_id,), fields)
+        else:
+            pipe.hgetall("link:%s" % (raw_id,))
+            
+            
+def parse_hydrate(result, fields, as_dicts):
+    """
+    Turn the replies to queue_hydrate's reads into links.
+    """
+    if fields is not None and as_dicts:
+        return [values_to_dict(fields, x) for x in result]
+    elif fields is not None:
+        return [LinkRecord.from_values(fields, x) for x in result]
+    else:
+        return result
+        
+        
+def hydrate_links(connection, raw_ids, fields=None, memo=None,
+                  chunk_size=HYDRATE_CHUNK_SIZE, as_dicts=False):
+    """
+    Fetch the links for a list of ids, the one place every manager goes 
+    through to turn ids into links.
+    
+    - with fields, only those fields are fetched (HMGET) and each link comes
+      back as a LinkRecord, or None if it doesn't exist
+    - without fields the whole hash is fetched (HGETALL) and comes back as 
+      the dictionary redis-py makes of it, empty if it doesn't exist
+    - with fields and as_dicts, each link comes back as a plain dictionary of 
+      the fields it has, or None - for when the links are going straight out
+      as JSON
+      
+    Turning replies into LinkRecords happens here, not in a redis-py response
+    callback, so the client's callbacks are never touched.
+    
+    The pipelines are not transactions - these are plain reads, there's 
+    nothing to gain from MULTI/EXEC but the overhead. Ids are fetched once 
+    each even if they show up several times, in chunks of chunk_size. 
+    
+    memo is an optional dictionary that lives for one request (see 
+    AppFactory), links found in it aren't fetched again.
+    
+    Returns a list with one entry per id, in the same order as raw_ids.
+    """
+    if fields is not None:
+        fields = tuple(fields)
+        
+    if memo is None:
+        memo = {}
+        
+    memo_keys, chunks_to_fetch = plan_hydrate(raw_ids, fields, memo, chunk_size, as_dicts)
+    
+    for chunk in chunks_to_fetch:
+        with connection.pipeline(transaction=False) as pipe:
+            queue_hydrate(pipe, chunk, fields)
+            result = pipe.execute()
+            
+        memo.update(zip(chunk, parse_hydrate(result, fields, as_dicts)))
+        
+    return [memo[x] for x in memo_keys]
+    
+    
+def iter_hydrate_links(connection, raw_ids, fields=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    hydrate_links for pages that are streamed: the links for batch_size of 
+    the ids at a time (a round trip each), so only one batch of them is held
+    at once. There's no memo, holding on to every link for the rest of the 
+    request is what this is for avoiding. With fields, links that are gone 
+    are left out.
+    """
+    if fields is not None:
+        fields = tuple(fields)
+        
+    for start in range(0, len(raw_ids), batch_size):
+        chunk = [(x, fields, False) for x in raw_ids[start:start+batch_size]]
+        
+        with connection.pipeline(transaction=False) as pipe:
+            queue_hydrate(pipe, chunk, fields)
+            result = pipe.execute()
+            
+        links = parse_hydrate(result, fields, False)
+        
+        if fields is not None:
+            links = [x for x in links if x is not None]
+            
+        yield links
+        
+        
 class LinkManager:
     
     def __init__(self, host="localhost", port=6379, db=0):
@@ -37,6 +485,8 @@ class LinkManager:
             port=self.port, 
             db=self.db)
         
+        self.retag_script = self.connection.register_script(RETAG_SCRIPT)
+        
 
     def prefix_key(self, raw_id):
         """Put the prefix on the key"""
@@ -57,8 +507,7 @@ class LinkManager:
     def add(self, page_title, desc_text, url_address, author, tags, created=None):
         """Add link to the database."""
         
-        if self.url_exists(url_address):
-            raise Exception("URL '%s' exists" % (url_address,))
+        normalized_url = normalize_url(url_address)
         
         raw_id, redis_key = self.key()
         
@@ -78,33 +527,48 @@ class LinkManager:
         if not tags:
             raise Exception('At least one tag must be provided.')
             
-        with self.connection.pipeline() as pipe:
+        # timedelta
+        score = created - BEGINNING_OF_TIME
         
-            pipe.hmset(redis_key, {
-                    'page_title': page_title, 
-                    'desc_text': desc_text, 
-                    'url_address': url_address,
-                    'key': raw_id,
-                    'author': author,
-                    'created': created.strftime(CREATED_TIME_FORMAT), 
-                    'tags': "|".join(tags)
-            })
-            
-            # timedelta
-            score = created - BEGINNING_OF_TIME
-            
-            for tag in tags:
-                tag_id = 'tag:%s' % (tag,)
-                pipe.zadd(tag_id, score.total_seconds(), raw_id)
-                
-            pipe.zadd("sorted:date", score.total_seconds(), raw_id)
-            
-            #because this is a set it will not add a duplicate
-            pipe.sadd("url_hold", url_address)
-            
-            pipe.execute()
-            
-        return raw_id
+        with self.connection.pipeline() as pipe:
+            while True:
+                try:
+                    # the url index is watched so two links with the same 
+                    # url can't both find it free.
+                    pipe.watch(URL_INDEX_KEY)
+                    
+                    if pipe.hget(URL_INDEX_KEY, normalized_url) is not None:
+                        raise Exception("URL '%s' exists" % (url_address,))
+                        
+                    pipe.multi()
+                    
+                    pipe.hset(redis_key, mapping={
+                            'page_title': page_title, 
+                            'desc_text': desc_text, 
+                            'url_address': url_address,
+                            'key': raw_id,
+                            'author': author,
+                            'created': created.strftime(CREATED_TIME_FORMAT), 
+                            'tags': "|".join(tags)
+                    })
+                    
+                    for tag in tags:
+                        tag_id = 'tag:%s' % (tag,)
+                        pipe.zadd(tag_id, {raw_id: score.total_seconds()})
+                        
+                    pipe.zadd("sorted:date", {raw_id: score.total_seconds()})
+                    
+                    pipe.hset(URL_INDEX_KEY, normalized_url, raw_id)
+                    
+                    record_change(pipe, "link", "add", raw_id)
+                    
+                    pipe.execute()
+                    
+                    return raw_id
+                    
+                except redis.WatchError:
+                    # another link's url went in meanwhile, look again.
+                    continue
         
         
     def delete(self, raw_id):
@@ -117,19 +581,37 @@ class LinkManager:
         tags = self.connection.hmget(self.prefix_key(raw_id), "tags")[0]
         tags = tags.split("|")
         
+        normalized = normalize_url(url_to_be_deleted)
+        
         # TODO: Consider adding a watch on the link key during deletion.
         # creating a pipeline with the connection and setting it to pipe.
         with self.connection.pipeline() as pipe:
-            #for a particular tag from the above tags, removing them from the link with this raw_id
-            for tag in tags:
-                pipe.zrem('tag:%s' % (tag,), raw_id)
-            
-            
-            # using the pipe, preforming the redis delete command on this raw_id.
-            pipe.delete(self.prefix_key(raw_id))
-            pipe.zrem("sorted:date", raw_id)
-            pipe.srem("url_hold", url_to_be_deleted)
-            pipe.execute() 
+            while True:
+                try:
+                    # the url is only taken out of the index if it's still this
+                    # link's, another link may have it (see url_owner).
+                    pipe.watch(URL_INDEX_KEY)
+                    owner = pipe.hget(URL_INDEX_KEY, normalized)
+                    
+                    pipe.multi()
+                    
+                    #for a particular tag from the above tags, removing them from the link with this raw_id
+                    for tag in tags:
+                        pipe.zrem('tag:%s' % (tag,), raw_id)
+                        
+                    # using the pipe, preforming the redis delete command on this raw_id.
+                    pipe.delete(self.prefix_key(raw_id))
+                    pipe.zrem("sorted:date", raw_id)
+                    
+                    if owner == raw_id:
+                        pipe.hdel(URL_INDEX_KEY, normalized)
+                        
+                    record_change(pipe, "link", "delete", raw_id)
+                    pipe.execute() 
+                    return
+                    
+                except redis.WatchError:
+                    continue
             
     def modify(self, raw_id, page_title=None, desc_text=None, url_address=None, author=None, created=None, tags=None):
         """Modify an existing link in the database."""
@@ -152,7 +634,6 @@ class LinkManager:
             fields['author'] = author
             
         if created is not None:
-            # TODO: update sorted set if this changes
             fields['created'] = created.strftime(CREATED_TIME_FORMAT)
             
         if tags is not None:
@@ -165,42 +646,426 @@ class LinkManager:
             fields['tags'] = "|".join(tags)
             
         if fields:
+            url_moved = False
+            
             if fields.get("url_address", None):
-                if url_to_be_modified != fields["url_address"]:
-                    if self.url_exists(url_address):
-                        raise Exception("URL '%s' exists" % (url_address,))
+                old_normalized = None
+                if url_to_be_modified is not None:
+                    old_normalized = normalize_url(url_to_be_modified)
+                    
+                new_normalized = normalize_url(fields["url_address"])
+                
+                if old_normalized != new_normalized:
+                    url_moved = True
                 
             # TODO: consider doing this in the pipeline and putting a watch on the
             #       link's key in case it changes during processing.
-            if fields.get("tags", None):
+            if fields.get("tags", None) or created is not None:
                 old_tags = self.connection.hmget(self.prefix_key(raw_id), 'tags')
                 old_tags = old_tags[0].split("|")
-                score = self.connection.zscore("sorted:date", raw_id)
+                
+                if created is not None:
+                    score = created_score(created)
+                else:
+                    score = self.connection.zscore("sorted:date", raw_id)
             else:
                 old_tags = []
                 score = None
             
             with self.connection.pipeline() as pipe:
-                pipe.hmset(self.prefix_key(raw_id), fields)
+                while True:
+                    try:
+                        if url_moved:
+                            # watched like in add, so two links can't both 
+                            # take the new url.
+                            pipe.watch(URL_INDEX_KEY)
+                        
+                            if pipe.hget(URL_INDEX_KEY, new_normalized) is not None:
+                                raise Exception("URL '%s' exists" % (url_address,))
+                                
+                            # and the old url only freed if it was this link's.
+                            if old_normalized is not None:
+                                old_owner = pipe.hget(URL_INDEX_KEY, old_normalized)
+                        
+                        pipe.multi()
+                        pipe.hset(self.prefix_key(raw_id), mapping=fields)
+                        
+                        if url_moved:
+                            if old_normalized is not None and old_owner == raw_id:
+                                pipe.hdel(URL_INDEX_KEY, old_normalized)
+                            pipe.hset(URL_INDEX_KEY, new_normalized, raw_id)
+                        
+                        if fields.get("tags", None):
+                            for existing_tag in old_tags:
+                                tag_key = 'tag:%s' % (existing_tag,)
+                                pipe.zrem(tag_key, raw_id)
+                        
+                            for tag in tags:
+                                tag_key = 'tag:%s' % (tag,)
+                                pipe.zadd(tag_key, {raw_id: score})
+                        
+                        elif created is not None:
+                            # same tags, new date - move the link within each of them.
+                            for existing_tag in old_tags:
+                                tag_key = 'tag:%s' % (existing_tag,)
+                                pipe.zadd(tag_key, {raw_id: score})
+                        
+                        if created is not None:
+                            pipe.zadd("sorted:date", {raw_id: score})
+                        
+                        record_change(pipe, "link", "modify", raw_id, fields=fields)
+                        
+                        return pipe.execute()
+                        
+                    except redis.WatchError:
+                        continue
+        else:
+            return None
+            
+        
+    def add_many(self, links, author=None):
+        """
+        Add a batch of links, each a dictionary of add()'s arguments 
+        (page_title, desc_text, url_address, author, tags, created).
+        
+        Everything is checked before anything is written: the urls are looked 
+        up in the url index with one HMGET, and urls repeated within the batch
+        are caught too. The links that pass are written BATCH_WRITE_SIZE at a
+        time, one transaction each, with their urls looked up once more under
+        WATCH first. author is used for links without one.
+        
+        Returns a result for every link, in order, see batch_result().
+        """
+        results = [None] * len(links)
+        checked = []
+        
+        for number, link in enumerate(links):
+            try:
+                checked.append((number, self._check_new_link(link, author)))
+            except (ValueError, TypeError) as e:
+                results[number] = batch_result(error=str(e))
                 
-                if fields.get("url_address", None):
-                    if url_to_be_modified != fields["url_address"]:
-                        pipe.srem("url_hold", url_to_be_modified)
-                        pipe.sadd("url_hold", fields["url_address"])
+        normalized = [x[1]['normalized_url'] for x in checked]
+        owners = self.connection.hmget(URL_INDEX_KEY, normalized) if normalized else []
+        
+        to_write = []
+        
+        # normalized url -> id, for the links in this batch
+        batch_urls = {}
+        batch_ids = set()
+        
+        for (number, link), owner in zip(checked, owners):
+            owner = owner or batch_urls.get(link['normalized_url'])
+            
+            if owner is not None:
+                results[number] = batch_result(
+                    error="URL '%s' exists" % (link['url_address'],), 
+                    key=owner)
+                continue
+                
+            raw_id, redis_key = self.key()
+            while raw_id in batch_ids:
+                raw_id, redis_key = self.key()
+                
+            batch_ids.add(raw_id)
+            batch_urls[link['normalized_url']] = raw_id
+            to_write.append((number, raw_id, link))
+            
+        for chunk in chunks(to_write, BATCH_WRITE_SIZE):
+            with self.connection.pipeline() as pipe:
+                while True:
+                    try:
+                        # looked up again with the url index watched, like 
+                        # add, in case one was taken since the lookup above.
+                        pipe.watch(URL_INDEX_KEY)
+                        owners = pipe.hmget(URL_INDEX_KEY, [x[2]['normalized_url'] for x in chunk])
+                        
+                        for (number, raw_id, link), owner in zip(chunk, owners):
+                            if owner is not None:
+                                results[number] = batch_result(
+                                    error="URL '%s' exists" % (link['url_address'],), 
+                                    key=owner)
+                                    
+                        chunk = [x for x, owner in zip(chunk, owners) if owner is None]
+                        
+                        pipe.multi()
+                        
+                        for number, raw_id, link in chunk:
+                            score = created_score(link['created'])
+                            
+                            pipe.hset(self.prefix_key(raw_id), mapping={
+                                'page_title': link['page_title'],
+                                'desc_text': link['desc_text'],
+                                'url_address': link['url_address'],
+                                'key': raw_id,
+                                'author': link['author'],
+                                'created': link['created'].strftime(CREATED_TIME_FORMAT),
+                                'tags': "|".join(link['tags'])
+                            })
+                            
+                            for tag in link['tags']:
+                                pipe.zadd('tag:%s' % (tag,), {raw_id: score})
+                                
+                            pipe.zadd("sorted:date", {raw_id: score})
+                            pipe.hset(URL_INDEX_KEY, link['normalized_url'], raw_id)
+                            record_change(pipe, "link", "add", raw_id)
+                            
+                        pipe.execute()
+                        break
+                        
+                    except redis.WatchError:
+                        continue
+                        
+            for number, raw_id, link in chunk:
+                results[number] = batch_result(key=raw_id)
+                
+        return results
+        
+    def _check_new_link(self, link, author):
+        """
+        Check one link for add_many, returns it cleaned up. Raises ValueError
+        or TypeError if something is wrong with it.
+        """
+        url_address = link.get('url_address')
+        
+        if not url_address:
+            raise ValueError('URL is a required field')
+            
+        created = link.get('created')
+        
+        if created is None:
+            created = datetime.now()
+        elif not isinstance(created, datetime):
+            created = datetime.strptime(created, CREATED_TIME_FORMAT)
+            
+        return {
+            'page_title': link.get('page_title') or '',
+            'desc_text': link.get('desc_text') or '',
+            'url_address': url_address,
+            'normalized_url': normalize_url(url_address),
+            'author': link.get('author') or author or '',
+            'created': created,
+            'tags': clean_tags(link.get('tags')),
+        }
+        
+    def delete_many(self, raw_ids):
+        """
+        Delete a batch of links. The links are read with one pipeline per 
+        BATCH_WRITE_SIZE ids and deleted with one transaction per 
+        BATCH_WRITE_SIZE ids.
+        
+        Returns a result for every id, in order, see batch_result().
+        """
+        results = []
+        
+        for chunk in chunks(raw_ids, BATCH_WRITE_SIZE):
+            with self.connection.pipeline(transaction=False) as pipe:
+                for raw_id in chunk:
+                    pipe.hmget(self.prefix_key(raw_id), "url_address", "tags")
                     
-                if fields.get("tags", None):
-                    for existing_tag in old_tags:
-                        tag_key = 'tag:%s' % (existing_tag,)
-                        pipe.zrem(tag_key, raw_id)
+                found = pipe.execute()
+                
+            with self.connection.pipeline() as pipe:
+                while True:
+                    try:
+                        self._delete_chunk(pipe, chunk, found)
+                        break
                         
-                    for tag in tags:
-                        tag_key = 'tag:%s' % (tag,)
-                        pipe.zadd(tag_key, score, raw_id)
-               
-                return pipe.execute()
+                    except redis.WatchError:
+                        continue
+                        
+            for raw_id, (url_address, tags) in zip(chunk, found):
+                if url_address is None:
+                    results.append(batch_result(error="Link not found", key=raw_id))
+                else:
+                    results.append(batch_result(key=raw_id))
+                    
+        return results
+        
+    def _delete_chunk(self, pipe, chunk, found):
+        """
+        One chunk of delete_many, found being the links' (url_address, tags).
+        Like delete, a url is only taken out of the index if it's still the 
+        link's, looked up with the index watched.
+        """
+        urls = [normalize_url(url_address) if url_address is not None else None 
+                for url_address, tags in found]
+        
+        present = [x for x in urls if x is not None]
+        
+        pipe.watch(URL_INDEX_KEY)
+        owners = dict(zip(present, pipe.hmget(URL_INDEX_KEY, present))) if present else {}
+        
+        deleted = set()
+        
+        pipe.multi()
+        
+        for raw_id, (url_address, tags), normalized in zip(chunk, found, urls):
+            if url_address is None or raw_id in deleted:
+                continue
+                
+            deleted.add(raw_id)
+            
+            for tag in (tags or "").split("|"):
+                pipe.zrem('tag:%s' % (tag,), raw_id)
+                
+            pipe.delete(self.prefix_key(raw_id))
+            pipe.zrem("sorted:date", raw_id)
+            
+            if owners.get(normalized) == raw_id:
+                pipe.hdel(URL_INDEX_KEY, normalized)
+                
+            record_change(pipe, "link", "delete", raw_id)
+            
+        if deleted:
+            pipe.execute()
         else:
-            return None
+            pipe.reset()
+            
+    def retag_many(self, raw_ids, add=(), remove=()):
+        """
+        Add the tags in add to, and take the tags in remove off, a batch of 
+        links, e.g. retag_many(ids, add=['python'], remove=['pyhton']).
+        
+        A link has to be left with at least one tag. Reads and writes are done
+        BATCH_WRITE_SIZE links at a time like delete_many, with the links 
+        watched from before their tags are read until they're written.
+        
+        Returns a result for every id, in order, see batch_result().
+        """
+        if isinstance(add, str) or isinstance(remove, str):
+            raise TypeError('Tags must be a list, set, tuple, etc.')
+            
+        add = {x.strip() for x in add if x.strip()}
+        remove = {x.strip() for x in remove if x.strip()}
+        
+        results = []
+        
+        for chunk in chunks(raw_ids, BATCH_WRITE_SIZE):
+            with self.connection.pipeline() as pipe:
+                while True:
+                    try:
+                        chunk_results = self._retag_chunk(pipe, chunk, add, remove)
+                        break
+                        
+                    except redis.WatchError:
+                        continue
+                        
+            results.extend(chunk_results)
             
+        return results
+        
+    def _retag_chunk(self, pipe, chunk, add, remove):
+        """
+        One chunk of retag_many. The links are watched on pipe's connection 
+        before their tags are read (in one round trip on another), so if one 
+        is edited before the writes the transaction raises WatchError and the 
+        chunk is done again.
+        """
+        results = []
+        
+        pipe.watch(*[self.prefix_key(x) for x in chunk])
+        
+        with self.connection.pipeline(transaction=False) as reads:
+            for raw_id in chunk:
+                reads.hget(self.prefix_key(raw_id), "tags")
+                reads.zscore("sorted:date", raw_id)
+                
+            found = reads.execute()
+            
+        changed = set()
+        
+        pipe.multi()
+        
+        for raw_id, tags, score in zip(chunk, found[0::2], found[1::2]):
+            if tags is None:
+                results.append(batch_result(error="Link not found", key=raw_id))
+                continue
+                
+            old_tags = set(tags.split("|"))
+            new_tags = (old_tags - remove) | add
+            
+            if not new_tags:
+                results.append(batch_result(
+                    error='At least one tag must be provided.', key=raw_id))
+                continue
+                
+            results.append(batch_result(key=raw_id))
+            
+            if new_tags == old_tags or raw_id in changed:
+                continue
+                
+            changed.add(raw_id)
+            
+            pipe.hset(self.prefix_key(raw_id), 'tags', "|".join(sorted(new_tags)))
+            
+            for tag in old_tags - new_tags:
+                pipe.zrem('tag:%s' % (tag,), raw_id)
+                
+            if score is not None:
+                for tag in new_tags - old_tags:
+                    pipe.zadd('tag:%s' % (tag,), {raw_id: score})
+                    
+            record_change(pipe, "link", "modify", raw_id, fields=['tags'])
+            
+        if changed:
+            pipe.execute()
+        else:
+            pipe.reset()
+            
+        return results
+        
+    def rename_tag(self, old, new, batch_size=RETAG_BATCH_SIZE):
+        """
+        Rename a tag on every link that has it, see merge_tags.
+        """
+        return self.merge_tags([old], new, batch_size=batch_size)
+        
+    def merge_tags(self, tags, into, batch_size=RETAG_BATCH_SIZE):
+        """
+        Replace each of tags with the tag into on every link, e.g. 
+        merge_tags(['pyhton', 'py'], 'python').
+        
+        The tag sets are combined in one ZUNIONSTORE, so listings by into are
+        complete straight away. The links' tags fields are then rewritten 
+        batch_size links at a time by RETAG_SCRIPT, which is atomic, so links
+        edited at the same time are safe. Running it again after an 
+        interruption picks up where it stopped.
+        
+        Returns the number of tags replaced (a link with two of tags counts 
+        twice).
+        """
+        into = into.strip()
+        tags = [x.strip() for x in tags if x.strip() != into]
+        
+        for tag in tags + [into]:
+            if not tag or "|" in tag:
+                raise ValueError("'%s' can't be used as a tag" % (tag,))
+                
+        if not tags:
+            return 0
+            
+        target = 'tag:%s' % (into,)
+        sources = ['tag:%s' % (x,) for x in tags]
+        
+        # the scores are the same in every set, MAX just keeps them.
+        self.connection.zunionstore(target, [target] + sources, "MAX")
+        
+        retagged = 0
+        
+        for tag, source in zip(tags, sources):
+            while True:
+                looked_at, done = self.retag_script(
+                    keys=[source, target, CHANGES_KEY],
+                    args=[tag, into, batch_size, MAX_CHANGES, self.prefix_key("")],
+                    client=self.connection)
+                
+                retagged += done
+                
+                if looked_at < batch_size:
+                    break
+                    
+        return retagged
         
     def url_changed(self, raw_id, url_address):
         
@@ -212,19 +1077,24 @@ class LinkManager:
             return False
         
         
-    def list_one(self, raw_id, tag_func=None):
+    def list_one(self, raw_id, fields=None, memo=None):
         """Retrieves a single link from the database
         
+           If fields is given, only those fields are fetched (HMGET) and the 
+           link comes back as a LinkRecord, or None if it doesn't exist.
+           
+           See hydrate_links for memo.
+        
            TODO: shouldn't return a list"""
-        with self.connection.pipeline() as pipe:
-            if tag_func:
-                pipe.set_response_callback('HGETALL', tag_func)
-            
-            pipe.hgetall(self.prefix_key(raw_id))
-            
-            result = pipe.execute()
-            
-            return result
+        return hydrate_links(self.connection, [raw_id], fields=fields, memo=memo)
+        
+    def list_many(self, raw_ids, fields=None, memo=None, as_dicts=False):
+        """
+        The links with the given ids, in the same order, see hydrate_links.
+        Unlike listing, links that don't exist are left in (as None when 
+        fields is given) so the results line up with raw_ids.
+        """
+        return hydrate_links(self.connection, raw_ids, fields=fields, memo=memo, as_dicts=as_dicts)
         
     def _tag_intersect(self, tags, command, start=0, stop=-1):
         """
@@ -273,9 +1143,14 @@ class LinkManager:
             
         
         
-    def listing(self, *tags, tag_func=None, start=0, stop=-1):
+    def listing(self, *tags, start=0, stop=-1, fields=None, memo=None):
         """Retrieving a list of links from database.
         
+            If fields is given (e.g. LINK_FIELDS, or just ('key', 'page_title'))
+            only those fields are fetched, using HMGET instead of HGETALL, and 
+            the links come back as LinkRecord objects. Links that disappeared 
+            in the meantime are left out. See hydrate_links for memo.
+        
             TODO: Change the name listing to something that describes more than one.
             This sounds like a single listing like in the newspaper.
             
@@ -288,24 +1163,59 @@ class LinkManager:
             # keys = self.connection.keys("link:*")
             raw_ids = self.connection.zrevrange("sorted:date", start, stop)
             
-        keys = [self.prefix_key(x) for x in raw_ids]
+        links = hydrate_links(self.connection, raw_ids, fields=fields, memo=memo)
         
-        # TODO: Should we turn off transactions for this pipeline?
-        with self.connection.pipeline() as pipe:
-            # should restrict using this special function that returns a LinkWrapper
-            # to just this pipeline - when it's gone (when we exit the 'with' block
-            # below), subsequent calls to hgetall should work as expected.
-            if tag_func:
-                pipe.set_response_callback('HGETALL', tag_func)
+        if fields is not None:
+            links = [x for x in links if x is not None]
+            
+        return links
             
+    def iter_listing(self, *tags, start=0, stop=-1, fields=None, batch_size=STREAM_BATCH_SIZE):
+        """
+        listing a batch of links at a time, see iter_hydrate_links. The ids
+        are all read first, so the batches are of the same links whatever 
+        changes in the meantime.
+        """
+        if tags:
+            raw_ids = self._tag_intersect(tags, 'keys', start=start, stop=stop)
+        else:
+            raw_ids = self.connection.zrevrange("sorted:date", start, stop)
             
-            for key in keys:
-                pipe.hgetall(key)
+        return iter_hydrate_links(self.connection, raw_ids, fields=fields, batch_size=batch_size)
+        
+    def page(self, *tags, cursor=None, count=20, fields=None, memo=None, as_dicts=False):
+        """
+        One page of links, newest first, like listing but with a cursor 
+        instead of start/stop (see make_cursor).
+        
+        Returns (links, cursor for the next page or None).
+        """
+        with self.connection.pipeline() as pipe:
+            if len(tags) > 1:
+                key = "tag:%s:sorted" % ("|".join(tags))
+                pipe.zinterstore(key, ['tag:%s' % (x,) for x in tags], "MAX")
+            elif tags:
+                key = 'tag:%s' % (tags[0],)
+            else:
+                key = "sorted:date"
                 
-            result = pipe.execute()
+            needed = queue_page(pipe, key, cursor, count)
             
-            return result
+            if len(tags) > 1:
+                pipe.delete(key)
+                replies = pipe.execute()[1:needed+1]
+            else:
+                replies = pipe.execute()
+                
+        raw_ids, next_cursor = page_from_replies(replies, cursor, count)
+        
+        links = hydrate_links(self.connection, raw_ids, fields=fields, memo=memo, as_dicts=as_dicts)
+        
+        if fields is not None:
+            links = [x for x in links if x is not None]
             
+        return links, next_cursor
+        
     def exists(self, raw_id):
         """
         Return True if there is a link in the database with the given id.
@@ -316,10 +1226,112 @@ class LinkManager:
         """
         Return True if there is a link in the database with the given url
         """
-        if self.connection.sismember("url_hold", url_address):
+        if self.url_owner(url_address) is not None:
             return True
         else:
             return False
+            
+    def url_owner(self, url_address):
+        """
+        Return the id of the link already using the given url, or None.
+        
+        Urls are compared in their normalized form, see normalize_url().
+        """
+        return self.connection.hget(URL_INDEX_KEY, normalize_url(url_address))
+        
+    def rebuild_url_index(self, batch_size=1000):
+        """
+        Build the url index from scratch out of the existing link hashes.
+        
+        The url_hold set the index replaces is removed. See rebuild_indexes.
+        """
+        return self.rebuild_indexes(batch_size, urls_only=True)
+        
+    def rebuild_indexes(self, batch_size=1000, urls_only=False):
+        """
+        Rebuild the indexes from the link hashes in one pass over them: the url
+        index and (unless urls_only) the tag:* and sorted:date sorted sets.
+        
+        The new url index is built under a temporary key and swapped in with 
+        RENAME, so the old one keeps answering until it is done. Links are 
+        only added to tag:* and sorted:date if they aren't there already (ZADD
+        NX), using the created field for the score, so existing scores are 
+        left alone. Nothing is removed from them.
+        
+        Returns the number of links indexed and a list of 
+        (normalized url, kept id, duplicate id) for links sharing a url - the 
+        first one seen keeps the url.
+        
+        NOTE: links added while this runs may be missed by the url index, run
+        it again (or when things are quiet) if that matters.
+        """
+        temp_key = "%s:rebuild" % (URL_INDEX_KEY,)
+        indexed = 0
+        duplicates = []
+        
+        self.connection.delete(temp_key)
+        
+        batch = []
+        for redis_key in self.connection.scan_iter(self.prefix_key("*"), count=batch_size):
+            batch.append(redis_key)
+            
+            if len(batch) >= batch_size:
+                indexed += self._index_links(temp_key, batch, duplicates, urls_only)
+                batch = []
+                
+        if batch:
+            indexed += self._index_links(temp_key, batch, duplicates, urls_only)
+            
+        with self.connection.pipeline() as pipe:
+            if indexed:
+                pipe.rename(temp_key, URL_INDEX_KEY)
+            else:
+                pipe.delete(URL_INDEX_KEY)
+                
+            pipe.delete("url_hold")
+            pipe.execute()
+        
+        return indexed, duplicates
+        
+    def _index_links(self, index_key, redis_keys, duplicates, urls_only):
+        """
+        Helper for rebuild_indexes, indexes one batch of links.
+        """
+        with self.connection.pipeline(transaction=False) as pipe:
+            for redis_key in redis_keys:
+                pipe.hmget(redis_key, "key", "url_address", "tags", "created")
+                
+            links = [x for x in pipe.execute() if x[0] and x[1]]
+            
+        with self.connection.pipeline(transaction=False) as pipe:
+            for raw_id, url_address, tags, created in links:
+                pipe.hsetnx(index_key, normalize_url(url_address), raw_id)
+                
+            for raw_id, url_address, tags, created in links:
+                if urls_only or not created:
+                    continue
+                    
+                score = created_score(datetime.strptime(created, CREATED_TIME_FORMAT))
+                
+                pipe.zadd("sorted:date", {raw_id: score}, nx=True)
+                
+                for tag in (tags or "").split("|"):
+                    if tag:
+                        pipe.zadd('tag:%s' % (tag,), {raw_id: score}, nx=True)
+                
+            added = pipe.execute()[:len(links)]
+            
+        conflicts = [link for link, new in zip(links, added) if not new]
+        
+        if conflicts:
+            owners = self.connection.hmget(
+                index_key, 
+                [normalize_url(x[1]) for x in conflicts])
+            
+            for (raw_id, url_address, tags, created), owner in zip(conflicts, owners):
+                duplicates.append((normalize_url(url_address), owner, raw_id))
+            
+        return len(links)
         
         
 class ReadingListManager:
@@ -341,28 +1353,33 @@ class ReadingListManager:
         
     def key(self, user):
         """
-        Generating the redis key for a user reading list.
+        Generating the redis key for the links on a user's reading list that 
+        they haven't read yet (scored by when they were added).
         """
-        return "list:{}".format(user)
+        return "unread:{}".format(user)
         
         
     def key_read(self, user):
         """
-        Generating the redis key for the list of links that the user has read.
+        Generating the redis key for the links on a user's reading list that 
+        they have read (scored by when they were marked read).
         """
-        return "list-read:{}".format(user)
+        return "read:{}".format(user)
         
     def add(self, user, link_id):
         """
         Add link to existing reading list.
+        
+        Adding a link that was already read puts it back on the unread list.
         """
         
         created = datetime.now()
         score = created - BEGINNING_OF_TIME
         
         with self.connection.pipeline() as pipe:
-            pipe.zadd(self.key(user), score.total_seconds(), link_id)
-            pipe.srem(self.key_read(user), link_id)
+            pipe.zadd(self.key(user), {link_id: score.total_seconds()})
+            pipe.zrem(self.key_read(user), link_id)
+            record_change(pipe, "reading_list", "add", link_id, user=user)
             
             pipe.execute()
             
@@ -370,17 +1387,55 @@ class ReadingListManager:
     def read(self, user, link_id):
         """
         Mark a link as read.
+        
+        Returns False if the link isn't on the user's unread list.
         """
         
-        self.connection.sadd(self.key_read(user), link_id)
+        return self._move(self.key(user), self.key_read(user), link_id, 
+                          user, "read")
         
         
     def unread(self, user, link_id):
         """
         Mark a link as unread.
+        
+        Returns False if the link isn't on the user's read list.
+        """
+        
+        return self._move(self.key_read(user), self.key(user), link_id,
+                          user, "unread")
+        
+        
+    def _move(self, from_key, to_key, link_id, user, action):
         """
+        Move a link from one of a user's lists to the other, scored now.
         
-        self.connection.srem(self.key_read(user), link_id)
+        The move only happens if the link is on from_key, which is watched so
+        a concurrent add/remove can't be undone by it.
+        """
+        
+        created = datetime.now()
+        score = created - BEGINNING_OF_TIME
+        
+        with self.connection.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(from_key)
+                    
+                    if pipe.zscore(from_key, link_id) is None:
+                        return False
+                        
+                    pipe.multi()
+                    pipe.zrem(from_key, link_id)
+                    pipe.zadd(to_key, {link_id: score.total_seconds()})
+                    record_change(pipe, "reading_list", action, link_id, user=user)
+                    pipe.execute()
+                    
+                    return True
+                    
+                except redis.WatchError:
+                    # the list changed under us, have another look.
+                    continue
         
         
     def remove(self, user, link_id):
@@ -389,63 +1444,98 @@ class ReadingListManager:
         """
         
         with self.connection.pipeline() as pipe:
-            pipe.srem(self.key_read(user), link_id)
+            pipe.zrem(self.key_read(user), link_id)
             pipe.zrem(self.key(user), link_id)
+            record_change(pipe, "reading_list", "remove", link_id, user=user)
         
             pipe.execute()
+            
+            
+    def count(self, user, read=False):
+        """
+        Count the links on a user's unread list, or read list if read is True.
+        """
         
+        if read:
+            return self.connection.zcard(self.key_read(user))
+        else:
+            return self.connection.zcard(self.key(user))
         
-    def to_read(self, user, tag_func=None):   
         
-        key = self.key(user)
-        key_read = self.key_read(user)
+    def to_read(self, user, start=0, stop=-1, fields=None, memo=None):
+        """
+        Links on the user's list they haven't read, newest first.
         
-        with self.connection.pipeline() as pipe:
-            temp_key = "to-read:{}:temp".format(user)
-            pipe.zunionstore(temp_key, {key:1, key_read:0}, "MIN")
-            pipe.zrangebyscore(temp_key, 1, "+inf")
-            
-            pipe.delete(temp_key)
-            
-            result = pipe.execute()
+        start and stop work like they do for LinkManager.listing.
+        """
+        
+        raw_ids = self.connection.zrevrange(self.key(user), start, stop)
+        
+        return self._links(raw_ids, fields, memo)
             
-            keys = ["link:{}".format(x) for x in result[1]] 
             
-        with self.connection.pipeline() as pipe:
-            if tag_func:
-                pipe.set_response_callback('HGETALL', tag_func)
+    def iter_to_read(self, user, start=0, stop=-1, fields=None, batch_size=STREAM_BATCH_SIZE):
+        """
+        to_read a batch of links at a time, see iter_hydrate_links.
+        """
+        raw_ids = self.connection.zrevrange(self.key(user), start, stop)
+        
+        return iter_hydrate_links(self.connection, raw_ids, fields=fields, batch_size=batch_size)
+        
+    def iter_all_to_read(self, user, fields=None, batch_size=STREAM_BATCH_SIZE):
+        """
+        Every link on the user's list they haven't read, newest first, a 
+        batch at a time. Goes through the list with page()'s cursor, so
+        neither the ids nor the links are all held at once however long the
+        list is, and links added or read meanwhile don't shift the rest.
+        """
+        cursor = None
+        
+        while True:
+            links, cursor = self.page(user, cursor=cursor, count=batch_size, fields=fields)
             
-            for key in keys:
-                pipe.hgetall(key)
+            if links:
+                yield links
                 
-            result = pipe.execute()
+            if cursor is None:
+                break
             
-            return result
-            
-            
-    def been_read(self, user, tag_func=None):   
+    def been_read(self, user, start=0, stop=-1, fields=None, memo=None):
+        """
+        Links on the user's list they have read, most recently read first.
+        """
         
-        key = self.key(user)
-        key_read = self.key_read(user)
+        raw_ids = self.connection.zrevrange(self.key_read(user), start, stop)
         
-        with self.connection.pipeline() as pipe: 
-            temp_key = "been-read:{}:temp".format(user)
-            pipe.zunionstore(temp_key, {key:0, key_read:1}, "MIN")
-            pipe.zrangebyscore(temp_key, 1, "+inf")
+        return self._links(raw_ids, fields, memo)
             
-            pipe.delete(temp_key)
             
-            result = pipe.execute()
+    def page(self, user, cursor=None, count=20, read=False, fields=None, memo=None, 
+             as_dicts=False):
+        """
+        One page of the user's unread list (read list if read is True), with a
+        cursor like LinkManager.page.
+        
+        Returns (links, cursor for the next page or None).
+        """
+        key = self.key_read(user) if read else self.key(user)
+        
+        with self.connection.pipeline(transaction=False) as pipe:
+            queue_page(pipe, key, cursor, count)
+            replies = pipe.execute()
             
-            keys = ["link:{}".format(x) for x in result[1]] 
+        raw_ids, next_cursor = page_from_replies(replies, cursor, count)
+        
+        return self._links(raw_ids, fields, memo, as_dicts), next_cursor
             
-        with self.connection.pipeline() as pipe:
-            if tag_func:
-                pipe.set_response_callback('HGETALL', tag_func)
             
-            for key in keys:
-                pipe.hgetall(key)
-                
-            result = pipe.execute()
+    def _links(self, raw_ids, fields, memo, as_dicts=False):
+        """
+        Turn the ids on a list into links, see hydrate_links.
+        """
+        links = hydrate_links(self.connection, raw_ids, fields=fields, memo=memo, as_dicts=as_dicts)
+        
+        if fields is not None:
+            links = [x for x in links if x is not None]
             
-            return result
\ No newline at end of file
+        return links
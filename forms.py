@@ -0,0 +1,232 @@
+"""
+Module for reading the forms pages POST, instead of cgi.FieldStorage.
+
+cgi is deprecated (and gone in Python 3.13), and FieldStorage reads as much
+body as the client sends. parse_form reads the body a chunk at a time, up to
+a limit, and only keeps the fields it's asked for:
+
+    >>> form = parse_form(environ, ('page_title', 'desc_text'), max_bytes=65536)
+    >>> form.get('page_title')
+    'Something'
+
+Both application/x-www-form-urlencoded and multipart/form-data are read.
+Values are str, the first one wins if a field is sent more than once, and
+fields that weren't sent are missing. A body with a CONTENT_LENGTH over the
+limit raises FormTooLarge before any of it is read (the pages send a 413).
+Nothing past CONTENT_LENGTH is ever read, so a client sending more than it
+said can't get more than the limit in either. Something that isn't a form
+raises FormError (a 400).
+"""
+
+import re
+from urllib.parse import unquote_plus
+
+MAX_FORM_BYTES = 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+URLENCODED = 'application/x-www-form-urlencoded'
+MULTIPART = 'multipart/form-data'
+
+
+class FormError(ValueError):
+    """
+    The body isn't a form we can read.
+    """
+
+
+class FormTooLarge(FormError):
+    """
+    The body is longer than the limit.
+    """
+    def __init__(self, limit):
+        super().__init__("the form is over %s bytes" % (limit,))
+        self.limit = limit
+
+
+def content_type(environ):
+    """
+    The content type and its parameters, e.g. ('multipart/form-data',
+    {'boundary': '...'})
+    """
+    parts = environ.get('CONTENT_TYPE', '').split(';')
+    params = {}
+
+    for part in parts[1:]:
+        name, equals, value = part.strip().partition('=')
+
+        if equals:
+            params[name.strip().lower()] = value.strip().strip('"')
+
+    return parts[0].strip().lower(), params
+
+
+def body_chunks(environ, max_bytes):
+    """
+    The body, CHUNK_SIZE bytes at a time, never more than CONTENT_LENGTH.
+    """
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        raise FormError("bad content length")
+
+    if length > max_bytes:
+        raise FormTooLarge(max_bytes)
+
+    body = environ['wsgi.input']
+
+    while length > 0:
+        chunk = body.read(min(CHUNK_SIZE, length))
+
+        if not chunk:
+            break
+
+        length -= len(chunk)
+        yield chunk
+
+
+def parse_form(environ, fields, max_bytes=MAX_FORM_BYTES):
+    """
+    The fields asked for from the POSTed form, see the module docs.
+    """
+    kind, params = content_type(environ)
+    fields = frozenset(fields)
+
+    if kind == MULTIPART:
+        if not params.get('boundary'):
+            raise FormError("multipart without a boundary")
+
+        return parse_multipart(body_chunks(environ, max_bytes), params['boundary'].encode('latin-1'), fields)
+
+    elif kind == URLENCODED or kind == '':
+        return parse_urlencoded(body_chunks(environ, max_bytes), fields)
+
+    else:
+        raise FormError("not a form: %s" % (kind,))
+
+
+def parse_urlencoded(chunks, fields):
+    form = {}
+    rest = b''
+
+    for chunk in chunks:
+        pairs = (rest + chunk).split(b'&')
+
+        # the last one might carry on in the next chunk.
+        rest = pairs.pop()
+
+        for pair in pairs:
+            add_pair(form, pair, fields)
+
+    add_pair(form, rest, fields)
+
+    return form
+
+
+def add_pair(form, pair, fields):
+    if not pair:
+        return
+
+    name, equals, value = pair.partition(b'=')
+    name = unquote_plus(name.decode('latin-1'))
+
+    # only the fields asked for get their values decoded.
+    if name in fields and name not in form:
+        form[name] = unquote_plus(value.decode('latin-1'), encoding='utf-8', errors='replace')
+
+
+DISPOSITION_PARAM = re.compile(r';\s*(\w+)="((?:[^"\\]|\\.)*)"|;\s*(\w+)=([^;\s]*)')
+
+
+def disposition(headers):
+    """
+    The name and filename from a part's headers (bytes, "\r\n" separated).
+    """
+    for line in headers.decode('utf-8', 'replace').split('\r\n'):
+        name, colon, value = line.partition(':')
+
+        if name.strip().lower() != 'content-disposition':
+            continue
+
+        params = {}
+
+        for quoted_name, quoted, bare_name, bare in DISPOSITION_PARAM.findall(value):
+            params[(quoted_name or bare_name).lower()] = quoted.replace('\\"', '"') if quoted_name else bare
+
+        return params.get('name'), params.get('filename')
+
+    return None, None
+
+
+def parse_multipart(chunks, boundary, fields):
+    """
+    multipart/form-data, keeping only the bytes of the parts asked for.
+    Uploaded files are skipped, none of the pages take one.
+    """
+    form = {}
+    delimiter = b'\r\n--' + boundary
+
+    # starting as if just after a "\r\n", so the first delimiter matches too.
+    buffered = b'\r\n'
+    state = 'preamble'
+    wanted = None
+    value = []
+
+    chunks = iter(chunks)
+    finished = False
+
+    while True:
+        if state == 'headers':
+            end = buffered.find(b'\r\n\r\n')
+
+            if end >= 0:
+                name, filename = disposition(buffered[:end])
+                buffered = buffered[end + 4:]
+
+                wanted = name if name in fields and name not in form and filename is None else None
+                value = []
+                state = 'body'
+                continue
+
+        elif state in ('preamble', 'body'):
+            end = buffered.find(delimiter)
+
+            if end >= 0:
+                if state == 'body' and wanted is not None:
+                    value.append(buffered[:end])
+                    form[wanted] = b''.join(value).decode('utf-8', 'replace')
+
+                buffered = buffered[end + len(delimiter):]
+                state = 'after_delimiter'
+                continue
+
+            # keep enough to find a delimiter split across chunks.
+            keep = len(delimiter) - 1
+
+            if len(buffered) > keep:
+                if state == 'body' and wanted is not None:
+                    value.append(buffered[:-keep])
+
+                buffered = buffered[-keep:]
+
+        elif state == 'after_delimiter':
+            if len(buffered) >= 2:
+                if buffered.startswith(b'--'):
+                    return form
+
+                line_end = buffered.find(b'\r\n')
+
+                if line_end >= 0:
+                    buffered = buffered[line_end + 2:]
+                    state = 'headers'
+                    continue
+
+        if finished:
+            raise FormError("the multipart body ended early")
+
+        chunk = next(chunks, None)
+
+        if chunk is None:
+            finished = True
+        else:
+            buffered += chunk
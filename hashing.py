@@ -0,0 +1,174 @@
+"""
+Module for hashing and checking passwords in a pool of processes.
+
+pbkdf2 is slow on purpose, and done inline a burst of logins keeps every
+worker busy hashing while cheap requests (listings) wait behind them. A
+HashPool does the work in its own processes, one per core by default, and
+only lets max_queue calls wait for it at a time: past that it raises
+PoolBusy straight away, which the apps turn into a 503 with a Retry-After
+header, rather than letting requests pile up.
+
+It keeps count of how long calls waited for a free process, see
+HashPool.stats().
+
+Using one is optional, pass it to UserManager (or to AppFactory):
+
+    >>> from hashing import HashPool
+    >>> app = AppFactory(hash_pool=HashPool())
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.hash import pbkdf2_sha256
+
+# how many of the latest wait times stats() works out percentiles from.
+RECENT_WAITS = 1000
+
+
+class PoolBusy(Exception):
+    """
+    Raised when a HashPool already has as many calls waiting as it allows.
+    retry_after is a guess at how many seconds until there's room.
+    """
+    def __init__(self, retry_after):
+        super().__init__("password hashing is busy, retry after %ss" % (retry_after,))
+        self.retry_after = retry_after
+
+
+def hash_password(password):
+    """
+    Runs in a pool process, returns the hash and when it started.
+    """
+    started = time.time()
+    return pbkdf2_sha256.hash(password), started
+
+
+def verify_password(password, hashed):
+    started = time.time()
+    return pbkdf2_sha256.verify(password, hashed), started
+
+
+class HashPool:
+    """
+    A process pool for pbkdf2_sha256.hash and verify, with a limit on how
+    many calls can be waiting (see the module docs).
+    """
+    def __init__(self, workers=None, max_queue=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue or self.workers * 4
+
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.done = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.total_work = 0.0
+        self.max_wait = 0.0
+        self.recent_waits = deque(maxlen=RECENT_WAITS)
+
+    def submit(self, function, *args):
+        """
+        Run function(*args) in the pool, returns something with a result()
+        method that can also be awaited. Raises PoolBusy if max_queue calls
+        are waiting.
+
+        function must return (result, time it started), like hash_password
+        and verify_password, the result is just the first of those.
+        """
+        with self.lock:
+            if self.pending >= self.max_queue:
+                self.rejected += 1
+                raise PoolBusy(self.retry_after())
+
+            self.pending += 1
+
+        submitted = time.time()
+        future = self.executor.submit(function, *args)
+
+        def finished(done_future):
+            with self.lock:
+                self.pending -= 1
+
+                if done_future.cancelled() or done_future.exception() is not None:
+                    return
+
+                result, started = done_future.result()
+                wait = max(0.0, started - submitted)
+
+                self.done += 1
+                self.total_wait += wait
+                self.total_work += time.time() - started
+                self.max_wait = max(self.max_wait, wait)
+                self.recent_waits.append(wait)
+
+        future.add_done_callback(finished)
+
+        return _ResultFuture(future)
+
+    def hash(self, password):
+        """
+        pbkdf2_sha256.hash, in the pool.
+        """
+        return self.submit(hash_password, password).result()
+
+    def verify(self, password, hashed):
+        """
+        pbkdf2_sha256.verify, in the pool.
+        """
+        return self.submit(verify_password, password, hashed).result()
+
+    def retry_after(self):
+        """
+        Seconds until the queue should have drained, at least 1. Call with
+        the lock held.
+        """
+        if not self.done:
+            return 1
+
+        per_call = self.total_work / self.done
+        return max(1, math.ceil(self.pending * per_call / self.workers))
+
+    def stats(self):
+        """
+        How the pool is doing: calls done and turned away, how many are
+        waiting now, and how long calls waited for a process (seconds).
+        """
+        with self.lock:
+            waits = sorted(self.recent_waits)
+
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'pending': self.pending,
+                'done': self.done,
+                'rejected': self.rejected,
+                'mean_wait': self.total_wait / self.done if self.done else 0.0,
+                'max_wait': self.max_wait,
+                'p99_wait': waits[min(len(waits) - 1, int(len(waits) * 0.99))] if waits else 0.0,
+            }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+class _ResultFuture:
+    """
+    Wraps a Future for (result, started) so result() gives just the result.
+    """
+    def __init__(self, future):
+        self.future = future
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)[0]
+
+    def __await__(self):
+        result = yield from asyncio.wrap_future(self.future).__await__()
+        return result[0]
@@ -0,0 +1,558 @@
+"""
+Module for the app's metrics, served at /metrics in the Prometheus text
+format.
+
+gunicorn runs several worker processes, and a scrape lands on just one of
+them, so each process keeps its numbers in its own file in a shared
+directory (<pid>.db, a memory mapped array of doubles with an index of what
+each one is) and /metrics adds up the files of every process. Counters and
+histograms are kept for processes that have gone (a restarted worker's
+requests still happened), gauges only for the ones still running. Empty the
+directory when starting the server.
+
+Recording a sample is a dictionary lookup and adding to a double in the
+map, under a lock taken once per request, see benchmarks/metrics_overhead.py.
+
+    >>> metrics = Metrics("/run/linkapp-metrics")
+    >>> app = AppFactory(metrics=metrics)
+
+Without a directory the numbers are kept in memory, for one process. The
+module level wsgilinkapp.app uses the directory in LINKAPP_METRICS_DIR, if
+that's set.
+"""
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import weakref
+
+from tracing import BUCKETS, ResponseBody, route_name
+
+ENVIRONMENT_VARIABLE = "LINKAPP_METRICS_DIR"
+
+HEADER = struct.Struct('<Q')
+KEY_LENGTH = struct.Struct('<I')
+DOUBLE = struct.Struct('<d')
+
+INITIAL_SIZE = 64 * 1024
+
+# seconds between looking at the redis connection pools
+POOL_INTERVAL = 1.0
+
+
+class ValueFile:
+    """
+    Doubles in a buffer (a memory mapped file, or a bytearray if path is
+    None) with the keys they're for. The layout is the number of bytes used,
+    then entries of key length, key (padded to 8 bytes) and value. values
+    is the buffer as doubles, position() gives a key's index in it.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.positions = {}
+        self.lock = threading.Lock()
+
+        if path is None:
+            self.file = None
+            self.buffer = bytearray(INITIAL_SIZE)
+        else:
+            self.file = open(path, 'w+b')
+            self.file.truncate(INITIAL_SIZE)
+            self.buffer = mmap.mmap(self.file.fileno(), INITIAL_SIZE)
+
+        self.values = memoryview(self.buffer).cast('d')
+        self.used = HEADER.size
+        HEADER.pack_into(self.buffer, 0, self.used)
+
+    def position(self, key):
+        """
+        Where key's value is in values, adding it (as 0) if it's new.
+        """
+        with self.lock:
+            if key in self.positions:
+                return self.positions[key]
+
+            encoded = key.encode('utf-8')
+            padded = KEY_LENGTH.size + len(encoded)
+            padded += -padded % 8
+            needed = self.used + padded + DOUBLE.size
+
+            if needed > len(self.buffer):
+                self.grow(needed)
+
+            KEY_LENGTH.pack_into(self.buffer, self.used, len(encoded))
+            self.buffer[self.used + KEY_LENGTH.size:self.used + KEY_LENGTH.size + len(encoded)] = encoded
+
+            position = (self.used + padded) // DOUBLE.size
+            self.values[position] = 0.0
+
+            # the entry is all there before a reader can see it
+            self.used = needed
+            HEADER.pack_into(self.buffer, 0, self.used)
+
+            self.positions[key] = position
+            return position
+
+    def grow(self, needed):
+        size = len(self.buffer)
+        while size < needed:
+            size *= 2
+
+        self.values.release()
+
+        if self.file is None:
+            self.buffer.extend(bytes(size - len(self.buffer)))
+        else:
+            self.buffer.close()
+            self.file.truncate(size)
+            self.buffer = mmap.mmap(self.file.fileno(), size)
+
+        self.values = memoryview(self.buffer).cast('d')
+
+    def add(self, position, amount):
+        with self.lock:
+            self.values[position] += amount
+
+    def set(self, position, value):
+        with self.lock:
+            self.values[position] = value
+
+    def close(self):
+        self.values.release()
+
+        if self.file is not None:
+            self.buffer.close()
+            self.file.close()
+
+
+def read_values(data):
+    """
+    (key, value) for everything in a ValueFile's bytes.
+    """
+    used = HEADER.unpack_from(data, 0)[0]
+    offset = HEADER.size
+
+    while offset < used:
+        length = KEY_LENGTH.unpack_from(data, offset)[0]
+        key = bytes(data[offset + KEY_LENGTH.size:offset + KEY_LENGTH.size + length]).decode('utf-8')
+
+        padded = KEY_LENGTH.size + length
+        padded += -padded % 8
+
+        yield key, DOUBLE.unpack_from(data, offset + padded)[0]
+        offset += padded + DOUBLE.size
+
+
+def process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def sample_key(name, suffix, labels):
+    """
+    What a sample is called in the files: name, suffix (e.g. _bucket) and
+    the labels as a list of pairs.
+    """
+    return json.dumps([name, suffix, labels])
+
+
+class Metric:
+    """
+    A metric with a fixed set of label names, labels() gives the child for
+    some label values, which does the recording.
+    """
+    kind = None
+
+    def __init__(self, metrics, name, documentation, labelnames=()):
+        self.metrics = metrics
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+
+    def labels(self, *values):
+        try:
+            return self.children[values]
+        except KeyError:
+            child = self.children[values] = self.make_child([list(x) for x in zip(self.labelnames, values)])
+            return child
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def make_child(self, labels):
+        return CounterChild(self.metrics, self.metrics.file.position(sample_key(self.name, "", labels)))
+
+
+class CounterChild:
+    __slots__ = ('metrics', 'position')
+
+    def __init__(self, metrics, position):
+        self.metrics = metrics
+        self.position = position
+
+    def inc(self, amount=1):
+        self.metrics.file.add(self.position, amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def make_child(self, labels):
+        return GaugeChild(self.metrics, self.metrics.file.position(sample_key(self.name, "", labels)))
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def set(self, value):
+        self.metrics.file.set(self.position, value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, metrics, name, documentation, labelnames=(), buckets=BUCKETS):
+        super().__init__(metrics, name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def make_child(self, labels):
+        position = self.metrics.file.position
+
+        # buckets hold their own count here, render() adds them up.
+        buckets = [
+            position(sample_key(self.name, "_bucket", labels + [["le", str(x)]]))
+            for x in self.buckets + ('+Inf',)
+        ]
+
+        return HistogramChild(
+            self.metrics, self.buckets, buckets,
+            position(sample_key(self.name, "_sum", labels)),
+            position(sample_key(self.name, "_count", labels)))
+
+
+class HistogramChild:
+    __slots__ = ('metrics', 'bounds', 'positions', 'total', 'count')
+
+    def __init__(self, metrics, bounds, positions, total, count):
+        self.metrics = metrics
+        self.bounds = bounds
+        self.positions = positions
+        self.total = total
+        self.count = count
+
+    def observe(self, value):
+        file = self.metrics.file
+
+        with file.lock:
+            self.observe_unlocked(file, value)
+
+    def observe_unlocked(self, file, value):
+        """
+        observe() for when file's lock is held already, to record several
+        samples for one lock (taking it costs more than the rest).
+        """
+        values = file.values
+        values[self.positions[bisect.bisect_left(self.bounds, value)]] += 1
+        values[self.total] += value
+        values[self.count] += 1
+
+
+class LinkMemo(dict):
+    """
+    The per request link memo (see edit.hydrate_links), counting how often
+    a link was found in it.
+    """
+    __slots__ = ('hits', 'misses')
+
+    def __init__(self):
+        super().__init__()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        if super().__contains__(key):
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+
+class Metrics:
+    """
+    The app's metrics, see the module docs.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.metrics = []
+        self.pools = {}
+        self.pools_due = 0.0
+        self.open_file()
+
+        if hasattr(os, 'register_at_fork'):
+            reference = weakref.ref(self)
+
+            def after_fork():
+                if reference() is not None:
+                    reference().reopen()
+
+            os.register_at_fork(after_in_child=after_fork)
+
+        self.requests = self.counter(
+            "linkapp_requests_total", "Requests handled.", ("route", "method", "status"))
+        self.request_seconds = self.histogram(
+            "linkapp_request_seconds", "Time to handle a request.", ("route",))
+        self.link_memo = self.counter(
+            "linkapp_link_memo_lookups_total", "Links looked for in the request's link memo.", ("result",))
+        self.auth_seconds = self.histogram(
+            "linkapp_auth_verify_seconds", "Time to check a password.", ("result",))
+        self.pool_connections = self.gauge(
+            "linkapp_redis_pool_connections", "Redis connections in each manager's pool.", ("pool", "state"))
+        self.pool_max = self.gauge(
+            "linkapp_redis_pool_max_connections", "Most connections each pool will make.", ("pool",))
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Metrics kept in the directory in LINKAPP_METRICS_DIR, or None if
+        that isn't set.
+        """
+        directory = os.environ.get(ENVIRONMENT_VARIABLE)
+
+        if not directory:
+            return None
+
+        os.makedirs(directory, exist_ok=True)
+        return cls(directory)
+
+    def open_file(self):
+        path = None
+        if self.directory is not None:
+            path = os.path.join(self.directory, "%s.db" % (os.getpid(),))
+
+        self.file = ValueFile(path)
+
+    def reopen(self):
+        """
+        After a fork: a file of our own, with the same keys at the same
+        positions (all 0) so the children already made still work.
+        """
+        keys = list(self.file.positions)
+        self.open_file()
+
+        for key in keys:
+            self.file.position(key)
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(self, name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, labelnames=()):
+        metric = Gauge(self, name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=BUCKETS):
+        metric = Histogram(self, name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def watch_pools(self, **pools):
+        """
+        Report the connections in these redis connection pools.
+        """
+        self.pools.update(pools)
+
+    def record_pools(self):
+        # set by every process that handles requests (not the gunicorn
+        # master), so the total is what all the workers could open.
+        for name, pool in self.pools.items():
+            self.pool_max.labels(name).set(pool.max_connections)
+            self.pool_connections.labels(name, "in_use").set(len(getattr(pool, '_in_use_connections', ())))
+            self.pool_connections.labels(name, "idle").set(len(getattr(pool, '_available_connections', ())))
+
+    def record_request(self, route, method, status, seconds, memo=None):
+        # labels() can add to the file, which takes the lock
+        requests = self.requests.labels(route, method, status)
+        timing = self.request_seconds.labels(route)
+        hits = self.link_memo.labels("hit")
+        misses = self.link_memo.labels("miss")
+        file = self.file
+
+        with file.lock:
+            values = file.values
+            values[requests.position] += 1
+            timing.observe_unlocked(file, seconds)
+
+            if isinstance(memo, LinkMemo):
+                values[hits.position] += memo.hits
+                values[misses.position] += memo.misses
+
+        now = time.monotonic()
+
+        if now >= self.pools_due:
+            self.pools_due = now + POOL_INTERVAL
+            self.record_pools()
+
+    def collect(self):
+        """
+        {sample key: value} added up over every process's file.
+        """
+        if self.directory is None:
+            return dict(read_values(self.file.buffer))
+
+        gauges = set(x.name for x in self.metrics if x.kind == 'gauge')
+        totals = {}
+
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".db"):
+                continue
+
+            try:
+                pid = int(filename[:-3])
+                with open(os.path.join(self.directory, filename), 'rb') as source:
+                    data = source.read()
+            except (ValueError, OSError):
+                continue
+
+            if len(data) < HEADER.size:
+                continue
+
+            running = None
+
+            for key, value in read_values(data):
+                if json.loads(key)[0] in gauges:
+                    if running is None:
+                        running = process_running(pid)
+                    if not running:
+                        continue
+
+                totals[key] = totals.get(key, 0.0) + value
+
+        return totals
+
+    def render(self):
+        """
+        Everything in the Prometheus text format.
+        """
+        samples = {}
+
+        for key, value in self.collect().items():
+            name, suffix, labels = json.loads(key)
+            samples.setdefault(name, []).append((suffix, labels, value))
+
+        lines = []
+
+        for metric in self.metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.documentation))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+
+            if metric.kind == 'histogram':
+                lines.extend(histogram_lines(metric, samples.get(metric.name, [])))
+            else:
+                for suffix, labels, value in sorted(samples.get(metric.name, []), key=lambda x: x[1]):
+                    lines.append(sample_line(metric.name + suffix, labels, value))
+
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    if value == int(value):
+        return str(int(value))
+
+    return repr(value)
+
+
+def sample_line(name, labels, value):
+    if labels:
+        name += "{%s}" % (",".join('%s="%s"' % (x, escape(y)) for x, y in labels),)
+
+    return "%s %s" % (name, format_value(value))
+
+
+def histogram_lines(metric, samples):
+    """
+    A histogram's samples with the bucket counts made cumulative, as
+    Prometheus wants them.
+    """
+    series = {}
+
+    for suffix, labels, value in samples:
+        if suffix == "_bucket":
+            base = tuple(tuple(x) for x in labels if x[0] != "le")
+            le = [x[1] for x in labels if x[0] == "le"][0]
+            series.setdefault(base, {'buckets': {}})['buckets'][le] = value
+        else:
+            series.setdefault(tuple(tuple(x) for x in labels), {'buckets': {}})[suffix] = value
+
+    lines = []
+    bounds = [str(x) for x in metric.buckets] + ['+Inf']
+
+    for base in sorted(series):
+        entry = series[base]
+        labels = [list(x) for x in base]
+        running = 0.0
+
+        for le in bounds:
+            running += entry['buckets'].get(le, 0.0)
+            lines.append(sample_line(metric.name + "_bucket", labels + [["le", le]], running))
+
+        lines.append(sample_line(metric.name + "_sum", labels, entry.get('_sum', 0.0)))
+        lines.append(sample_line(metric.name + "_count", labels, entry.get('_count', 0.0)))
+
+    return lines
+
+
+class MetricsMiddleware:
+    """
+    Records every request's route, method, status and time.
+    """
+    def __init__(self, application, metrics):
+        self.application = application
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        statuses = []
+
+        def recording_start_response(status, headers, exc_info=None):
+            statuses.append(status.split(" ", 1)[0])
+            return start_response(status, headers, exc_info)
+
+        def finish():
+            status = statuses[-1] if statuses else "500"
+
+            # made up paths would each get their own route otherwise
+            route = "not_found" if status == "404" else route_name(environ)
+
+            self.metrics.record_request(
+                route,
+                environ.get('REQUEST_METHOD', 'GET'),
+                status,
+                time.perf_counter() - started,
+                environ.get('linkapp.link_memo'))
+
+        try:
+            result = self.application(environ, recording_start_response)
+        except BaseException:
+            finish()
+            raise
+
+        return ResponseBody(result, finish)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Script to move reading lists from the old layout to the new one.
+
+Old: list:<user> (sorted set of every link on the list, scored by when it was
+added) and list-read:<user> (set of the ones that have been read).
+
+New: unread:<user> and read:<user>, two sorted sets kept up to date by
+ReadingListManager. Read links keep the score they were added with, since we
+never recorded when they were read.
+
+Each user is moved in one MULTI/EXEC and the old keys are deleted, so it is
+safe to run this more than once.
+"""
+
+import edit
+
+LEGACY_LIST = "list:"
+LEGACY_READ = "list-read:"
+
+
+def migrate_user(rl, user):
+    """
+    Move one user's reading list, returns (unread, read) counts.
+    """
+    list_key = LEGACY_LIST + user
+    read_key = LEGACY_READ + user
+
+    entries = rl.connection.zrange(list_key, 0, -1, withscores=True)
+    already_read = rl.connection.smembers(read_key)
+
+    unread = {link_id: score for link_id, score in entries if link_id not in already_read}
+    read = {link_id: score for link_id, score in entries if link_id in already_read}
+
+    with rl.connection.pipeline() as pipe:
+        if unread:
+            pipe.zadd(rl.key(user), unread)
+        if read:
+            pipe.zadd(rl.key_read(user), read)
+
+        pipe.delete(list_key, read_key)
+        pipe.execute()
+
+    return len(unread), len(read)
+
+
+if __name__ == "__main__":
+    rl = edit.ReadingListManager()
+
+    users = 0
+
+    for key in rl.connection.scan_iter(LEGACY_LIST + "*", count=1000):
+        user = key[len(LEGACY_LIST):]
+        unread, read = migrate_user(rl, user)
+        users += 1
+
+        print("%s: %s unread, %s read" % (user, unread, read))
+
+    print("Moved %s reading lists." % (users,))
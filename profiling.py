@@ -0,0 +1,232 @@
+"""
+Module for profiling single requests and logging slow ones.
+
+When a page is sometimes slow the question is where the time went: redis,
+pystache, beaker... A Profiler profiles the requests that ask for it with
+an X-Profile header carrying its secret, plus a sample_rate fraction of all
+requests, and writes what it found to a directory:
+
+    >>> profiler = Profiler("/tmp/profiles", secret="letmein", sample_rate=0.001)
+    >>> app = AppFactory(profiler=profiler)
+
+    $ curl -H "X-Profile: letmein" http://localhost:8000/tag/python
+
+The response says which file in X-Profile-File. By default that's cProfile
+output (.prof, open it with pstats or snakeviz). With sampler=True the
+thread's stack is sampled every interval seconds instead, which costs far
+less, and written as folded stacks (.folded, one "a;b;c count" line per
+stack) ready for flamegraph.pl or speedscope.
+
+Only one request is profiled at a time, others asking meanwhile are served
+as usual. A profiled request's body is made in full inside the profile,
+streamed pages included, so the profile covers all the work; it's sent in
+one piece afterwards rather than streamed.
+
+Separately, AppFactory(slow_request_seconds=0.5) logs every request that
+takes longer than that to the "linkapp.slow_requests" logger, with how the
+redis time was spent (see SlowRequestLog).
+"""
+
+import cProfile
+import hmac
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from tracing import ResponseBody, route_name
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+slow_log = logging.getLogger("linkapp.slow_requests")
+
+
+class StackSampler:
+    """
+    Counts the stacks one thread is in, looked at every interval seconds
+    from a thread of its own.
+    """
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        """
+        The stacks in the folded format flamegraph tools read.
+        """
+        return "".join("%s %d\n" % x for x in self.stacks.most_common())
+
+
+class Profiler:
+    """
+    Where profiles go and which requests get profiled, see the module docs.
+    """
+    def __init__(self, directory, secret=None, sample_rate=0.0, sampler=False, interval=0.001):
+        self.directory = directory
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.sampler = sampler
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.numbers = itertools.count()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def wanted(self, environ):
+        if self.secret and PROFILE_HEADER in environ:
+            if hmac.compare_digest(environ[PROFILE_HEADER].encode('utf-8'), self.secret.encode('utf-8')):
+                return True
+
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def path(self, environ):
+        name = "%s-%s-%s-%s" % (
+            time.strftime("%Y%m%d-%H%M%S"),
+            route_name(environ).replace("/", "_"),
+            os.getpid(),
+            next(self.numbers))
+
+        return os.path.join(self.directory, name + (".folded" if self.sampler else ".prof"))
+
+    def middleware(self, application):
+        return ProfilingMiddleware(application, self)
+
+
+class ProfilingMiddleware:
+
+    def __init__(self, application, profiler):
+        self.application = application
+        self.profiler = profiler
+
+    def __call__(self, environ, start_response):
+        profiler = self.profiler
+
+        if not profiler.wanted(environ) or not profiler.lock.acquire(blocking=False):
+            return self.application(environ, start_response)
+
+        try:
+            path = profiler.path(environ)
+
+            def profiled_start_response(status, headers, exc_info=None):
+                headers = headers + [('X-Profile-File', os.path.basename(path))]
+                return start_response(status, headers, exc_info)
+
+            if profiler.sampler:
+                return self.sampled(path, environ, profiled_start_response)
+            else:
+                return self.profiled(path, environ, profiled_start_response)
+        finally:
+            profiler.lock.release()
+
+    def whole_response(self, environ, start_response):
+        """
+        The app's response with the body already made, so the work a streamed
+        page does while sending it is in the profile too.
+        """
+        result = self.application(environ, start_response)
+
+        try:
+            return [b''.join(result)]
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    def profiled(self, path, environ, start_response):
+        profile = cProfile.Profile()
+
+        try:
+            return profile.runcall(self.whole_response, environ, start_response)
+        finally:
+            profile.dump_stats(path)
+
+    def sampled(self, path, environ, start_response):
+        sampler = StackSampler(threading.get_ident(), self.profiler.interval)
+        sampler.start()
+
+        try:
+            return self.whole_response(environ, start_response)
+        finally:
+            sampler.stop()
+
+            with open(path, 'w') as target:
+                target.write(sampler.folded())
+
+
+class SlowRequestLog:
+    """
+    Logs requests that take threshold seconds or more: the route, status,
+    time, and the redis round trips and time per command (from the
+    request's tracing.Trace, if the app has a tracer).
+    """
+    def __init__(self, application, threshold, logger=slow_log):
+        self.application = application
+        self.threshold = threshold
+        self.logger = logger
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        statuses = []
+
+        def recording_start_response(status, headers, exc_info=None):
+            statuses.append(status.split(" ", 1)[0])
+            return start_response(status, headers, exc_info)
+
+        def finish():
+            seconds = time.perf_counter() - started
+
+            if seconds >= self.threshold:
+                self.log(environ, statuses[-1] if statuses else "500", seconds)
+
+        try:
+            result = self.application(environ, recording_start_response)
+        except BaseException:
+            finish()
+            raise
+
+        return ResponseBody(result, finish)
+
+    def log(self, environ, status, seconds):
+        message = "slow request: %s %s (%s) %s in %.1fms" % (
+            environ.get('REQUEST_METHOD'), environ.get('PATH_INFO'),
+            route_name(environ), status, seconds * 1000)
+
+        trace = environ.get('linkapp.redis_trace')
+
+        if trace is not None:
+            commands = sorted(trace.breakdown().items(), key=lambda x: -x[1][1])
+
+            message += ", redis %.1fms in %d round trips (%s)" % (
+                trace.seconds * 1000, trace.round_trips,
+                ", ".join("%s %dx %.1fms" % (name, count, spent * 1000)
+                          for name, (count, spent) in commands))
+
+        self.logger.warning(message)
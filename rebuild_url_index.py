@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+"""
+Script to rebuild the url index (normalized url -> link id) from the links 
+in the database.
+
+Run this once after upgrading from the url_hold set, or any time the index 
+looks wrong. Links that share a url are reported, the first one found keeps it.
+"""
+
+import edit
+
+lm = edit.LinkManager()
+
+indexed, duplicates = lm.rebuild_url_index()
+
+print("Indexed %s links." % (indexed,))
+
+for url_address, kept, duplicate in duplicates:
+    print("Duplicate url %s: kept %s, also used by %s" % (url_address, kept, duplicate))
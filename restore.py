@@ -0,0 +1,374 @@
+"""
+Module for loading a backup (see the backup module) into the database.
+
+Links are written back under their original ids, so reading lists still point
+at them. Records are written straight into their hashes/sorted sets in
+non-transactional pipelines of batch_size records, and the link indexes
+(tag:*, sorted:date and the url index) are built in one pass at the end with
+LinkManager.rebuild_indexes.
+
+Each section can be split between several worker processes: worker n of N
+takes every Nth record starting at n. After each batch a worker records the
+last record it finished in a checkpoint file, and a restore that is started
+again with the same number of workers skips what was already done. Writing a
+record twice does no harm, so a batch that was cut off is simply done again.
+
+Incremental backups are restored on top of the full backup they follow, see
+restore_chain. Links in an incremental backup may already be in the database
+with other tags or another date, so before one is written it is taken out of
+the tag:* and sorted:date sets it is in now - rebuild_indexes only ever adds.
+"""
+
+import json
+import os
+import shutil
+from multiprocessing import Pool
+
+import backup
+import edit
+import user
+
+BATCH_SIZE = 5000
+CHECKPOINT_DIRECTORY = "restore-checkpoints"
+CHAIN_CHECKPOINT_DIRECTORY = "restore-chain-checkpoint"
+
+
+class Checkpoint:
+    """
+    The number of the last record one worker finished in one section, kept in
+    a small JSON file.
+    """
+    def __init__(self, directory, section, worker, workers):
+        self.path = os.path.join(
+            directory, "%s.%s-of-%s.json" % (section, worker, workers))
+
+        try:
+            with open(self.path, 'r') as source:
+                self.done = json.load(source)['done']
+        except FileNotFoundError:
+            self.done = -1
+
+    def save(self, number):
+        """
+        Remember that everything up to record number is in the database.
+        """
+        temp_path = self.path + ".tmp"
+
+        with open(temp_path, 'w') as target:
+            json.dump({'done': number}, target)
+
+        # rename is atomic, an interrupted save leaves the old checkpoint.
+        os.replace(temp_path, self.path)
+        self.done = number
+
+
+def write_links(pipe, managers, record, old_tags):
+    lm = managers['links']
+    pipe.hset(lm.prefix_key(record['key']), mapping=record)
+
+
+def write_users(pipe, managers, record, old_tags):
+    um = managers['users']
+    pipe.hset(um.prefix_key(record['username']), mapping=record)
+
+
+def write_reading_lists(pipe, managers, record, old_tags):
+    rl = managers['reading_lists']
+
+    if record['state'] == 'read':
+        key, other_key = rl.key_read(record['user']), rl.key(record['user'])
+    else:
+        key, other_key = rl.key(record['user']), rl.key_read(record['user'])
+
+    pipe.zadd(key, {record['link']: record['score']})
+    pipe.zrem(other_key, record['link'])
+
+
+def unindex_link(pipe, raw_id, tags):
+    """
+    Take a link out of the tag:* and sorted:date sets it's in now, tags being
+    its tags field (see read_old_tags). The url index is rebuilt from scratch
+    at the end anyway.
+    """
+    for tag in (tags or "").split("|"):
+        if tag:
+            pipe.zrem('tag:%s' % (tag,), raw_id)
+
+    pipe.zrem("sorted:date", raw_id)
+
+
+def replace_links(pipe, managers, record, old_tags):
+    lm = managers['links']
+
+    unindex_link(pipe, record['key'], old_tags.get(record['key']))
+    pipe.delete(lm.prefix_key(record['key']))
+    pipe.hset(lm.prefix_key(record['key']), mapping=record)
+
+    # in case the link comes up again in the same batch.
+    old_tags[record['key']] = record.get('tags')
+
+
+def replace_users(pipe, managers, record, old_tags):
+    um = managers['users']
+
+    pipe.delete(um.prefix_key(record['username']))
+    pipe.hset(um.prefix_key(record['username']), mapping=record)
+
+
+def write_deleted(pipe, managers, record, old_tags):
+    if record['kind'] == 'link':
+        unindex_link(pipe, record['id'], old_tags.get(record['id']))
+        pipe.delete(managers['links'].prefix_key(record['id']))
+        old_tags[record['id']] = None
+
+    elif record['kind'] == 'user':
+        pipe.delete(managers['users'].prefix_key(record['id']))
+
+    elif record['kind'] == 'reading_list':
+        rl = managers['reading_lists']
+        pipe.zrem(rl.key(record['user']), record['id'])
+        pipe.zrem(rl.key_read(record['user']), record['id'])
+
+
+def read_old_tags(managers, raw_ids):
+    """
+    The tags field each of the links has in the database now (None for
+    the ones it hasn't got), by id, read in one round trip.
+    """
+    if not raw_ids:
+        return {}
+
+    lm = managers['links']
+
+    with lm.connection.pipeline(transaction=False) as pipe:
+        for raw_id in raw_ids:
+            pipe.hget(lm.prefix_key(raw_id), "tags")
+
+        return dict(zip(raw_ids, pipe.execute()))
+
+
+WRITERS = {
+    'links': write_links,
+    'users': write_users,
+    'reading_lists': write_reading_lists,
+}
+
+INCREMENTAL_WRITERS = {
+    'links': replace_links,
+    'users': replace_users,
+    'reading_lists': write_reading_lists,
+    'deleted': write_deleted,
+}
+
+# the link each record of an incremental section takes out of the indexes,
+# if any, so their tags can be read a batch at a time.
+UNINDEXED_LINKS = {
+    'links': lambda record: record['key'],
+    'deleted': lambda record: record['id'] if record['kind'] == 'link' else None,
+}
+
+
+def managers_for(host, port, db):
+    return {
+        'links': edit.LinkManager(host, port, db),
+        'users': user.UserManager(host, port, db),
+        'reading_lists': edit.ReadingListManager(host, port, db),
+    }
+
+
+def restore_partition(directory, section, worker, workers, redis_settings,
+                      batch_size=BATCH_SIZE, checkpoint_directory=None,
+                      incremental=False):
+    """
+    Load this worker's share of one section, returns the number of records
+    written (not counting ones skipped thanks to the checkpoint).
+    """
+    managers = managers_for(*redis_settings)
+    connection = managers['links'].connection
+    
+    if incremental:
+        write = INCREMENTAL_WRITERS[section]
+    else:
+        write = WRITERS[section]
+
+    checkpoint = None
+    if checkpoint_directory is not None:
+        checkpoint = Checkpoint(checkpoint_directory, section, worker, workers)
+
+    unindexed = None
+    if incremental:
+        unindexed = UNINDEXED_LINKS.get(section)
+
+    written = 0
+    last = None
+    batch = []
+    pipe = connection.pipeline(transaction=False)
+
+    def write_batch():
+        old_tags = {}
+
+        if unindexed is not None:
+            raw_ids = [unindexed(x) for x in batch]
+            old_tags = read_old_tags(managers, [x for x in raw_ids if x is not None])
+
+        for record in batch:
+            write(pipe, managers, record, old_tags)
+
+        pipe.execute()
+
+        if checkpoint is not None:
+            checkpoint.save(last)
+
+    # every worker has to decompress the whole file, but only decodes its
+    # own lines.
+    for number, line in enumerate(backup.read_lines(directory, section)):
+        if number % workers != worker:
+            continue
+
+        if checkpoint is not None and number <= checkpoint.done:
+            continue
+
+        batch.append(json.loads(line))
+        last = number
+        written += 1
+
+        if len(batch) >= batch_size:
+            write_batch()
+            batch = []
+
+    if batch:
+        write_batch()
+
+    return written
+
+
+def _restore_partition(arguments):
+    """
+    Pool.map only passes one argument.
+    """
+    return restore_partition(*arguments)
+
+
+def restore(directory, redis_settings=("localhost", 6379, 0), workers=1,
+            batch_size=BATCH_SIZE, checkpoint_directory=None, verify=True,
+            rebuild=True, clean_up=True):
+    """
+    Load a backup into the database, full or incremental (an incremental one
+    only makes sense on top of the backups before it, see restore_chain).
+
+    redis_settings is (host, port, db). checkpoint_directory defaults to a
+    directory inside the backup, and is removed once the restore finishes
+    (unless clean_up is False, then that's up to the caller). With rebuild
+    False the indexes are left for the caller to rebuild.
+
+    Returns (records written per section, url duplicates found while
+    rebuilding the indexes - see LinkManager.rebuild_indexes).
+    """
+    manifest = backup.read_manifest(directory)
+    incremental = manifest.get('type') == 'incremental'
+
+    if verify:
+        bad = backup.verify(directory, manifest)
+        if bad:
+            raise ValueError("checksum mismatch in %s" % (", ".join(bad),))
+
+    if checkpoint_directory is None:
+        checkpoint_directory = os.path.join(directory, CHECKPOINT_DIRECTORY)
+
+    os.makedirs(checkpoint_directory, exist_ok=True)
+
+    counts = {}
+
+    for section in backup.INCREMENTAL_SECTIONS:
+        if section not in manifest['sections']:
+            continue
+
+        tasks = [
+            (directory, section, worker, workers, redis_settings, batch_size, 
+             checkpoint_directory, incremental)
+            for worker in range(workers)
+        ]
+
+        if workers > 1:
+            with Pool(workers) as pool:
+                counts[section] = sum(pool.map(_restore_partition, tasks))
+        else:
+            counts[section] = _restore_partition(tasks[0])
+
+    duplicates = []
+    
+    if rebuild:
+        indexed, duplicates = edit.LinkManager(*redis_settings).rebuild_indexes(batch_size)
+
+    if clean_up:
+        shutil.rmtree(checkpoint_directory, ignore_errors=True)
+
+    return counts, duplicates
+
+
+def check_chain(manifests):
+    """
+    Raise a ValueError unless the manifests are a full backup followed by 
+    incrementals that each carry on from the one before.
+    """
+    if not manifests or manifests[0].get('type', 'full') != 'full':
+        raise ValueError("a chain of backups has to start with a full backup")
+
+    for previous, manifest in zip(manifests, manifests[1:]):
+        if manifest.get('type') != 'incremental':
+            raise ValueError("only the first backup in a chain can be a full backup")
+
+        if previous.get('changes_until') is None:
+            raise ValueError("backup started %s can't have incrementals on top of it" % (
+                previous.get('started'),))
+
+        if manifest['changes_from'] != previous['changes_until']:
+            raise ValueError("backup started %s doesn't follow on from the one before it" % (
+                manifest.get('started'),))
+
+
+def restore_chain(directories, redis_settings=("localhost", 6379, 0), workers=1,
+                  batch_size=BATCH_SIZE, verify=True):
+    """
+    Restore a full backup and the incremental backups after it, in order. 
+    The indexes are rebuilt once, at the end.
+    
+    How far along the chain it got is kept in a checkpoint in the full
+    backup's directory. A chain restore that is started again skips the
+    backups that were finished - doing the full backup again would put back
+    the links the incrementals after it changed or deleted - and picks up
+    the one it was in the middle of from its own checkpoints, which are kept
+    until it's finished.
+    
+    Returns (records written per section, all backups together, url 
+    duplicates found while rebuilding the indexes).
+    """
+    check_chain([backup.read_manifest(x) for x in directories])
+
+    chain_directory = os.path.join(directories[0], CHAIN_CHECKPOINT_DIRECTORY)
+    os.makedirs(chain_directory, exist_ok=True)
+
+    # records are numbered backups here, done is the last one finished.
+    chain = Checkpoint(chain_directory, 'chain', 0, 1)
+
+    counts = {}
+
+    for number, directory in enumerate(directories):
+        if number <= chain.done:
+            continue
+
+        written, duplicates = restore(
+            directory, redis_settings, workers=workers, batch_size=batch_size,
+            verify=verify, rebuild=False, clean_up=False)
+
+        for section, count in written.items():
+            counts[section] = counts.get(section, 0) + count
+
+        chain.save(number)
+        shutil.rmtree(os.path.join(directory, CHECKPOINT_DIRECTORY), ignore_errors=True)
+
+    indexed, duplicates = edit.LinkManager(*redis_settings).rebuild_indexes(batch_size)
+
+    shutil.rmtree(chain_directory, ignore_errors=True)
+
+    return counts, duplicates
@@ -1,26 +1,48 @@
 #!/usr/bin/env python
+"""
+Script to restore a backup made with backup_database.py.
 
-import edit
-import json
-import user
-from datetime import datetime
-
-lm = edit.LinkManager()
-um = user.UserManager()
-
-with open("data_backup.json", "r") as backup:
-    data = json.load(backup)
-    
-for link in data["links"]:
-    created = datetime.strptime(link['created'], edit.CREATED_TIME_FORMAT)
-    tags = link['tags'].split("|")
-        
-    lm.add(page_title=link['page_title'], 
-                    desc_text=link['desc_text'], 
-                    url_address=link['url_address'], 
-                    author=link['author'], 
-                    tags=tags, 
-                    created=created)
-
-for user_obj in data["users"]:
-    um.add(user_obj['username'], user_obj['password'], True)
\ No newline at end of file
+Links keep their ids. Run it again after an interruption (with the same
+--workers) and it carries on where it stopped.
+
+Give a full backup followed by incremental backups made after it to restore 
+them all, in order:
+
+    $ python restore_database.py full monday-01 monday-02 monday-03
+"""
+
+import argparse
+import restore
+
+parser = argparse.ArgumentParser(description="Restore a linkapp backup.")
+parser.add_argument("directories", nargs="*", default=["data_backup"],
+                    metavar="directory",
+                    help="backup(s) to restore, full first (default: data_backup)")
+parser.add_argument("--workers", type=int, default=1,
+                    help="worker processes per section (default: 1)")
+parser.add_argument("--batch-size", type=int, default=restore.BATCH_SIZE)
+parser.add_argument("--checkpoint-directory", default=None,
+                    help="where to keep progress (default: inside the backup)")
+parser.add_argument("--no-verify", action="store_true",
+                    help="skip checking the files against the manifest")
+args = parser.parse_args()
+
+if len(args.directories) == 1:
+    counts, duplicates = restore.restore(
+        args.directories[0],
+        workers=args.workers,
+        batch_size=args.batch_size,
+        checkpoint_directory=args.checkpoint_directory,
+        verify=not args.no_verify)
+else:
+    counts, duplicates = restore.restore_chain(
+        args.directories,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        verify=not args.no_verify)
+
+for section, count in sorted(counts.items()):
+    print("%s: %s records restored" % (section, count))
+
+for url_address, kept, duplicate in duplicates:
+    print("Duplicate url %s: kept %s, also used by %s" % (url_address, kept, duplicate))
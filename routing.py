@@ -0,0 +1,347 @@
+"""
+Module for routing requests to the pages.
+
+A Router is built once, when the app is (see wsgilinkapp.routes), from
+patterns relative to the path prefix:
+
+    >>> router = Router("/linkapp/")
+    >>> router.add("", listing, name="listing")
+    >>> router.add("page/{page}", listing, name="listing")
+    >>> router.add("tag/{tag}", listing_by_tag)
+    >>> router.add("save/{key:id}", save, methods=('POST',))
+
+A pattern is "/" separated segments, each either fixed text or a typed
+parameter in braces: {type}, or {name:type} to hand it to the page under
+another name. The types are:
+
+    id      a link id, letters and digits
+    page    a page number, e.g. 2 (negative ones too, the pages redirect)
+    tag     a tag, un-encoded so it can be unicode, with an optional ,page
+            on the end: "python" or "python,2". Gives both tag and page.
+    path    all the rest of the path as a list of segments, must be last
+
+Paths with no parameters are looked up in a dictionary straight away, the
+rest walk a trie of segments, one dictionary lookup per segment. The page
+gets the parameters as keyword arguments:
+
+    listing_by_tag(environ, start_response, tag="python", page=2)
+
+Asking for a path with a method it doesn't take gets a 405 (with an Allow
+header) without the page running, paths that don't match anything get a
+404. The route's name goes in environ['linkapp.route'], which is what
+tracing and metrics group requests by.
+"""
+
+NOT_FOUND = ('404 Not Found', [('Content-Type', 'text/plain')], [b'Not Found'])
+
+
+def page_number(segment):
+    """
+    A page number, ValueError if it isn't one. int() alone takes things
+    like " 2" and "1_0".
+    """
+    if not (segment.isdigit() or segment[:1] == "-" and segment[1:].isdigit()):
+        raise ValueError("not a page number: %r" % (segment,))
+
+    return int(segment)
+
+
+def unencoded(segment):
+    """
+    WSGI paths are the bytes as latin-1, this gets the utf-8 back, see
+    https://bugs.python.org/msg177450
+    """
+    if segment.isascii():
+        return segment
+
+    return segment.encode("ISO-8859-1").decode('utf-8')
+
+
+def id_param(name, segment, params):
+    # link ids are Hashids, letters and digits.
+    if not (segment.isalnum() and segment.isascii()):
+        raise ValueError("not a link id: %r" % (segment,))
+
+    params[name] = segment
+
+
+def page_param(name, segment, params):
+    params[name] = page_number(segment)
+
+
+def tag_param(name, segment, params):
+    tag, comma, page = unencoded(segment).partition(",")
+
+    if not tag:
+        raise ValueError("no tag")
+
+    params[name] = tag
+    params['page'] = page_number(page) if comma else 1
+
+
+def path_param(name, segments, params):
+    segments = [unencoded(x) for x in segments if x]
+
+    if not segments or '..' in segments or '.' in segments:
+        raise ValueError("not a path: %r" % (segments,))
+
+    params[name] = segments
+
+
+CONVERTERS = {
+    'id': id_param,
+    'page': page_param,
+    'tag': tag_param,
+}
+
+
+class Route:
+    """
+    One pattern, the handler for each method it takes and the name to
+    group its requests under.
+    """
+    __slots__ = ('pattern', 'name', 'handlers', 'allow')
+
+    def __init__(self, pattern, name):
+        self.pattern = pattern
+        self.name = name
+        self.handlers = {}
+        self.allow = ""
+
+    def add(self, handler, methods):
+        for method in methods:
+            self.handlers[method] = handler
+
+        self.allow = ", ".join(sorted(self.handlers))
+
+
+class Node:
+    """
+    One segment of the trie: fixed segments that can come next, typed
+    parameters that can come next (as (name, converter, Node)), a path
+    parameter taking the rest, and the route if the path ends here.
+    """
+    __slots__ = ('fixed', 'params', 'rest', 'route')
+
+    def __init__(self):
+        self.fixed = {}
+        self.params = []
+        self.rest = None
+        self.route = None
+
+
+def parse_segment(segment):
+    """
+    (name, type) for a {parameter} segment, None for fixed text.
+    """
+    if not (segment.startswith("{") and segment.endswith("}")):
+        return None
+
+    name, colon, kind = segment[1:-1].partition(":")
+
+    if not colon:
+        kind = name
+
+    if kind != 'path' and kind not in CONVERTERS:
+        raise ValueError("unknown parameter type %r" % (kind,))
+
+    return name, kind
+
+
+def route_name(pattern):
+    """
+    The fixed segments before the first parameter, like tracing.route_name
+    makes from a path.
+    """
+    fixed = []
+
+    for segment in pattern.split("/"):
+        if parse_segment(segment) is not None:
+            break
+
+        fixed.append(segment)
+
+    return "/".join(fixed).rstrip("/") or "listing"
+
+
+class Router:
+    """
+    WSGI app sending each request to the page for its path, see the module
+    docs.
+    """
+    def __init__(self, prefix="/"):
+        self.prefix = prefix
+        self.exact = {}
+        self.root = Node()
+        self.routes = {}
+
+    def add(self, pattern, handler, methods=('GET',), name=None):
+        """
+        Send requests for pattern with one of methods to handler. The same
+        pattern can be added again for other methods.
+        """
+        if pattern not in self.routes:
+            self.routes[pattern] = Route(pattern, name or route_name(pattern))
+            self.compile(pattern, self.routes[pattern])
+
+        self.routes[pattern].add(handler, methods)
+
+    def compile(self, pattern, route):
+        segments = pattern.split("/")
+        parsed = [parse_segment(x) for x in segments]
+
+        if not any(parsed):
+            self.exact[self.prefix + pattern] = route
+            return
+
+        node = self.root
+
+        for position, (segment, param) in enumerate(zip(segments, parsed)):
+            if param is None:
+                node = node.fixed.setdefault(segment, Node())
+                continue
+
+            name, kind = param
+
+            if kind == 'path':
+                if position != len(segments) - 1:
+                    raise ValueError("a path parameter must be last: %r" % (pattern,))
+
+                node.rest = (name, route)
+                return
+
+            for existing_name, converter, child in node.params:
+                if existing_name == name and converter is CONVERTERS[kind]:
+                    node = child
+                    break
+            else:
+                child = Node()
+                node.params.append((name, CONVERTERS[kind], child))
+                node = child
+
+        node.route = route
+
+    def match(self, path):
+        """
+        (route, params) for a full path (prefix and all), None if nothing
+        matches.
+        """
+        route = self.exact.get(path)
+
+        if route is not None:
+            return route, {}
+
+        if not path.startswith(self.prefix):
+            return None
+
+        segments = path[len(self.prefix):].split("/")
+        params = {}
+
+        # first go straight down taking the first thing that fits at each
+        # segment, which is right for every path unless two patterns
+        # overlap, without walk's function call per segment.
+        node = self.root
+        position = 0
+
+        for segment in segments:
+            child = node.fixed.get(segment)
+
+            if child is None:
+                for name, converter, param_child in node.params:
+                    try:
+                        converter(name, segment, params)
+                    except ValueError:
+                        continue
+
+                    child = param_child
+                    break
+
+            if child is None:
+                if node.rest is not None and not node.params:
+                    name, route = node.rest
+
+                    try:
+                        path_param(name, segments[position:], params)
+                    except ValueError:
+                        return None
+
+                    return route, params
+
+                break
+
+            node = child
+            position += 1
+
+        else:
+            if node.route is not None:
+                return node.route, params
+
+        # a dead end, look through every way the path could go.
+        params = {}
+        route = self.walk(self.root, segments, 0, params)
+
+        if route is None:
+            return None
+
+        return route, params
+
+    def walk(self, node, segments, position, params):
+        if position == len(segments):
+            return node.route
+
+        segment = segments[position]
+        child = node.fixed.get(segment)
+
+        if child is not None:
+            route = self.walk(child, segments, position + 1, params)
+
+            if route is not None:
+                return route
+
+        for name, converter, child in node.params:
+            before = len(params)
+
+            try:
+                converter(name, segment, params)
+            except ValueError:
+                continue
+
+            route = self.walk(child, segments, position + 1, params)
+
+            if route is not None:
+                return route
+
+            # this way was a dead end, forget what it found.
+            while len(params) > before:
+                params.popitem()
+
+        if node.rest is not None:
+            name, route = node.rest
+
+            try:
+                path_param(name, segments[position:], params)
+            except ValueError:
+                return None
+
+            return route
+
+        return None
+
+    def __call__(self, environ, start_response):
+        found = self.match(environ['PATH_INFO'])
+
+        if found is None:
+            status, headers, body = NOT_FOUND
+            start_response(status, headers)
+            return body
+
+        route, params = found
+        environ['linkapp.route'] = route.name
+
+        handler = route.handlers.get(environ['REQUEST_METHOD'])
+
+        if handler is None:
+            start_response('405 Method Not Allowed', [('Content-Type', 'text/plain'), ('Allow', route.allow)])
+            return [b'Method Not Allowed']
+
+        return handler(environ, start_response, **params)
@@ -0,0 +1,257 @@
+"""
+Testing the admission control
+"""
+
+import gzip
+import time
+import unittest
+import wsgilinkapp
+from admission import AdmissionControl, queue_seconds
+from compression import CompressionMiddleware
+from tracing import Trace
+from unittest.mock import MagicMock, patch
+from webob import Request
+from webtest import TestApp
+
+
+def page_app():
+    """
+    A WSGI app answering every request with a page, counting the calls.
+    """
+    def app(environ, start_response):
+        app.calls += 1
+        start_response('200 OK', [('Content-Type', 'text/html'), ('Set-Cookie', 'beaker.session.id=abc')])
+        return [b"<p>page ", str(app.calls).encode('ascii'), b"</p>"]
+
+    app.calls = 0
+    return app
+
+
+class AdmissionTest(unittest.TestCase):
+    """
+    Testing AdmissionMiddleware
+    """
+
+    def setUp(self):
+        self.control = AdmissionControl(max_in_flight=4, max_queue_seconds=1.0, retry_after=7)
+        self.app = page_app()
+        self.test_app = TestApp(self.control.middleware(self.app, wsgilinkapp.routes('/')))
+
+    def overload(self):
+        self.control.in_flight = self.control.max_in_flight
+
+    def test_let_in(self):
+
+        self.test_app.post("/save/", {'page_title': "x"})
+        self.test_app.get("/api/v1/tags/a/b")
+
+        self.assertEqual(self.app.calls, 2)
+        self.assertEqual(self.control.in_flight, 0)
+
+    def test_shed_when_overloaded(self):
+
+        self.overload()
+
+        for path in ("/reading-list/all", "/api/v1/tags/a/b", "/api/v1/counts?tags=a,b"):
+            resp = self.test_app.get(path, status=503)
+            self.assertEqual(resp.headers['Retry-After'], "7")
+
+        self.test_app.post("/save/", {'page_title': "x"}, status=503)
+        self.test_app.post("/api/links:batch", "{}", status=503)
+
+        self.assertEqual(self.app.calls, 0)
+        self.assertEqual(self.control.stats()['shed'], 5)
+
+    def test_cheap_let_in_when_overloaded(self):
+
+        self.overload()
+
+        for path in ("/view/jR5zE", "/api/v1/tags/a", "/api/v1/counts?tags=a", "/tag/python", "/static/style.css"):
+            self.test_app.get(path)
+
+        self.assertEqual(self.app.calls, 5)
+
+    def test_password_check_shed(self):
+
+        self.overload()
+
+        self.test_app.authorization = ('Basic', ('test_name', 'password'))
+        self.test_app.get("/new", status=503)
+        self.test_app.get("/reading-list", status=503)
+
+        # the password isn't checked on the pages that don't log in.
+        self.test_app.get("/view/jR5zE")
+
+        self.test_app.authorization = None
+        self.test_app.get("/new")
+
+        self.assertEqual(self.app.calls, 2)
+
+    def test_shed_after_queueing(self):
+
+        headers = {'X-Request-Start': "t=%.3f" % (time.time() - 5,)}
+
+        self.test_app.post("/save/", {'page_title': "x"}, headers=headers, status=503)
+
+        headers = {'X-Request-Start': "t=%.3f" % (time.time(),)}
+
+        self.test_app.post("/save/", {'page_title': "x"}, headers=headers)
+
+    def test_copy_when_overloaded(self):
+
+        first = self.test_app.get("/tag/python")
+        self.assertNotIn('Warning', first.headers)
+
+        self.overload()
+        copy = self.test_app.get("/tag/python")
+
+        self.assertEqual(copy.body, first.body)
+        self.assertEqual(copy.headers['Warning'], '110 - "Response is Stale"')
+        self.assertEqual(copy.headers['Age'], "0")
+        self.assertNotIn('Set-Cookie', copy.headers)
+        self.assertEqual(self.app.calls, 1)
+
+        # the pages without a copy yet are let in.
+        self.test_app.get("/")
+        self.assertEqual(self.app.calls, 2)
+
+    def test_copy_when_redis_slow(self):
+
+        self.test_app.get("/")
+
+        self.control.redis_seconds = 1.0
+        self.control.last_probe = time.time()
+
+        self.assertEqual(self.test_app.get("/").body, b"<p>page 1</p>")
+        self.assertEqual(self.app.calls, 1)
+
+        # saves aren't shed for a slow redis alone.
+        self.test_app.post("/save/", {'page_title': "x"})
+        self.assertEqual(self.app.calls, 2)
+
+    def test_probe_when_redis_slow(self):
+
+        self.test_app.get("/")
+
+        self.control.redis_seconds = 1.0
+        self.control.last_probe = 0.0
+
+        self.assertEqual(self.test_app.get("/").body, b"<p>page 2</p>")
+        self.assertEqual(self.test_app.get("/").body, b"<p>page 2</p>")
+        self.assertEqual(self.app.calls, 2)
+
+    def test_redis_latency(self):
+
+        trace = Trace()
+        trace.round_trips = 2
+        trace.seconds = 1.0
+
+        self.test_app.get("/view/jR5zE", extra_environ={'linkapp.redis_trace': trace})
+
+        self.assertAlmostEqual(self.control.redis_seconds, 0.1)
+        self.assertTrue(self.control.redis_slow())
+
+    def test_in_flight_until_closed(self):
+
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/view/jR5zE'}
+        body = self.control.middleware(self.app, wsgilinkapp.routes('/'))(environ, MagicMock())
+
+        self.assertEqual(self.control.in_flight, 1)
+
+        list(body)
+        body.close()
+
+        self.assertEqual(self.control.in_flight, 0)
+
+
+class CompressedCopiesTest(unittest.TestCase):
+    """
+    Testing the copies kept outside CompressionMiddleware
+    """
+
+    def setUp(self):
+        self.control = AdmissionControl(max_in_flight=4)
+        self.calls = 0
+
+        def app(environ, start_response):
+            self.calls += 1
+            start_response('200 OK', [('Content-Type', 'text/html')])
+            return [b"<p>a page of links</p>\n" * 100]
+
+        self.app = self.control.middleware(CompressionMiddleware(app), wsgilinkapp.routes('/'))
+
+    def get(self, accept=None):
+        headers = {'Accept-Encoding': accept} if accept else {}
+        response = Request.blank("/tag/python", headers=headers).get_response(self.app)
+
+        # read and closed, like a server does, so the page is kept.
+        response.body
+        return response
+
+    def test_copy_kept_compressed(self):
+
+        first = self.get("gzip")
+        self.assertEqual(first.headers['Content-Encoding'], 'gzip')
+
+        self.control.in_flight = self.control.max_in_flight
+
+        with patch('compression.Compressor') as mocked_compressor:
+            copy = self.get("gzip")
+
+        # sent as it was kept, nothing compressed again.
+        mocked_compressor.assert_not_called()
+        self.assertEqual(copy.body, first.body)
+        self.assertEqual(copy.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Warning', copy.headers)
+        self.assertEqual(self.calls, 1)
+
+        # a client that doesn't take gzip has no copy of its own yet.
+        plain = self.get()
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertNotIn('Warning', plain.headers)
+        self.assertEqual(self.calls, 2)
+
+    def test_app_factory_order(self):
+
+        factory = wsgilinkapp.AppFactory(path_prefix="/", admission=self.control)
+        factory.link_manager = MagicMock()
+        factory.link_manager.count.return_value = 0
+        factory.link_manager.iter_listing.return_value = iter([])
+
+        environ = Request.blank("/tag/python", headers={'Accept-Encoding': 'gzip'}).environ
+        body = factory(environ, MagicMock())
+        b"".join(body)
+        body.close()
+
+        status, headers, kept, now = self.control.pages[("/tag/python", 'gzip')]
+        self.assertIn(('Content-Encoding', 'gzip'), headers)
+        self.assertEqual(gzip.decompress(kept)[:15], b"<!DOCTYPE html>")
+
+
+class QueueSecondsTest(unittest.TestCase):
+    """
+    Testing admission.queue_seconds
+    """
+
+    def test_queue_seconds(self):
+
+        now = 1600000010.0
+
+        self.assertAlmostEqual(queue_seconds({'HTTP_X_REQUEST_START': "t=1600000009.5"}, now), 0.5)
+        self.assertAlmostEqual(queue_seconds({'HTTP_X_REQUEST_START': "1600000008000"}, now), 2.0)
+        self.assertAlmostEqual(queue_seconds({'HTTP_X_REQUEST_START': "t=1600000009750000"}, now), 0.25)
+        self.assertEqual(queue_seconds({'HTTP_X_REQUEST_START': "t=1600000011"}, now), 0.0)
+        self.assertEqual(queue_seconds({'HTTP_X_REQUEST_START': "soon"}, now), 0.0)
+        self.assertEqual(queue_seconds({}, now), 0.0)
+
+
+class AppFactoryTest(unittest.TestCase):
+    """
+    Testing AppFactory with admission control
+    """
+
+    def test_tracer_made(self):
+
+        factory = wsgilinkapp.AppFactory(admission=AdmissionControl())
+
+        self.assertIsNotNone(factory.tracer)
@@ -0,0 +1,125 @@
+"""
+Testing the JSON API
+"""
+
+import unittest
+import api
+import wsgilinkapp
+from webtest import TestApp
+from unittest.mock import MagicMock
+
+
+class ApiTest(unittest.TestCase):
+    """
+    Testing the api/v1/ pages, routed like wsgilinkapp does
+    """
+    
+    def mocked_app(self):
+        mocked_lm = MagicMock()
+        
+        app = TestApp(wsgilinkapp.routes("/linkapp/"), 
+            extra_environ={
+                'linkapp.path_prefix': '/linkapp/',
+                'linkapp.link_manager': mocked_lm})
+        
+        return mocked_lm, app
+        
+    def test_links(self):
+        
+        mocked_lm, app = self.mocked_app()
+        mocked_lm.page.return_value = ([{'key': "one"}], "5.0:one")
+        
+        resp = app.get("/linkapp/api/v1/links?count=1&fields=key")
+        
+        self.assertEqual(resp.json, {'links': [{'key': "one"}], 'next': "5.0:one"})
+        mocked_lm.page.assert_called_once_with(
+            cursor=None, count=1, fields=('key',), memo=None, as_dicts=True)
+        
+    def test_tags(self):
+        
+        mocked_lm, app = self.mocked_app()
+        mocked_lm.page.return_value = ([], None)
+        
+        app.get("/linkapp/api/v1/tags/one/two?cursor=5.0:one")
+        
+        self.assertEqual(mocked_lm.page.call_args[0], ("one", "two"))
+        self.assertEqual(mocked_lm.page.call_args[1]['cursor'], "5.0:one")
+        
+    def test_multi_get(self):
+        
+        mocked_lm, app = self.mocked_app()
+        mocked_lm.list_many.return_value = [{'key': "one"}, None]
+        
+        resp = app.get("/linkapp/api/v1/links?ids=one,two")
+        
+        self.assertEqual(resp.json, {'links': [{'key': "one"}, None]})
+        self.assertEqual(mocked_lm.list_many.call_args[0][0], ["one", "two"])
+        
+    def test_one_link_not_found(self):
+        
+        mocked_lm, app = self.mocked_app()
+        mocked_lm.list_many.return_value = [None]
+        
+        resp = app.get("/linkapp/api/v1/links/nope", status='4**')
+        self.assertEqual(resp.status_int, 404)
+        
+    def test_no_such_endpoint(self):
+        
+        mocked_lm, app = self.mocked_app()
+        
+        resp = app.get("/linkapp/api/v1/tagz/one", status=404)
+        self.assertEqual(resp.json, {'error': "no such endpoint"})
+        
+    def test_wrong_method(self):
+        
+        mocked_lm, app = self.mocked_app()
+        
+        resp = app.post("/linkapp/api/v1/links", status=405)
+        self.assertEqual(resp.headers['Allow'], "GET")
+        
+    def test_bad_options(self):
+        
+        mocked_lm, app = self.mocked_app()
+        
+        resp = app.get("/linkapp/api/v1/links?count=1000", status='4**')
+        self.assertEqual(resp.status_int, 400)
+        
+        resp = app.get("/linkapp/api/v1/links?fields=password", status='4**')
+        self.assertEqual(resp.status_int, 400)
+        
+    def test_etag(self):
+        
+        mocked_lm, app = self.mocked_app()
+        mocked_lm.count.return_value = 12
+        
+        resp = app.get("/linkapp/api/v1/counts")
+        self.assertEqual(resp.json, {'links': 12})
+        
+        resp = app.get("/linkapp/api/v1/counts", 
+                       headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(resp.status_int, 304)
+        self.assertEqual(resp.body, b"")
+        
+        
+class ReadingListApiTest(unittest.TestCase):
+    """
+    Testing api.reading_list
+    """
+    
+    def test_reading_list(self):
+        
+        mocked_rl = MagicMock()
+        mocked_rl.page.return_value = ([{'key': "one"}], None)
+        mocked_rl.count.return_value = 1
+        
+        app = TestApp(api.reading_list, 
+            extra_environ={
+                'linkapp.path_prefix': '/linkapp/',
+                'beaker.session': {'username': 'test_name'},
+                'linkapp.rl_manager': mocked_rl})
+        
+        resp = app.get("/linkapp/api/v1/reading-list?read=1")
+        
+        self.assertEqual(resp.json, {'links': [{'key': "one"}], 'next': None, 'count': 1})
+        self.assertEqual(mocked_rl.page.call_args[0], ("test_name",))
+        self.assertTrue(mocked_rl.page.call_args[1]['read'])
@@ -0,0 +1,219 @@
+"""
+Testing the ASGI app
+"""
+
+import asyncio
+import base64
+import unittest
+import asynclinkapp
+import wsgilinkapp
+from hashing import PoolBusy
+from unittest.mock import AsyncMock
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class RouteTest(unittest.TestCase):
+    """
+    Tests for asynclinkapp.route
+    """
+
+    router = wsgilinkapp.routes('/linkapp/')
+
+    def route(self, path, method='GET'):
+        return asynclinkapp.route(self.router, {'REQUEST_METHOD': method, 'PATH_INFO': path})
+
+    def test_native_pages(self):
+
+        self.assertEqual(self.route("/linkapp/"), (asynclinkapp.listing, {}))
+        self.assertEqual(self.route("/linkapp/page/2"), (asynclinkapp.listing, {'page': 2}))
+        self.assertEqual(self.route("/linkapp/tag/one,3"), (asynclinkapp.listing_by_tag, {'tag': "one", 'page': 3}))
+        self.assertEqual(self.route("/linkapp/view/jR5zE"), (asynclinkapp.one_post, {'key': "jR5zE"}))
+        self.assertEqual(self.route("/linkapp/reading-list"), (asynclinkapp.my_reading_list, {}))
+
+    def test_left_to_wsgi(self):
+
+        self.assertIsNone(self.route("/linkapp/new"))
+        self.assertIsNone(self.route("/linkapp/save/"))
+        self.assertIsNone(self.route("/linkapp/api/v1/links"))
+
+    def test_same_errors_as_wsgi(self):
+
+        # left to the WSGI app, so they get its 404s and 405s.
+        self.assertIsNone(self.route("/linkapp/page/abc"))
+        self.assertIsNone(self.route("/linkapp/view/not-an-id"))
+        self.assertIsNone(self.route("/linkapp/", method='POST'))
+
+
+class HandlersTest(unittest.TestCase):
+    """
+    Tests for the native handlers.
+    """
+
+    def environ(self, path, **extra):
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'HTTP_HOST': 'localhost',
+            'linkapp.path_prefix': '/linkapp/',
+            'linkapp.link_memo': {},
+            'linkapp.link_manager': MagicMock(),
+            'linkapp.rl_manager': MagicMock(),
+            'linkapp.user_manager': MagicMock(),
+        }
+        environ.update(extra)
+        return environ
+
+    def test_listing(self):
+
+        environ = self.environ("/linkapp/page/2")
+        lm = environ['linkapp.link_manager']
+        lm.count = AsyncMock(return_value=25)
+        lm.listing = AsyncMock(return_value=[])
+
+        status, headers, body = run(asynclinkapp.listing(environ, page=2))
+
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(lm.listing.call_args[1]['start'], 10)
+        self.assertEqual(lm.listing.call_args[1]['stop'], 19)
+
+    def test_listing_by_tag(self):
+
+        environ = self.environ("/linkapp/tag/one,3")
+        lm = environ['linkapp.link_manager']
+        lm.count = AsyncMock(return_value=25)
+        lm.listing = AsyncMock(return_value=[])
+
+        run(asynclinkapp.listing_by_tag(environ, "one", page=3))
+
+        lm.count.assert_called_once_with("one")
+        self.assertEqual(lm.listing.call_args[1]['start'], 20)
+
+    def test_reading_list_needs_auth(self):
+
+        environ = self.environ("/linkapp/reading-list")
+
+        status, headers, body = run(asynclinkapp.my_reading_list(environ))
+
+        self.assertEqual(status, '401 Unauthorized')
+
+    def test_reading_list(self):
+
+        credentials = base64.b64encode(b"bob:secret").decode()
+        environ = self.environ("/linkapp/reading-list", HTTP_AUTHORIZATION="Basic " + credentials)
+
+        environ['linkapp.user_manager'].authenticate = AsyncMock(return_value=True)
+        rl = environ['linkapp.rl_manager']
+        rl.count = AsyncMock(return_value=0)
+        rl.to_read = AsyncMock(return_value=[])
+
+        status, headers, body = run(asynclinkapp.my_reading_list(environ))
+
+        self.assertEqual(status, '200 OK')
+        environ['linkapp.user_manager'].authenticate.assert_called_once_with("bob", "secret")
+        self.assertEqual(rl.to_read.call_args[0], ("bob",))
+
+    def test_reading_list_hashing_busy(self):
+
+        credentials = base64.b64encode(b"bob:secret").decode()
+        environ = self.environ("/linkapp/reading-list", HTTP_AUTHORIZATION="Basic " + credentials)
+
+        environ['linkapp.user_manager'].authenticate = AsyncMock(side_effect=PoolBusy(2))
+
+        status, headers, body = run(asynclinkapp.my_reading_list(environ))
+
+        self.assertEqual(status, '503 Service Unavailable')
+        self.assertIn(('Retry-After', '2'), headers)
+
+
+class AsyncUserManagerTest(unittest.TestCase):
+    """
+    Tests for asynclinkapp.AsyncUserManager
+    """
+
+    @patch('asynclinkapp.pbkdf2_sha256')
+    @patch('asynclinkapp.redis.asyncio.StrictRedis')
+    def test_authenticate(self, mocked_class, mocked_hash):
+
+        mocked_class().hgetall = AsyncMock(return_value={'password': "hashed"})
+        mocked_hash.verify.return_value = True
+
+        um = asynclinkapp.AsyncUserManager()
+
+        self.assertTrue(run(um.authenticate("bob", "secret")))
+        mocked_hash.verify.assert_called_once_with("secret", "hashed")
+
+    @patch('asynclinkapp.redis.asyncio.StrictRedis')
+    def test_no_such_user(self, mocked_class):
+
+        mocked_class().hgetall = AsyncMock(return_value={})
+
+        um = asynclinkapp.AsyncUserManager()
+
+        self.assertFalse(run(um.authenticate("bob", "secret")))
+
+    @patch('asynclinkapp.redis.asyncio.StrictRedis')
+    def test_authenticate_in_hash_pool(self, mocked_class):
+
+        mocked_class().hgetall = AsyncMock(return_value={'password': "hashed"})
+        pool = MagicMock()
+        pool.submit.return_value = AsyncMock(return_value=True)()
+
+        um = asynclinkapp.AsyncUserManager(hash_pool=pool)
+
+        self.assertTrue(run(um.authenticate("bob", "secret")))
+        pool.submit.assert_called_once_with(asynclinkapp.verify_password, "secret", "hashed")
+
+
+class BodyLimitTest(unittest.TestCase):
+    """
+    Tests for the request body limit in AsyncAppFactory.
+    """
+
+    def setUp(self):
+        self.app = asynclinkapp.AsyncAppFactory(path_prefix="/", threads=1, max_form_bytes=100)
+
+    def tearDown(self):
+        self.app.executor.shutdown(wait=False)
+
+    def scope(self, *headers):
+        return {'type': 'http', 'method': 'POST', 'path': '/save/', 'headers': list(headers)}
+
+    def call(self, scope, messages):
+        receive = AsyncMock(side_effect=messages)
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        run(self.app(scope, receive, send))
+
+        return receive, sent
+
+    def test_content_length_over(self):
+
+        receive, sent = self.call(self.scope((b'content-length', b'101')), [])
+
+        self.assertEqual(sent[0]['status'], 413)
+        receive.assert_not_called()
+
+    def test_body_over(self):
+
+        messages = [{'body': b'x' * 60, 'more_body': True}] * 5
+        receive, sent = self.call(self.scope(), messages)
+
+        self.assertEqual(sent[0]['status'], 413)
+        # stopped reading once it went over.
+        self.assertEqual(receive.call_count, 2)
+
+    def test_body_in_chunks(self):
+
+        messages = [{'body': b'a=1', 'more_body': True}, {'body': b'&b=2', 'more_body': True}, {'body': b''}]
+
+        body = run(self.app.read_body(self.scope(), AsyncMock(side_effect=messages)))
+
+        self.assertEqual(body, b'a=1&b=2')
@@ -0,0 +1,129 @@
+"""
+Testing the backup module.
+"""
+
+import os
+import json
+import tempfile
+import unittest
+import backup
+from unittest.mock import MagicMock
+
+
+class SectionFilesTest(unittest.TestCase):
+    """
+    Writing section files and reading them back.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.directory = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def write(self, records, compression):
+        entry = backup.write_section(self.directory, 'links', records, compression)
+        manifest = {'sections': {'links': entry}}
+
+        with open(os.path.join(self.directory, backup.MANIFEST), 'w') as target:
+            json.dump(manifest, target)
+
+        return entry
+
+    def test_round_trip(self):
+
+        records = [{'key': 'one', 'tags': 'a|b'}, {'key': 'two', 'tags': 'c'}]
+
+        for compression in ('none', 'gzip'):
+            entry = self.write(records, compression)
+
+            self.assertEqual(entry['count'], 2)
+            self.assertEqual(list(backup.read_section(self.directory, 'links')), records)
+            self.assertEqual(backup.verify(self.directory), [])
+
+    def test_verify_catches_changes(self):
+
+        entry = self.write([{'key': 'one'}], 'none')
+
+        with open(os.path.join(self.directory, entry['file']), 'a') as target:
+            target.write('{"key": "sneaky"}\n')
+
+        self.assertEqual(backup.verify(self.directory), ['links'])
+
+    def test_unknown_compression(self):
+
+        with self.assertRaises(ValueError):
+            backup.SectionWriter(self.directory, 'links', 'rar')
+
+
+class IterLinksTest(unittest.TestCase):
+    """
+    Tests for backup.iter_links
+    """
+
+    def test_batches_and_skips_missing(self):
+
+        lm = MagicMock()
+        lm.prefix_key.return_value = "link:*"
+        lm.connection.scan_iter.return_value = iter(["link:a", "link:b", "link:c"])
+
+        pipe = lm.connection.pipeline().__enter__()
+        pipe.execute.side_effect = [[{'key': 'a'}, {}], [{'key': 'c'}]]
+
+        result = list(backup.iter_links(lm, batch_size=2))
+
+        self.assertEqual(result, [{'key': 'a'}, {'key': 'c'}])
+        lm.connection.scan_iter.assert_called_once_with("link:*", count=2)
+        self.assertEqual(pipe.hgetall.call_count, 3)
+
+
+class IncrementalTest(unittest.TestCase):
+    """
+    Tests for what incremental backups are made from.
+    """
+
+    def test_touched_since(self):
+
+        connection = MagicMock()
+        connection.xrange.side_effect = [
+            [("1-0", {'kind': 'link', 'action': 'add', 'id': 'a'}),
+             ("2-0", {'kind': 'user', 'action': 'modify', 'id': 'bob'})],
+            [("2-0", {'kind': 'user', 'action': 'modify', 'id': 'bob'}),
+             ("3-0", {'kind': 'reading_list', 'action': 'read', 'id': 'a', 'user': 'bob'}),
+             ("3-1", {'kind': 'link', 'action': 'delete', 'id': 'a'})],
+            [("3-1", {'kind': 'link', 'action': 'delete', 'id': 'a'})],
+        ]
+
+        links, users, entries = backup.touched_since(connection, "0-0", "3-1", batch_size=2)
+
+        self.assertEqual(links, {'a'})
+        self.assertEqual(users, {'bob'})
+        self.assertEqual(entries, {('bob', 'a')})
+        self.assertEqual(connection.xrange.call_args_list[1][1]['min'], "2-0")
+
+    def test_trimmed_change_log(self):
+
+        connection = MagicMock()
+        connection.xrange.return_value = []
+
+        with self.assertRaises(ValueError):
+            backup.check_changes_kept(connection, "5-0")
+
+        connection.xrange.return_value = [("5-0", {})]
+        backup.check_changes_kept(connection, "5-0")
+
+    def test_current_entries(self):
+
+        rl = MagicMock()
+        rl.key.side_effect = lambda x: "unread:%s" % (x,)
+        rl.key_read.side_effect = lambda x: "read:%s" % (x,)
+        rl.connection.pipeline().__enter__().execute.return_value = [
+            10.0, None, None, 20.0, None, None]
+
+        missing = []
+        result = list(backup._current_entries(
+            rl, [('bob', 'a'), ('bob', 'b'), ('bob', 'c')], 10, missing))
+
+        self.assertEqual([x['state'] for x in result], ['unread', 'read'])
+        self.assertEqual(missing, [('bob', 'c')])
@@ -0,0 +1,91 @@
+"""
+Testing the changes module.
+"""
+
+import unittest
+import redis
+import changes
+from unittest.mock import MagicMock
+
+
+class RecordChangeTest(unittest.TestCase):
+    """
+    Tests for changes.record_change
+    """
+
+    def test_link_change(self):
+
+        pipe = MagicMock()
+        changes.record_change(pipe, "link", "modify", "id", fields={'tags': "a", 'author': "b"})
+
+        pipe.xadd.assert_called_once_with(
+            "changes",
+            {'kind': "link", 'action': "modify", 'id': "id", 'fields': "author|tags"},
+            maxlen=changes.MAX_CHANGES, approximate=True)
+
+    def test_reading_list_change(self):
+
+        pipe = MagicMock()
+        changes.record_change(pipe, "reading_list", "read", "id", user="bob")
+
+        self.assertEqual(pipe.xadd.call_args[0][1]['user'], "bob")
+
+
+class ChangeConsumerTest(unittest.TestCase):
+    """
+    Tests for changes.ChangeConsumer
+    """
+
+    def reply(self, *ids):
+        return [["changes", [(x, {'kind': "link", 'action': "add", 'id': x}) for x in ids]]]
+
+    def test_pending_first(self):
+
+        connection = MagicMock()
+        connection.xreadgroup.side_effect = [self.reply(), self.reply("2-0")]
+
+        consumer = changes.ChangeConsumer(connection, "group", "worker")
+        result = consumer.read(count=10, block=100)
+
+        self.assertEqual([x.raw_id for x in result], ["2-0"])
+        first, second = connection.xreadgroup.call_args_list
+        self.assertEqual(first[0][2], {"changes": "0"})
+        self.assertEqual(second[0][2], {"changes": ">"})
+
+    def test_process_acks(self):
+
+        connection = MagicMock()
+        connection.xreadgroup.return_value = self.reply("1-0", "1-1")
+
+        consumer = changes.ChangeConsumer(connection, "group", "worker")
+        handler = MagicMock()
+
+        self.assertEqual(consumer.process(handler), 2)
+        handler.assert_called_once()
+        connection.xack.assert_called_once_with("changes", "group", "1-0", "1-1")
+
+    def test_process_failure_not_acked(self):
+
+        connection = MagicMock()
+        connection.xreadgroup.return_value = self.reply("1-0")
+
+        consumer = changes.ChangeConsumer(connection, "group", "worker")
+        consumer.pending = False
+
+        with self.assertRaises(ValueError):
+            consumer.process(MagicMock(side_effect=ValueError))
+
+        connection.xack.assert_not_called()
+        self.assertTrue(consumer.pending)
+
+    def test_missing_group_created(self):
+
+        connection = MagicMock()
+        connection.xreadgroup.side_effect = [
+            redis.ResponseError("NOGROUP No such key"), self.reply(), self.reply()]
+
+        consumer = changes.ChangeConsumer(connection, "group", "worker")
+
+        self.assertEqual(consumer.read(), [])
+        connection.xgroup_create.assert_called_once_with(
+            "changes", "group", id="$", mkstream=True)
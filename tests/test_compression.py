@@ -0,0 +1,253 @@
+"""
+Testing the response compression
+"""
+
+import gzip
+import unittest
+import zlib
+import compression
+from compression import CompressedCache, CompressionMiddleware
+from unittest.mock import MagicMock, patch
+from webob.headers import ResponseHeaders
+
+PAGE = b"<p>Some links, some tags, some more links.</p>\n" * 100
+
+
+def page(status='200 OK', headers=(), body=PAGE, chunks=1):
+    """
+    A WSGI app answering with body, in that many chunks, for every request.
+    """
+    size = len(body) // chunks + 1
+    closed = MagicMock()
+
+    class Body(list):
+        close = closed
+
+    def app(environ, start_response):
+        start_response(status, [('Content-Type', 'text/html')] + list(headers))
+        return Body(body[i:i + size] for i in range(0, len(body), size))
+
+    app.closed = closed
+    return app
+
+
+class Response:
+    """
+    What the middleware sent. Not WebTest, it ungzips bodies on its own.
+    """
+    def __init__(self, app, accept="gzip", method='GET', **kwargs):
+        environ = {'REQUEST_METHOD': method, 'PATH_INFO': '/page'}
+
+        if accept:
+            environ['HTTP_ACCEPT_ENCODING'] = accept
+
+        def start_response(status, headers, exc_info=None):
+            self.status = status
+            self.headers = ResponseHeaders(headers)
+
+        result = CompressionMiddleware(app, **kwargs)(environ, start_response)
+        self.body = b"".join(result)
+
+
+class ChooseEncodingTest(unittest.TestCase):
+    """
+    Testing compression.choose_encoding
+    """
+
+    def test_choose_encoding(self):
+
+        both = ('br', 'gzip')
+
+        self.assertEqual(compression.choose_encoding("gzip, deflate, br", both), 'br')
+        self.assertEqual(compression.choose_encoding("gzip, deflate, br", ('gzip',)), 'gzip')
+        self.assertEqual(compression.choose_encoding("br;q=0.5, gzip", both), 'gzip')
+        self.assertEqual(compression.choose_encoding("*", both), 'br')
+        self.assertEqual(compression.choose_encoding("*, br;q=0", both), 'gzip')
+        self.assertEqual(compression.choose_encoding("GZIP;q=0.1", both), 'gzip')
+        self.assertIsNone(compression.choose_encoding("gzip;q=0", both))
+        self.assertIsNone(compression.choose_encoding("identity", both))
+        self.assertIsNone(compression.choose_encoding("", both))
+
+
+class CompressionMiddlewareTest(unittest.TestCase):
+    """
+    Testing CompressionMiddleware
+    """
+
+    def test_gzip(self):
+
+        app = page(chunks=5, headers=[('Content-Length', str(len(PAGE)))])
+        response = Response(app)
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(gzip.decompress(response.body), PAGE)
+        self.assertLess(len(response.body), len(PAGE) // 10)
+        app.closed.assert_called_once_with()
+
+    def test_not_accepted(self):
+
+        response = Response(page(), accept=None)
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.body, PAGE)
+
+    def test_brotli_without_the_package(self):
+
+        with patch('compression.brotli', None):
+            response = Response(page(), accept="br")
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.body, PAGE)
+
+    def test_small(self):
+
+        app = page(body=b"<p>tiny</p>", chunks=3)
+        response = Response(app)
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.body, b"<p>tiny</p>")
+        app.closed.assert_called_once_with()
+
+    def test_small_by_content_length(self):
+
+        response = Response(page(headers=[('Content-Length', str(len(PAGE)))]), min_bytes=len(PAGE) + 1)
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.body, PAGE)
+
+    def test_not_modified(self):
+
+        def app(environ, start_response):
+            start_response('304 Not Modified', [('ETag', '"abc"')])
+            return [b""]
+
+        response = Response(app)
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertNotIn('Vary', response.headers)
+
+    def test_already_encoded(self):
+
+        body = gzip.compress(PAGE)
+        response = Response(page(headers=[('Content-Encoding', 'gzip')], body=body))
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.body, body)
+
+    def test_not_text(self):
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'image/png')])
+            return [PAGE]
+
+        response = Response(app)
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertNotIn('Vary', response.headers)
+
+    def test_adds_to_vary(self):
+
+        response = Response(page(headers=[('Vary', 'Cookie')]))
+
+        self.assertEqual(response.headers.getall('Vary'), ['Cookie, Accept-Encoding'])
+
+    def test_head(self):
+
+        response = Response(page(), method='HEAD')
+
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_streamed_page(self):
+
+        started = []
+
+        def app(environ, start_response):
+            yield b""
+            start_response('200 OK', [('Content-Type', 'text/html')])
+            started.append(True)
+
+            for i in range(0, len(PAGE), 100):
+                yield PAGE[i:i + 100]
+
+        response = Response(app)
+
+        self.assertEqual(started, [True])
+        self.assertEqual(gzip.decompress(response.body), PAGE)
+
+    def test_chunks_flushed(self):
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/html')])
+            return [PAGE, PAGE]
+
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/page', 'HTTP_ACCEPT_ENCODING': 'gzip'}
+        chunks = CompressionMiddleware(app)(environ, MagicMock())
+
+        first = next(iter(chunks))
+
+        # the first chunk can be decompressed without the rest.
+        self.assertEqual(zlib.decompressobj(31).decompress(first), PAGE)
+
+
+    def test_small_streamed_head_not_held(self):
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/html')])
+            yield b"<h1>Links</h1>"
+            raise AssertionError("held the head for the links")
+
+        start_response = MagicMock()
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/page', 'HTTP_ACCEPT_ENCODING': 'gzip'}
+        chunks = iter(CompressionMiddleware(app)(environ, start_response))
+
+        first = next(chunks)
+
+        start_response.assert_called_once()
+        self.assertEqual(zlib.decompressobj(31).decompress(first), b"<h1>Links</h1>")
+
+
+class CompressedCacheTest(unittest.TestCase):
+    """
+    Testing keeping compressed bodies by ETag
+    """
+
+    def test_cached_by_etag(self):
+
+        cache = CompressedCache()
+        app = page(headers=[('ETag', '"v1"')])
+        first = Response(app, cache=cache)
+
+        with patch('compression.Compressor') as compressor:
+            second = Response(app, cache=cache)
+
+        compressor.assert_not_called()
+        self.assertEqual(second.body, first.body)
+        self.assertEqual(gzip.decompress(second.body), PAGE)
+        self.assertEqual(second.headers['Content-Length'], str(len(second.body)))
+        self.assertEqual(second.headers['ETag'], 'W/"v1"')
+        self.assertEqual(first.headers['ETag'], 'W/"v1"')
+        self.assertEqual(app.closed.call_count, 2)
+
+    def test_no_etag_not_cached(self):
+
+        cache = CompressedCache()
+        Response(page(), cache=cache)
+
+        self.assertEqual(cache.entries, {})
+
+    def test_least_recently_used_dropped(self):
+
+        cache = CompressedCache(max_bytes=10, max_entry_bytes=5)
+
+        cache.put('a', b"aaaa")
+        cache.put('b', b"bbbb")
+        cache.get('a')
+        cache.put('c', b"cccc")
+        cache.put('d', b"dddddd")
+
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertEqual(cache.size, 8)
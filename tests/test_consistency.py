@@ -0,0 +1,112 @@
+"""
+Testing the consistency module.
+"""
+
+import unittest
+import consistency
+from edit import created_score
+from datetime import datetime
+from unittest.mock import patch
+from unittest.mock import MagicMock
+
+
+class HelpersTest(unittest.TestCase):
+    """
+    Tests for the small helpers.
+    """
+
+    def test_expected_score(self):
+
+        self.assertEqual(
+            consistency.expected_score("01-15-2017 @ 00:00"),
+            created_score(datetime(2017, 1, 15)))
+
+        self.assertIsNone(consistency.expected_score(""))
+        self.assertIsNone(consistency.expected_score("yesterday-ish"))
+
+    def test_score_is_wrong(self):
+
+        self.assertFalse(consistency.score_is_wrong(100.0, 130.0))
+        self.assertTrue(consistency.score_is_wrong(100.0, 160.0))
+        self.assertFalse(consistency.score_is_wrong(100.0, None))
+
+    @patch('consistency.time')
+    def test_rate_limiter(self, mocked_time):
+
+        mocked_time.monotonic.return_value = 0.0
+
+        limiter = consistency.RateLimiter(100)
+        limiter.wait(50)
+
+        mocked_time.sleep.assert_called_once_with(0.5)
+
+    @patch('consistency.time')
+    def test_no_rate_limit(self, mocked_time):
+
+        mocked_time.monotonic.return_value = 0.0
+
+        consistency.RateLimiter(None).wait(50)
+        mocked_time.sleep.assert_not_called()
+
+
+class IndexCheckerTest(unittest.TestCase):
+    """
+    Tests for consistency.IndexChecker
+    """
+
+    def mocked_checker(self, repair=False):
+        lm = MagicMock()
+        lm.prefix_key.side_effect = lambda x: "link:%s" % (x,)
+        return consistency.IndexChecker(lm, repair=repair), lm.connection
+
+    def test_link_problems(self):
+
+        checker, connection = self.mocked_checker()
+        score = created_score(datetime(2017, 1, 15))
+
+        # sorted:date right, tag:a missing, tag:b wrong, url index missing
+        replies = iter([score, None, score + 3600, None])
+
+        problems = checker._link_problems(
+            "id", "http://example.com", "a|b", "01-15-2017 @ 00:00", replies)
+
+        self.assertEqual(problems, [
+            ("missing_from_tag_index", "tag:a"),
+            ("wrong_tag_score", "tag:b"),
+            ("missing_from_url_index", "url_index"),
+        ])
+
+    def test_link_without_problems(self):
+
+        checker, connection = self.mocked_checker()
+        score = created_score(datetime(2017, 1, 15)) + 12
+
+        replies = iter([score, score, "id"])
+
+        problems = checker._link_problems(
+            "id", "http://example.com", "a", "01-15-2017 @ 00:00", replies)
+
+        self.assertEqual(problems, [])
+
+    def test_leftovers_reported_not_deleted(self):
+
+        checker, connection = self.mocked_checker()
+        connection.scan_iter.side_effect = lambda pattern, count: iter(
+            ["to-read:bob:temp"] if pattern == "to-read:*:temp" else [])
+
+        checker.remove_leftovers()
+
+        connection.delete.assert_not_called()
+        self.assertEqual(checker.report.counts["leftover_key"], 1)
+        self.assertEqual(checker.report.fixed["leftover_key"], 0)
+
+    def test_leftovers_deleted_on_repair(self):
+
+        checker, connection = self.mocked_checker(repair=True)
+        connection.scan_iter.side_effect = lambda pattern, count: iter(
+            ["url_hold"] if pattern == "url_hold" else [])
+
+        checker.remove_leftovers()
+
+        connection.delete.assert_called_once_with("url_hold")
+        self.assertEqual(checker.report.fixed["leftover_key"], 1)
@@ -6,9 +6,11 @@ add, modify, delete, rename etc.
 LinkManager class.
 """
 
+import redis
 import unittest
 from datetime import datetime
-from edit import LinkManager
+from edit import LinkManager, LinkRecord, ReadingListManager, chunks, clean_tags, hydrate_links, iter_hydrate_links, normalize_url
+from edit import make_cursor, page_from_replies, read_cursor
 from unittest.mock import patch
 from unittest.mock import MagicMock
 
@@ -26,6 +28,7 @@ class LinkManagerTest(unittest.TestCase):
         
         mocked_inst = mocked_class()
         mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_pipe.hget.return_value = None
         
         date = datetime(2017, 1, 15)
         
@@ -50,11 +53,47 @@ class LinkManagerTest(unittest.TestCase):
                ["fooa", "fooc", "foob"],
                date)
         
-        mocked_pipe.hmset.assert_called_with("redis_key", expected)
+        mocked_pipe.hset.assert_any_call("redis_key", mapping=expected)
+        mocked_pipe.hset.assert_any_call("url_index", "http://www.thisisnotaurl.com", "raw_id")
         
-        mocked_pipe.hmset.assert_called_once()
+        self.assertEqual(mocked_pipe.hset.call_count, 2)
         self.assertEqual(mocked_pipe.zadd.call_count, 4)
         
+        # the url is looked up with the index watched, so a link added with
+        # the same url in between makes the transaction run again.
+        mocked_pipe.watch.assert_called_once_with("url_index")
+        mocked_pipe.multi.assert_called_once()
+        
+    def test_add_url_exists(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_pipe.hget.return_value = "someone_else"
+        
+        lm = LinkManager()
+        lm.key = MagicMock(return_value=("raw_id", "redis_key"))
+        
+        with self.assertRaises(Exception):
+            lm.add("Title", "Text", "http://www.thisisnotaurl.com", "Hubert", ["fooa"], datetime(2017, 1, 15))
+            
+        mocked_pipe.multi.assert_not_called()
+        mocked_pipe.execute.assert_not_called()
+        
+    def test_add_retries_on_watch_error(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_pipe.hget.return_value = None
+        mocked_pipe.execute.side_effect = [redis.WatchError(), []]
+        
+        lm = LinkManager()
+        lm.key = MagicMock(return_value=("raw_id", "redis_key"))
+        
+        self.assertEqual(
+            lm.add("Title", "Text", "http://www.thisisnotaurl.com", "Hubert", ["fooa"], datetime(2017, 1, 15)),
+            "raw_id")
+        self.assertEqual(mocked_pipe.watch.call_count, 2)
+        
     def test_delete_happy_path(self, mocked_class):
         """
         LinkManager.delete happy path.
@@ -64,12 +103,14 @@ class LinkManagerTest(unittest.TestCase):
         mocked_pipe = mocked_inst.pipeline().__enter__()
         
         mocked_inst.hmget.return_value = ["fooa|foob|fooc"]
+        mocked_pipe.hget.return_value = "fake_key"
         
         lm = LinkManager()
         lm.delete("fake_key")
         
         self.assertEqual(mocked_pipe.zrem.call_count, 4)
         self.assertEqual(mocked_pipe.delete.call_count, 1)
+        mocked_pipe.watch.assert_called_once_with("url_index")
         
         
     def test_modify_happy_path(self, mocked_class):
@@ -82,6 +123,7 @@ class LinkManagerTest(unittest.TestCase):
         
         mocked_inst.hmget.return_value = ["fooa|foo1|foo4"]
         mocked_inst.zscore.return_value = 10.0
+        mocked_pipe.hget.return_value = None
         
         date = datetime(2017, 1, 15)
         
@@ -106,20 +148,600 @@ class LinkManagerTest(unittest.TestCase):
             'tags': "extra|fooa|foob|fooc"
         }
         
-        mocked_pipe.hmset.assert_called_with("link:mocked_id", expected)
+        mocked_pipe.hset.assert_any_call("link:mocked_id", mapping=expected)
+        mocked_pipe.hset.assert_any_call("url_index", "http://www.mthisisnotaurl.com", "mocked_id")
+        mocked_pipe.watch.assert_called_once_with("url_index")
         
         self.assertEqual(mocked_pipe.zrem.call_count, 3)
-        self.assertEqual(mocked_pipe.zadd.call_count, 4)
+        # one for each new tag, plus sorted:date since created changed.
+        self.assertEqual(mocked_pipe.zadd.call_count, 5)
         
     
+class ChunksTest(unittest.TestCase):
+    """
+    Tests for chunks
+    """
+    
+    def test_chunks(self):
+        
+        self.assertEqual(list(chunks(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(chunks([], 2)), [])
+        
+        
+class NormalizeUrlTest(unittest.TestCase):
+    """
+    Test suite for normalize_url.
+    """
+    
+    def test_case_and_trailing_slash(self):
+        
+        self.assertEqual(
+            normalize_url("HTTP://WWW.Example.com/Some/Path/"),
+            "http://www.example.com/Some/Path")
+            
+        self.assertEqual(
+            normalize_url("http://www.example.com/"),
+            normalize_url("http://www.example.com"))
+            
+    def test_default_port(self):
+        
+        self.assertEqual(
+            normalize_url("https://example.com:443/a"), 
+            "https://example.com/a")
+        self.assertEqual(
+            normalize_url("https://example.com:8443/a"), 
+            "https://example.com:8443/a")
+            
+    def test_tracking_params(self):
+        
+        self.assertEqual(
+            normalize_url("http://example.com/a?utm_source=x&id=3&fbclid=abc&UTM_Medium=y"),
+            "http://example.com/a?id=3")
+        self.assertEqual(
+            normalize_url("http://example.com/a?utm_campaign=z"),
+            "http://example.com/a")
+            
+            
+@patch('edit.redis.StrictRedis')
+class UrlIndexTest(unittest.TestCase):
+    """
+    Test suite for the url index kept by LinkManager.
+    """
+    
+    def test_url_owner_uses_normalized_url(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_inst.hget.return_value = "some_id"
+        
+        lm = LinkManager()
+        
+        self.assertEqual(lm.url_owner("HTTP://Example.com/?utm_source=x"), "some_id")
+        mocked_inst.hget.assert_called_once_with("url_index", "http://example.com")
+        
+    def test_url_exists(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        lm = LinkManager()
+        
+        mocked_inst.hget.return_value = None
+        self.assertFalse(lm.url_exists("http://example.com"))
+        
+        mocked_inst.hget.return_value = "some_id"
+        self.assertTrue(lm.url_exists("http://example.com"))
+        
+    def test_delete_removes_url(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        
+        mocked_inst.hmget.return_value = ["http://Example.com/"]
+        mocked_pipe.hget.return_value = "fake_key"
+        
+        lm = LinkManager()
+        lm.delete("fake_key")
+        
+        mocked_pipe.hget.assert_called_once_with("url_index", "http://example.com")
+        mocked_pipe.hdel.assert_called_once_with("url_index", "http://example.com")
+        
+    def test_delete_leaves_other_links_url(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        
+        mocked_inst.hmget.return_value = ["http://a.com"]
+        mocked_pipe.hget.return_value = "other_link"
+        
+        lm = LinkManager()
+        lm.delete("fake_key")
+        
+        mocked_pipe.delete.assert_called_once_with("link:fake_key")
+        # the url is another link's, so it stays in the index.
+        mocked_pipe.hdel.assert_not_called()
+        
+        
+class LinkRecordTest(unittest.TestCase):
+    """
+    Test suite for LinkRecord.
+    """
+    
+    def test_from_values(self):
+        
+        record = LinkRecord.from_values(('key', 'page_title', 'tags'), ['abc', 'Title', 'one|two'])
+        
+        self.assertEqual(record.key, 'abc')
+        self.assertEqual(record.page_title, 'Title')
+        self.assertEqual(record.tags_text, 'one|two')
+        self.assertEqual(record.tags, [{'name': 'one'}, {'name': 'two'}])
+        
+        # fields that weren't fetched are missing, not None
+        self.assertFalse(hasattr(record, 'desc_text'))
+        
+    def test_from_values_missing_link(self):
+        
+        self.assertIsNone(LinkRecord.from_values(('key', 'tags'), [None, None]))
+        
+    def test_tags_not_fetched(self):
+        
+        record = LinkRecord.from_values(('key',), ['abc'])
+        self.assertFalse(hasattr(record, 'tags'))
+        
+    def test_from_hash_and_to_dict(self):
+        
+        data = {
+            'page_title': "Words In The Title", 
+            'desc_text': "The little brown fox jumps over the fence.", 
+            'url_address': "http://www.thisisnotaurl.com",
+            'key': "raw_id",
+            'author': "Hubert",
+            'created': "01-15-2017 @ 00:00", 
+            'tags': "fooa|foob|fooc"
+        }
+        
+        record = LinkRecord.from_hash(data)
+        self.assertEqual(record.to_dict(), data)
+        self.assertIsNone(LinkRecord.from_hash({}))
+        
+        
+@patch('edit.redis.StrictRedis')
+class ListingFieldsTest(unittest.TestCase):
+    """
+    Test suite for LinkManager.listing with a field list.
+    """
+    
+    def test_listing_uses_hmget(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        
+        mocked_inst.zrevrange.return_value = ["one", "two", "gone"]
+        mocked_pipe.execute.return_value = [["one", "Title One"], ["two", "Title Two"], [None, None]]
+        
+        lm = LinkManager()
+        result = lm.listing(start=0, stop=9, fields=('key', 'page_title'))
+        
+        mocked_pipe.hgetall.assert_not_called()
+        mocked_pipe.hmget.assert_any_call("link:one", ('key', 'page_title'))
+        
+        self.assertEqual([x.key for x in result], ["one", "two"])
+        self.assertEqual(result[1].page_title, "Title Two")
+        
+        
+class HydrateLinksTest(unittest.TestCase):
+    """
+    Test suite for hydrate_links.
+    """
+    
+    def mocked_connection(self):
+        connection = MagicMock()
+        pipe = connection.pipeline().__enter__()
+        
+        # echo back what was asked for, one reply per hmget in the pipeline.
+        def execute():
+            replies = [[call[1][0][5:], "title"] for call in pipe.hmget.mock_calls]
+            pipe.hmget.reset_mock()
+            return replies
+            
+        pipe.execute.side_effect = execute
+        connection.pipeline.reset_mock()
+        
+        return connection, pipe
+        
+    def test_not_a_transaction(self):
+        
+        connection, pipe = self.mocked_connection()
+        
+        hydrate_links(connection, ["one"], fields=('key', 'page_title'))
+        connection.pipeline.assert_called_once_with(transaction=False)
+        
+    def test_repeated_ids_fetched_once(self):
+        
+        connection, pipe = self.mocked_connection()
+        
+        result = hydrate_links(connection, ["one", "two", "one"], fields=('key', 'page_title'))
+        
+        self.assertEqual(pipe.execute.call_count, 1)
+        self.assertEqual([x.key for x in result], ["one", "two", "one"])
+        
+    def test_chunks(self):
+        
+        connection, pipe = self.mocked_connection()
+        
+        ids = ["id%s" % (x,) for x in range(25)]
+        result = hydrate_links(connection, ids, fields=('key', 'page_title'), chunk_size=10)
+        
+        self.assertEqual(pipe.execute.call_count, 3)
+        self.assertEqual([x.key for x in result], ids)
+        
+    def test_memo(self):
+        
+        connection, pipe = self.mocked_connection()
+        memo = {}
+        
+        first = hydrate_links(connection, ["one"], fields=('key', 'page_title'), memo=memo)
+        second = hydrate_links(connection, ["one", "two"], fields=('key', 'page_title'), memo=memo)
+        
+        self.assertEqual(pipe.execute.call_count, 2)
+        self.assertIs(first[0], second[0])
+        self.assertEqual(second[1].key, "two")
+        
+    def test_iter_batches(self):
+        
+        connection, pipe = self.mocked_connection()
+        
+        ids = ["id%s" % (x,) for x in range(25)]
+        batches = iter_hydrate_links(connection, ids, fields=('key', 'page_title'), batch_size=10)
+        
+        # nothing is fetched until a batch is asked for, then just that one.
+        self.assertEqual(pipe.execute.call_count, 0)
+        self.assertEqual([x.key for x in next(batches)], ids[:10])
+        self.assertEqual(pipe.execute.call_count, 1)
+        
+        self.assertEqual([[x.key for x in batch] for batch in batches], [ids[10:20], ids[20:]])
+        self.assertEqual(pipe.execute.call_count, 3)
+        
+        
 @patch('edit.redis.StrictRedis')
 class ReadingListManagerTest(unittest.TestCase):
     """
     Test suite for ReadingListManager.
     """
     
+    def test_add_happy_path(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        
+        rl = ReadingListManager()
+        rl.add("someone", "link_id")
+        
+        self.assertEqual(mocked_pipe.zadd.call_args[0][0], "unread:someone")
+        mocked_pipe.zrem.assert_called_once_with("read:someone", "link_id")
+        
+    def test_read_moves_link(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_pipe.zscore.return_value = 10.0
+        
+        rl = ReadingListManager()
+        
+        self.assertTrue(rl.read("someone", "link_id"))
+        mocked_pipe.watch.assert_called_once_with("unread:someone")
+        mocked_pipe.zrem.assert_called_once_with("unread:someone", "link_id")
+        self.assertEqual(mocked_pipe.zadd.call_args[0][0], "read:someone")
+        
+    def test_read_not_on_list(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_pipe.zscore.return_value = None
+        
+        rl = ReadingListManager()
+        
+        self.assertFalse(rl.read("someone", "link_id"))
+        mocked_pipe.zadd.assert_not_called()
+        
+    def test_to_read_paginated(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_inst.zrevrange.return_value = ["one"]
+        mocked_pipe.execute.return_value = [["one"]]
+        
+        rl = ReadingListManager()
+        result = rl.to_read("someone", start=20, stop=39, fields=('key',))
+        
+        mocked_inst.zrevrange.assert_called_once_with("unread:someone", 20, 39)
+        self.assertEqual([x.key for x in result], ["one"])
+        
+    def test_iter_all_to_read(self, mocked_class):
+        
+        rl = ReadingListManager()
+        rl.page = MagicMock(side_effect=[(["one", "two"], "cursor-1"), (["three"], None)])
+        
+        batches = list(rl.iter_all_to_read("someone", fields=('key',), batch_size=2))
+        
+        self.assertEqual(batches, [["one", "two"], ["three"]])
+        rl.page.assert_any_call("someone", cursor=None, count=2, fields=('key',))
+        rl.page.assert_any_call("someone", cursor="cursor-1", count=2, fields=('key',))
+        
+    def test_count(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        
+        rl = ReadingListManager()
+        rl.count("someone")
+        rl.count("someone", read=True)
+        
+        mocked_inst.zcard.assert_any_call("unread:someone")
+        mocked_inst.zcard.assert_any_call("read:someone")
+
+
+class CleanTagsTest(unittest.TestCase):
+    """
+    Tests for edit.clean_tags
+    """
+    
+    def test_clean_tags(self):
+        
+        self.assertEqual(clean_tags([" b", "a", "b ", ""]), ["a", "b"])
+        
+        with self.assertRaises(TypeError):
+            clean_tags("a|b")
+            
+        with self.assertRaises(ValueError):
+            clean_tags([" "])
+            
+            
+@patch('edit.redis.StrictRedis')
+class BatchWriteTest(unittest.TestCase):
+    """
+    Test suite for LinkManager.add_many, delete_many and retag_many.
+    """
     
+    def test_add_many(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_inst.hmget.return_value = ["taken", None, None]
+        mocked_pipe.hmget.return_value = [None]
+        
+        lm = LinkManager()
+        lm.key = MagicMock(side_effect=[("one", "link:one"), ("two", "link:two")])
+        
+        results = lm.add_many([
+            {'url_address': "http://taken.com", 'tags': ["a"]},
+            {'url_address': "http://new.com", 'tags': ["a", "b"], 'created': datetime(2017, 1, 15)},
+            {'url_address': "http://new.com/", 'tags': ["c"]},
+            {'url_address': "http://bad.com", 'tags': "a|b"},
+        ], author="Hubert")
+        
+        # one lookup for every url that passed the checks.
+        mocked_inst.hmget.assert_called_once_with(
+            "url_index", ["http://taken.com", "http://new.com", "http://new.com"])
+        
+        self.assertEqual([x['key'] for x in results], ["taken", "one", "one", None])
+        self.assertEqual([x['error'] is None for x in results], [False, True, False, False])
+        
+        mocked_pipe.hset.assert_any_call("link:one", mapping={
+            'page_title': '',
+            'desc_text': '',
+            'url_address': "http://new.com",
+            'key': "one",
+            'author': "Hubert",
+            'created': "01-15-2017 @ 00:00",
+            'tags': "a|b"
+        })
+        self.assertEqual(mocked_pipe.zadd.call_count, 3)
+        mocked_pipe.execute.assert_called_once()
+        mocked_pipe.watch.assert_called_once_with("url_index")
+        mocked_pipe.hmget.assert_called_once_with("url_index", ["http://new.com"])
+        
+    def test_add_many_url_taken_meanwhile(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_inst.hmget.return_value = [None]
+        mocked_pipe.hmget.return_value = ["someone_else"]
+        
+        lm = LinkManager()
+        lm.key = MagicMock(return_value=("one", "link:one"))
+        
+        results = lm.add_many([{'url_address': "http://new.com", 'tags': ["a"]}])
+        
+        self.assertEqual(results, [{'key': "someone_else", 'error': "URL 'http://new.com' exists"}])
+        mocked_pipe.hset.assert_not_called()
+        
+    def test_delete_many(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_pipe.execute.side_effect = [
+            [["http://a.com", "x|y"], [None, None]], 
+            []]
+        mocked_pipe.hmget.return_value = ["one"]
+        
+        lm = LinkManager()
+        results = lm.delete_many(["one", "gone"])
+        
+        self.assertEqual(results, [
+            {'key': "one", 'error': None}, 
+            {'key': "gone", 'error': "Link not found"}])
+        mocked_pipe.delete.assert_called_once_with("link:one")
+        mocked_pipe.hdel.assert_called_once_with("url_index", "http://a.com")
+        self.assertEqual(mocked_pipe.zrem.call_count, 3)
+        mocked_pipe.hmget.assert_called_with("url_index", ["http://a.com"])
+        
+    def test_delete_many_leaves_other_links_url(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_pipe.execute.side_effect = [
+            [["http://a.com", "x"]], 
+            []]
+        mocked_pipe.hmget.return_value = ["other_link"]
+        
+        lm = LinkManager()
+        lm.delete_many(["one"])
+        
+        mocked_pipe.delete.assert_called_once_with("link:one")
+        mocked_pipe.hdel.assert_not_called()
+        
+    def test_retag_many(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_pipe.execute.side_effect = [
+            ["old|keep", 100.0, "old", 200.0], 
+            []]
+        
+        lm = LinkManager()
+        results = lm.retag_many(["one", "two"], add=["new"], remove=["old"])
+        
+        self.assertEqual([x['error'] for x in results], [None, None])
+        mocked_pipe.hset.assert_any_call("link:one", "tags", "keep|new")
+        mocked_pipe.hset.assert_any_call("link:two", "tags", "new")
+        mocked_pipe.zrem.assert_any_call("tag:old", "one")
+        mocked_pipe.zadd.assert_any_call("tag:new", {"two": 200.0})
+        mocked_pipe.watch.assert_called_once_with("link:one", "link:two")
+        
+    def test_retag_many_edited_meanwhile(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_pipe.execute.side_effect = [
+            ["old", 100.0], 
+            redis.WatchError(),
+            ["other", 100.0],
+            []]
+            
+        lm = LinkManager()
+        results = lm.retag_many(["one"], add=["new"], remove=["old"])
+        
+        # read again after the link changed, and written from what was read.
+        self.assertEqual(results, [{'key': "one", 'error': None}])
+        self.assertEqual(mocked_pipe.watch.call_count, 2)
+        mocked_pipe.hset.assert_called_with("link:one", "tags", "new|other")
+        
+    def test_retag_many_leaves_a_tag(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_pipe.execute.side_effect = [["old", 100.0]]
+        
+        lm = LinkManager()
+        results = lm.retag_many(["one"], remove=["old"])
+        
+        self.assertEqual(results[0]['error'], 'At least one tag must be provided.')
+        mocked_pipe.hset.assert_not_called()
+        
+        
+@patch('edit.redis.StrictRedis')
+class MergeTagsTest(unittest.TestCase):
+    """
+    Test suite for LinkManager.merge_tags and rename_tag.
+    """
     
+    def test_merge_tags(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        
+        lm = LinkManager()
+        lm.retag_script = MagicMock(side_effect=[[2, 2], [2, 1], [0, 0], [1, 1]])
+        
+        self.assertEqual(lm.merge_tags([" py", "pyhton", "python"], "python", batch_size=2), 4)
+        
+        mocked_inst.zunionstore.assert_called_once_with(
+            "tag:python", ["tag:python", "tag:py", "tag:pyhton"], "MAX")
+        
+        # batches until one comes back short, for each tag.
+        self.assertEqual(lm.retag_script.call_count, 4)
+        self.assertEqual(
+            lm.retag_script.call_args[1]['keys'], ["tag:pyhton", "tag:python", "changes"])
+        self.assertEqual(lm.retag_script.call_args[1]['args'][:3], ["pyhton", "python", 2])
+        
+    def test_rename_tag_bad_name(self, mocked_class):
+        
+        lm = LinkManager()
+        
+        with self.assertRaises(ValueError):
+            lm.rename_tag("a", "b|c")
+            
+        with self.assertRaises(ValueError):
+            lm.rename_tag("a", " ")
+            
+    def test_rename_tag_to_itself(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        
+        lm = LinkManager()
+        
+        self.assertEqual(lm.rename_tag("a", "a"), 0)
+        mocked_inst.zunionstore.assert_not_called()
+            
+            
+class CursorTest(unittest.TestCase):
+    """
+    Tests for cursor paging, make_cursor and page_from_replies.
+    """
     
+    def test_round_trip(self):
+        
+        self.assertEqual(read_cursor(make_cursor("abc", 1234.5)), (1234.5, "abc"))
+        
+        with self.assertRaises(ValueError):
+            read_cursor("nonsense")
+            
+    def test_first_page(self):
+        
+        raw_ids, cursor = page_from_replies([[("c", 3.0), ("b", 2.0)]], None, 2)
+        
+        self.assertEqual(raw_ids, ["c", "b"])
+        self.assertEqual(cursor, make_cursor("b", 2.0))
+        
+    def test_ties_and_last_page(self):
+        
+        # "b" was the last one shown, "c" and "b" share its score.
+        replies = [[("c", 2.0), ("b", 2.0), ("a", 2.0)], [("z", 1.0)]]
+        
+        raw_ids, cursor = page_from_replies(replies, make_cursor("b", 2.0), 3)
+        
+        self.assertEqual(raw_ids, ["a", "z"])
+        self.assertIsNone(cursor)
+        
+        
+@patch('edit.redis.StrictRedis')
+class PageTest(unittest.TestCase):
+    """
+    Test suite for LinkManager.page and ReadingListManager.page.
+    """
     
-    
\ No newline at end of file
+    def test_link_page(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_pipe.execute.side_effect = [
+            [[], [("two", 1.0)]],
+            [["two", "Title"]]]
+        
+        lm = LinkManager()
+        links, cursor = lm.page("a", cursor=make_cursor("one", 5.0), count=1, 
+                                fields=('key', 'page_title'), as_dicts=True)
+        
+        mocked_pipe.zrevrangebyscore.assert_any_call(
+            "tag:a", "(5.0", "-inf", start=0, num=1, withscores=True)
+        self.assertEqual(links, [{'key': "two", 'page_title': "Title"}])
+        self.assertEqual(cursor, make_cursor("two", 1.0))
+        
+    def test_reading_list_page(self, mocked_class):
+        
+        mocked_inst = mocked_class()
+        mocked_pipe = mocked_inst.pipeline().__enter__()
+        mocked_pipe.execute.side_effect = [[[("one", 5.0)]], [["one"]]]
+        
+        rl = ReadingListManager()
+        links, cursor = rl.page("someone", count=2, read=True, fields=('key',))
+        
+        mocked_pipe.zrevrange.assert_called_once_with("read:someone", 0, 1, withscores=True)
+        self.assertEqual([x.key for x in links], ["one"])
+        self.assertIsNone(cursor)
@@ -0,0 +1,134 @@
+"""
+Testing the form parsing
+"""
+
+import io
+import unittest
+import forms
+from unittest.mock import patch
+
+FIELDS = ('page_title', 'desc_text', 'url_address', 'tags')
+
+
+def environ(body, content_type=forms.URLENCODED, length=None):
+    return {
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body) if length is None else length),
+        'wsgi.input': io.BytesIO(body),
+    }
+
+
+def multipart(boundary, parts):
+    body = b''
+
+    for headers, value in parts:
+        body += b'--' + boundary + b'\r\n' + headers + b'\r\n\r\n' + value + b'\r\n'
+
+    return body + b'--' + boundary + b'--\r\n'
+
+
+class UrlencodedTest(unittest.TestCase):
+    """
+    Testing forms.parse_form with urlencoded bodies
+    """
+
+    def test_fields(self):
+
+        body = "page_title=A+Title&desc_text=caf%C3%A9+%26+more&tags=one%7Ctwo&url_address=".encode('ascii')
+
+        self.assertEqual(forms.parse_form(environ(body), FIELDS), {
+            'page_title': "A Title",
+            'desc_text': "caf\xe9 & more",
+            'tags': "one|two",
+            'url_address': "",
+        })
+
+    def test_only_known_fields_first_value(self):
+
+        body = b"other=x&page_title=one&page_title=two"
+
+        self.assertEqual(forms.parse_form(environ(body), FIELDS), {'page_title': "one"})
+
+    @patch('forms.CHUNK_SIZE', 3)
+    def test_pairs_across_chunks(self):
+
+        body = b"page_title=A+Long+Title&tags=one"
+
+        self.assertEqual(forms.parse_form(environ(body), FIELDS), {'page_title': "A Long Title", 'tags': "one"})
+
+    def test_reads_content_length_only(self):
+
+        longer = environ(b"tags=one&page_title=two", length=8)
+
+        self.assertEqual(forms.parse_form(longer, FIELDS), {'tags': "one"})
+
+        # what's past CONTENT_LENGTH is left unread, not an error.
+        self.assertEqual(longer['wsgi.input'].tell(), 8)
+
+    def test_too_large(self):
+
+        wsgi_input = io.BytesIO(b"tags=one")
+        too_big = dict(environ(b"", length=100), **{'wsgi.input': wsgi_input})
+
+        with self.assertRaises(forms.FormTooLarge):
+            forms.parse_form(too_big, FIELDS, max_bytes=99)
+
+        # it didn't read any of it.
+        self.assertEqual(wsgi_input.tell(), 0)
+
+    def test_not_a_form(self):
+
+        with self.assertRaises(forms.FormError):
+            forms.parse_form(environ(b"{}", content_type="application/json"), FIELDS)
+
+        with self.assertRaises(forms.FormError):
+            forms.parse_form(environ(b"", length="lots"), FIELDS)
+
+
+class MultipartTest(unittest.TestCase):
+    """
+    Testing forms.parse_form with multipart bodies
+    """
+
+    def parse(self, body, boundary=b"XyZ"):
+        content_type = 'multipart/form-data; boundary="%s"' % (boundary.decode(),)
+        return forms.parse_form(environ(body, content_type), FIELDS)
+
+    def test_fields(self):
+
+        body = multipart(b"XyZ", [
+            (b'Content-Disposition: form-data; name="page_title"', "Caf\xe9".encode('utf-8')),
+            (b'Content-Disposition: form-data; name="other"', b"skipped"),
+            (b'Content-Disposition: form-data; name="desc_text"', b"line one\r\nline two"),
+            (b'Content-Disposition: form-data; name="tags"; filename="tags.txt"\r\nContent-Type: text/plain', b"a file"),
+            (b'Content-Disposition: form-data; name="url_address"', b""),
+        ])
+
+        self.assertEqual(self.parse(body), {
+            'page_title': "Caf\xe9",
+            'desc_text': "line one\r\nline two",
+            'url_address': "",
+        })
+
+    def test_every_chunk_size(self):
+
+        body = multipart(b"XyZ", [
+            (b'Content-Disposition: form-data; name="page_title"', b"A Title --XyZ not the end"),
+            (b'Content-Disposition: form-data; name="tags"', b"one|two"),
+        ])
+
+        for size in (1, 2, 5, 7, 64):
+            with patch('forms.CHUNK_SIZE', size):
+                self.assertEqual(self.parse(body), {'page_title': "A Title --XyZ not the end", 'tags': "one|two"})
+
+    def test_cut_short(self):
+
+        body = multipart(b"XyZ", [(b'Content-Disposition: form-data; name="tags"', b"one")])
+
+        with self.assertRaises(forms.FormError):
+            self.parse(body[:-12])
+
+    def test_no_boundary(self):
+
+        with self.assertRaises(forms.FormError):
+            forms.parse_form(environ(b"", forms.MULTIPART), FIELDS)
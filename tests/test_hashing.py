@@ -0,0 +1,107 @@
+"""
+Testing the password hashing pool
+"""
+
+import asyncio
+import unittest
+import hashing
+from concurrent.futures import Future
+from unittest.mock import patch
+
+
+def finished(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class HashPoolTest(unittest.TestCase):
+    """
+    Tests for hashing.HashPool, with the process pool mocked out.
+    """
+
+    @patch('hashing.ProcessPoolExecutor')
+    def test_result(self, mocked_executor):
+
+        mocked_executor().submit.return_value = finished((True, 0.0))
+        pool = hashing.HashPool(workers=2)
+
+        self.assertTrue(pool.verify("secret", "hashed"))
+        mocked_executor().submit.assert_called_once_with(hashing.verify_password, "secret", "hashed")
+
+    @patch('hashing.ProcessPoolExecutor')
+    def test_await(self, mocked_executor):
+
+        mocked_executor().submit.return_value = finished(("hashed", 0.0))
+        pool = hashing.HashPool(workers=2)
+
+        async def hash_it():
+            return await pool.submit(hashing.hash_password, "secret")
+
+        self.assertEqual(asyncio.run(hash_it()), "hashed")
+
+    @patch('hashing.ProcessPoolExecutor')
+    def test_busy(self, mocked_executor):
+
+        mocked_executor().submit.return_value = Future()
+        pool = hashing.HashPool(workers=1, max_queue=2)
+
+        pool.submit(hashing.hash_password, "one")
+        pool.submit(hashing.hash_password, "two")
+
+        with self.assertRaises(hashing.PoolBusy) as raised:
+            pool.submit(hashing.hash_password, "three")
+
+        self.assertEqual(raised.exception.retry_after, 1)
+        self.assertEqual(pool.stats()['pending'], 2)
+        self.assertEqual(pool.stats()['rejected'], 1)
+
+    @patch('hashing.time.time')
+    @patch('hashing.ProcessPoolExecutor')
+    def test_stats(self, mocked_executor, mocked_time):
+
+        future = Future()
+        mocked_executor().submit.return_value = future
+        pool = hashing.HashPool(workers=1, max_queue=2)
+
+        # submitted at 10, started at 12, done at 15
+        mocked_time.return_value = 10.0
+        pool.submit(hashing.hash_password, "one")
+        mocked_time.return_value = 15.0
+        future.set_result(("hashed", 12.0))
+
+        stats = pool.stats()
+        self.assertEqual(stats['pending'], 0)
+        self.assertEqual(stats['done'], 1)
+        self.assertEqual(stats['mean_wait'], 2.0)
+        self.assertEqual(stats['p99_wait'], 2.0)
+
+        # a 3 second hash, so two waiting should take 6
+        pool.pending = 2
+        self.assertEqual(pool.retry_after(), 6)
+
+    @patch('hashing.ProcessPoolExecutor')
+    def test_failed_call_frees_its_place(self, mocked_executor):
+
+        future = Future()
+        mocked_executor().submit.return_value = future
+        pool = hashing.HashPool(workers=1, max_queue=1)
+
+        pool.submit(hashing.hash_password, "one")
+        future.set_exception(ValueError())
+
+        self.assertEqual(pool.stats()['pending'], 0)
+        self.assertEqual(pool.stats()['done'], 0)
+
+
+class HashingTest(unittest.TestCase):
+    """
+    Tests for the functions run in the pool.
+    """
+
+    def test_hash_and_verify(self):
+
+        hashed, started = hashing.hash_password("secret")
+
+        self.assertTrue(hashing.verify_password("secret", hashed)[0])
+        self.assertFalse(hashing.verify_password("wrong", hashed)[0])
@@ -0,0 +1,148 @@
+"""
+Testing the metrics
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import metrics
+import wsgilinkapp
+from webtest import TestApp
+
+
+class ValueFileTest(unittest.TestCase):
+    """
+    Testing metrics.ValueFile
+    """
+
+    def test_add_and_read(self):
+
+        values = metrics.ValueFile()
+        one = values.position("one")
+        two = values.position("two")
+
+        values.add(one, 2)
+        values.add(one, 0.5)
+        values.set(two, 7)
+
+        self.assertEqual(values.position("one"), one)
+        self.assertEqual(dict(metrics.read_values(values.buffer)), {"one": 2.5, "two": 7.0})
+
+    def test_grows(self):
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        values = metrics.ValueFile(os.path.join(directory, "1.db"))
+        positions = [values.position("key number %s" % (x,)) for x in range(5000)]
+        values.add(positions[0], 1)
+        values.add(positions[-1], 2)
+        values.close()
+
+        with open(os.path.join(directory, "1.db"), 'rb') as source:
+            read = dict(metrics.read_values(source.read()))
+
+        self.assertEqual(len(read), 5000)
+        self.assertEqual(read["key number 0"], 1)
+        self.assertEqual(read["key number 4999"], 2)
+
+
+class MetricsTest(unittest.TestCase):
+    """
+    Testing metrics.Metrics
+    """
+
+    def test_render(self):
+
+        recorder = metrics.Metrics()
+        recorder.record_request("tag", "GET", "200", 0.003)
+        recorder.record_request("tag", "GET", "200", 0.02)
+
+        text = recorder.render()
+
+        self.assertIn('# TYPE linkapp_requests_total counter', text)
+        self.assertIn('linkapp_requests_total{route="tag",method="GET",status="200"} 2', text)
+        self.assertIn('linkapp_request_seconds_bucket{route="tag",le="0.0025"} 0', text)
+        self.assertIn('linkapp_request_seconds_bucket{route="tag",le="0.005"} 1', text)
+        self.assertIn('linkapp_request_seconds_bucket{route="tag",le="+Inf"} 2', text)
+        self.assertIn('linkapp_request_seconds_count{route="tag"} 2', text)
+
+    def test_processes_added_up(self):
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        # a pid nothing is running as any more
+        finished = subprocess.Popen([sys.executable, "-c", "pass"])
+        finished.wait()
+
+        recorder = metrics.Metrics(directory)
+        recorder.requests.labels("tag", "GET", "200").inc()
+        recorder.pool_max.labels("links").set(10)
+
+        gone = metrics.ValueFile(os.path.join(directory, "%s.db" % (finished.pid,)))
+        gone.add(gone.position(metrics.sample_key("linkapp_requests_total", "", [["route", "tag"], ["method", "GET"], ["status", "200"]])), 4)
+        gone.set(gone.position(metrics.sample_key("linkapp_redis_pool_max_connections", "", [["pool", "links"]])), 10)
+
+        text = recorder.render()
+
+        self.assertIn('linkapp_requests_total{route="tag",method="GET",status="200"} 5', text)
+        self.assertIn('linkapp_redis_pool_max_connections{pool="links"} 10', text)
+
+    def test_link_memo(self):
+
+        recorder = metrics.Metrics()
+        memo = metrics.LinkMemo()
+        memo['one'] = 1
+
+        self.assertTrue('one' in memo)
+        self.assertFalse('two' in memo)
+
+        recorder.record_request("listing", "GET", "200", 0.01, memo)
+
+        text = recorder.render()
+        self.assertIn('linkapp_link_memo_lookups_total{result="hit"} 1', text)
+        self.assertIn('linkapp_link_memo_lookups_total{result="miss"} 1', text)
+
+
+class MetricsMiddlewareTest(unittest.TestCase):
+    """
+    Testing metrics.MetricsMiddleware and the /metrics page.
+    """
+
+    def app(self, status):
+
+        def application(environ, start_response):
+            start_response(status, [('Content-Type', 'text/plain')])
+            return [b'body']
+
+        recorder = metrics.Metrics()
+        return recorder, TestApp(metrics.MetricsMiddleware(application, recorder),
+                                 extra_environ={'linkapp.path_prefix': '/'})
+
+    def test_records_request(self):
+
+        recorder, app = self.app('200 OK')
+        app.get("/tag/python")
+
+        self.assertIn('linkapp_requests_total{route="tag",method="GET",status="200"} 1', recorder.render())
+
+    def test_not_found_grouped(self):
+
+        recorder, app = self.app('404 Not Found')
+        app.get("/made-up", status=404)
+
+        self.assertIn('route="not_found"', recorder.render())
+
+    def test_metrics_page_needs_metrics(self):
+
+        app = TestApp(wsgilinkapp.show_metrics)
+        app.get("/metrics", status=404)
+
+        app = TestApp(wsgilinkapp.show_metrics, extra_environ={'linkapp.metrics': metrics.Metrics()})
+        resp = app.get("/metrics")
+
+        self.assertIn("# TYPE linkapp_requests_total counter", resp.text)
@@ -0,0 +1,110 @@
+"""
+Testing request profiling and the slow request log
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import profiling
+import tracing
+from webtest import TestApp
+from unittest.mock import patch
+
+
+def application(environ, start_response):
+    time.sleep(0.02)
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'body']
+
+
+class ProfilerTest(unittest.TestCase):
+    """
+    Testing profiling.Profiler and ProfilingMiddleware
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_wanted(self):
+
+        profiler = profiling.Profiler(self.directory, secret="secret")
+
+        self.assertTrue(profiler.wanted({'HTTP_X_PROFILE': "secret"}))
+        self.assertFalse(profiler.wanted({'HTTP_X_PROFILE': "guess"}))
+        self.assertFalse(profiler.wanted({}))
+
+    @patch('profiling.random.random', return_value=0.05)
+    def test_sampled(self, mocked_random):
+
+        self.assertTrue(profiling.Profiler(self.directory, sample_rate=0.1).wanted({}))
+        self.assertFalse(profiling.Profiler(self.directory, sample_rate=0.01).wanted({}))
+
+    def test_cprofile(self):
+
+        profiler = profiling.Profiler(self.directory, secret="secret")
+        app = TestApp(profiler.middleware(application), extra_environ={'linkapp.path_prefix': '/'})
+
+        resp = app.get("/tag/python", headers={'X-Profile': "secret"})
+
+        name = resp.headers['X-Profile-File']
+        self.assertTrue(name.endswith(".prof"))
+        self.assertIn("-tag-", name)
+        self.assertEqual(os.listdir(self.directory), [name])
+
+    def test_sampler(self):
+
+        profiler = profiling.Profiler(self.directory, secret="secret", sampler=True, interval=0.001)
+        app = TestApp(profiler.middleware(application), extra_environ={'linkapp.path_prefix': '/'})
+
+        resp = app.get("/", headers={'X-Profile': "secret"})
+
+        with open(os.path.join(self.directory, resp.headers['X-Profile-File'])) as source:
+            folded = source.read()
+
+        self.assertIn("test_profiling.py:application", folded)
+
+    def test_not_asked_for(self):
+
+        profiler = profiling.Profiler(self.directory, secret="secret")
+        app = TestApp(profiler.middleware(application), extra_environ={'linkapp.path_prefix': '/'})
+
+        resp = app.get("/")
+
+        self.assertNotIn('X-Profile-File', resp.headers)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class SlowRequestLogTest(unittest.TestCase):
+    """
+    Testing profiling.SlowRequestLog
+    """
+
+    def test_logs_slow_request(self):
+
+        def traced(environ, start_response):
+            trace = environ['linkapp.redis_trace'] = tracing.Trace()
+            trace.add(['ZCARD'], 0.002)
+            trace.add(['HMGET', 'HMGET'], 0.004)
+            return application(environ, start_response)
+
+        app = TestApp(profiling.SlowRequestLog(traced, 0.01), extra_environ={'linkapp.path_prefix': '/'})
+
+        with self.assertLogs("linkapp.slow_requests") as logged:
+            app.get("/tag/python")
+
+        message = logged.output[0]
+        self.assertIn("GET /tag/python (tag) 200", message)
+        self.assertIn("redis 6.0ms in 2 round trips", message)
+        self.assertIn("HMGET 2x 4.0ms", message)
+
+    def test_fast_request_not_logged(self):
+
+        app = TestApp(profiling.SlowRequestLog(application, 10), extra_environ={'linkapp.path_prefix': '/'})
+
+        with patch.object(profiling.slow_log, 'warning') as mocked_warning:
+            app.get("/")
+
+        mocked_warning.assert_not_called()
@@ -0,0 +1,221 @@
+"""
+Testing the restore module.
+"""
+
+import os
+import json
+import tempfile
+import unittest
+import restore
+from unittest.mock import patch
+from unittest.mock import MagicMock
+
+
+class CheckpointTest(unittest.TestCase):
+    """
+    Tests for restore.Checkpoint
+    """
+
+    def test_save_and_load(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = restore.Checkpoint(directory, 'links', 0, 2)
+            self.assertEqual(checkpoint.done, -1)
+
+            checkpoint.save(41)
+
+            self.assertEqual(restore.Checkpoint(directory, 'links', 0, 2).done, 41)
+
+            # a different split of the work starts from scratch.
+            self.assertEqual(restore.Checkpoint(directory, 'links', 0, 3).done, -1)
+
+
+@patch('restore.managers_for')
+@patch('restore.backup.read_lines')
+class RestorePartitionTest(unittest.TestCase):
+    """
+    Tests for restore.restore_partition
+    """
+
+    def records(self, count):
+        return [json.dumps({'key': "id%s" % (x,), 'page_title': "title"}) + "\n" for x in range(count)]
+
+    def mocked_managers(self, mocked_managers_for):
+        lm = MagicMock()
+        lm.prefix_key.side_effect = lambda x: "link:%s" % (x,)
+        mocked_managers_for.return_value = {'links': lm}
+        return lm, lm.connection.pipeline()
+
+    def test_keeps_ids_and_batches(self, mocked_read, mocked_managers_for):
+
+        mocked_read.return_value = iter(self.records(5))
+        lm, pipe = self.mocked_managers(mocked_managers_for)
+
+        written = restore.restore_partition("dir", "links", 0, 1, ("h", 1, 0), batch_size=2)
+
+        self.assertEqual(written, 5)
+        lm.connection.pipeline.assert_called_with(transaction=False)
+        pipe.hset.assert_any_call("link:id3", mapping={'key': "id3", 'page_title': "title"})
+        self.assertEqual(pipe.execute.call_count, 3)
+
+    def test_partitions(self, mocked_read, mocked_managers_for):
+
+        mocked_read.return_value = iter(self.records(5))
+        lm, pipe = self.mocked_managers(mocked_managers_for)
+
+        written = restore.restore_partition("dir", "links", 1, 2, ("h", 1, 0))
+
+        self.assertEqual(written, 2)
+        keys = [x[0][0] for x in pipe.hset.call_args_list]
+        self.assertEqual(keys, ["link:id1", "link:id3"])
+
+    def test_decodes_only_its_share(self, mocked_read, mocked_managers_for):
+
+        # the other worker's lines aren't valid JSON, they'd fail if decoded.
+        lines = self.records(4)
+        lines[0] = lines[2] = "not json\n"
+        mocked_read.return_value = iter(lines)
+        lm, pipe = self.mocked_managers(mocked_managers_for)
+
+        written = restore.restore_partition("dir", "links", 1, 2, ("h", 1, 0))
+
+        self.assertEqual(written, 2)
+
+    def test_resumes_from_checkpoint(self, mocked_read, mocked_managers_for):
+
+        mocked_read.return_value = iter(self.records(5))
+        lm, pipe = self.mocked_managers(mocked_managers_for)
+
+        with tempfile.TemporaryDirectory() as directory:
+            restore.Checkpoint(directory, 'links', 0, 1).save(2)
+
+            written = restore.restore_partition(
+                "dir", "links", 0, 1, ("h", 1, 0), checkpoint_directory=directory)
+
+            self.assertEqual(written, 2)
+            self.assertEqual(restore.Checkpoint(directory, 'links', 0, 1).done, 4)
+
+
+class IncrementalRestoreTest(unittest.TestCase):
+    """
+    Restoring incremental backups.
+    """
+
+    def test_check_chain(self):
+
+        full = {'type': 'full', 'changes_until': "5-0"}
+        first = {'type': 'incremental', 'changes_from': "5-0", 'changes_until': "9-0"}
+        second = {'type': 'incremental', 'changes_from': "9-0", 'changes_until': "12-0"}
+
+        restore.check_chain([full, first, second])
+
+        with self.assertRaises(ValueError):
+            restore.check_chain([first, second])
+
+        with self.assertRaises(ValueError):
+            restore.check_chain([full, second])
+
+        with self.assertRaises(ValueError):
+            restore.check_chain([{'type': 'full'}, first])
+
+    def mocked_managers(self):
+        lm = MagicMock()
+        lm.prefix_key.side_effect = lambda x: "link:%s" % (x,)
+        return {'links': lm}
+
+    def test_replace_link_unindexes_first(self):
+
+        managers = self.mocked_managers()
+        pipe = MagicMock()
+        old_tags = {'id': "old|tags"}
+
+        restore.replace_links(pipe, managers, {'key': "id", 'tags': "new"}, old_tags)
+
+        pipe.zrem.assert_any_call("tag:old", "id")
+        pipe.zrem.assert_any_call("tag:tags", "id")
+        pipe.zrem.assert_any_call("sorted:date", "id")
+        pipe.hset.assert_called_once_with("link:id", mapping={'key': "id", 'tags': "new"})
+        self.assertEqual(old_tags, {'id': "new"})
+
+    def test_deleted_link(self):
+
+        managers = self.mocked_managers()
+        pipe = MagicMock()
+
+        restore.write_deleted(pipe, managers, {'kind': "link", 'id': "id"}, {'id': "old|tags"})
+
+        pipe.delete.assert_called_once_with("link:id")
+        self.assertEqual(pipe.zrem.call_count, 3)
+
+
+@patch('restore.managers_for')
+@patch('restore.backup.read_lines')
+class IncrementalPartitionTest(unittest.TestCase):
+    """
+    restore.restore_partition with incremental sections.
+    """
+
+    def test_old_tags_read_a_batch_at_a_time(self, mocked_read, mocked_managers_for):
+
+        records = [{'key': "id%s" % (x,), 'tags': "new"} for x in range(3)]
+        mocked_read.return_value = iter(json.dumps(x) + "\n" for x in records)
+
+        lm = MagicMock()
+        lm.prefix_key.side_effect = lambda x: "link:%s" % (x,)
+        mocked_managers_for.return_value = {'links': lm}
+        pipe = lm.connection.pipeline()
+        reads = pipe.__enter__()
+        reads.execute.side_effect = [["old", None], ["old"]]
+
+        written = restore.restore_partition("dir", "links", 0, 1, ("h", 1, 0), batch_size=2, incremental=True)
+
+        self.assertEqual(written, 3)
+        # no round trip per link, one per batch for the tags.
+        lm.connection.hget.assert_not_called()
+        self.assertEqual(reads.hget.call_count, 3)
+        self.assertEqual(reads.execute.call_count, 2)
+        self.assertEqual(pipe.execute.call_count, 2)
+        pipe.zrem.assert_any_call("tag:old", "id2")
+
+
+@patch('restore.edit.LinkManager')
+@patch('restore.check_chain')
+@patch('restore.backup.read_manifest')
+class RestoreChainTest(unittest.TestCase):
+    """
+    Tests for restore.restore_chain
+    """
+
+    def test_resumes_after_interruption(self, mocked_manifest, mocked_check, mocked_lm):
+
+        mocked_lm().rebuild_indexes.return_value = (0, [])
+
+        with tempfile.TemporaryDirectory() as full, tempfile.TemporaryDirectory() as first, \
+                tempfile.TemporaryDirectory() as second:
+
+            restored = []
+
+            def interrupted(directory, *args, **kwargs):
+                if directory == second:
+                    raise KeyboardInterrupt()
+
+                restored.append(directory)
+                return {'links': 1}, []
+
+            with patch('restore.restore', side_effect=interrupted) as mocked_restore:
+                with self.assertRaises(KeyboardInterrupt):
+                    restore.restore_chain([full, first, second])
+
+            self.assertEqual(restored, [full, first])
+
+            # the backup being restored keeps its checkpoints for next time.
+            for call in mocked_restore.call_args_list:
+                self.assertFalse(call[1]['clean_up'])
+
+            with patch('restore.restore', return_value=({'links': 1}, [])) as mocked_restore:
+                counts, duplicates = restore.restore_chain([full, first, second])
+
+            # only the backup that was cut off is done again, not the full one.
+            self.assertEqual([x[0][0] for x in mocked_restore.call_args_list], [second])
+            self.assertEqual(counts, {'links': 1})
+            self.assertFalse(os.path.exists(os.path.join(full, restore.CHAIN_CHECKPOINT_DIRECTORY)))
@@ -0,0 +1,120 @@
+"""
+Testing the router
+"""
+
+import unittest
+import routing
+from webtest import TestApp
+
+
+def page(environ, start_response, **params):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [repr(sorted(params.items())).encode('utf-8')]
+
+
+class RouterTest(unittest.TestCase):
+    """
+    Testing routing.Router
+    """
+
+    def router(self):
+        router = routing.Router("/linkapp/")
+        router.add("", page, name="listing")
+        router.add("page/{page}", page, name="listing")
+        router.add("tag/{tag}", page)
+        router.add("view/{key:id}", page)
+        router.add("view/{key:id}/comments", page)
+        router.add("save/{key:id}", page, methods=('POST',))
+        router.add("save/{key:id}", page, methods=('PUT',))
+        router.add("static/{path:path}", page)
+        return router
+
+    def match(self, path):
+        found = self.router().match(path)
+
+        if found is None:
+            return None
+
+        route, params = found
+        return route.name, params
+
+    def test_exact(self):
+
+        self.assertEqual(self.match("/linkapp/"), ("listing", {}))
+        self.assertIsNone(self.match("/linkapp"))
+        self.assertIsNone(self.match("/other/"))
+
+    def test_typed_params(self):
+
+        self.assertEqual(self.match("/linkapp/page/3"), ("listing", {'page': 3}))
+        self.assertEqual(self.match("/linkapp/page/-1"), ("listing", {'page': -1}))
+        self.assertIsNone(self.match("/linkapp/page/a"))
+        self.assertIsNone(self.match("/linkapp/page/1_0"))
+
+        self.assertEqual(self.match("/linkapp/view/jR5zE"), ("view", {'key': "jR5zE"}))
+        self.assertEqual(self.match("/linkapp/view/jR5zE/comments"), ("view", {'key': "jR5zE"}))
+        self.assertIsNone(self.match("/linkapp/view/"))
+        self.assertIsNone(self.match("/linkapp/view/no-such"))
+        self.assertIsNone(self.match("/linkapp/view/jR5zE/other"))
+
+    def test_tag(self):
+
+        self.assertEqual(self.match("/linkapp/tag/python"), ("tag", {'tag': "python", 'page': 1}))
+        self.assertEqual(self.match("/linkapp/tag/python,2"), ("tag", {'tag': "python", 'page': 2}))
+        self.assertEqual(self.match("/linkapp/tag/\xf0\x9f\x90\x8d"), ("tag", {'tag': "\U0001f40d", 'page': 1}))
+        self.assertIsNone(self.match("/linkapp/tag/python,"))
+        self.assertIsNone(self.match("/linkapp/tag/,2"))
+        self.assertIsNone(self.match("/linkapp/tag/\xff"))
+
+    def test_path(self):
+
+        self.assertEqual(self.match("/linkapp/static/js/app.js"), ("static", {'path': ["js", "app.js"]}))
+        self.assertIsNone(self.match("/linkapp/static/"))
+        self.assertIsNone(self.match("/linkapp/static/../wsgilinkapp.py"))
+
+    def test_dead_end_params_forgotten(self):
+
+        router = routing.Router("/")
+        router.add("{tag}/{page}", page, name="paged")
+        router.add("{key:id}/edit", page, name="edit")
+
+        route, params = router.match("/abc/edit")
+
+        self.assertEqual(route.name, "edit")
+        self.assertEqual(params, {'key': "abc"})
+
+    def test_bad_patterns(self):
+
+        router = routing.Router("/")
+
+        with self.assertRaises(ValueError):
+            router.add("view/{key:uuid}", page)
+
+        with self.assertRaises(ValueError):
+            router.add("static/{path:path}/more", page)
+
+    def test_dispatch(self):
+
+        app = TestApp(self.router())
+
+        resp = app.get("/linkapp/tag/python,2")
+        self.assertEqual(resp.text, "[('page', 2), ('tag', 'python')]")
+        self.assertEqual(resp.request.environ['linkapp.route'], "tag")
+
+        resp = app.post("/linkapp/save/jR5zE")
+        self.assertEqual(resp.text, "[('key', 'jR5zE')]")
+
+    def test_method_not_allowed(self):
+
+        app = TestApp(self.router())
+
+        resp = app.get("/linkapp/save/jR5zE", status=405)
+        self.assertEqual(resp.headers['Allow'], "POST, PUT")
+
+        resp = app.delete("/linkapp/", status=405)
+        self.assertEqual(resp.headers['Allow'], "GET")
+
+    def test_not_found(self):
+
+        app = TestApp(self.router())
+        app.get("/linkapp/nowhere", status=404)
@@ -0,0 +1,142 @@
+"""
+Testing the redis command tracing
+"""
+
+import unittest
+import redis
+import tracing
+import wsgilinkapp
+from webtest import TestApp
+from unittest.mock import patch
+
+
+class TracedRedisTest(unittest.TestCase):
+    """
+    Testing tracing.TracedRedis, with the actual talking to redis mocked.
+    """
+
+    @patch.object(redis.StrictRedis, 'execute_command', return_value=3)
+    def test_command(self, mocked_execute):
+
+        tracer = tracing.Tracer()
+        client = tracing.TracedRedis(tracer=tracer)
+
+        with tracing.round_trips() as trace:
+            self.assertEqual(client.zcard("sorted:date"), 3)
+
+        self.assertEqual(trace.round_trips, 1)
+        self.assertEqual(trace.commands, 1)
+        self.assertEqual(tracer.snapshot()['commands']['ZCARD']['count'], 1)
+
+    @patch.object(redis.client.Pipeline, 'execute', return_value=[1, 1])
+    def test_pipeline_is_one_round_trip(self, mocked_execute):
+
+        tracer = tracing.Tracer()
+        client = tracing.TracedRedis(tracer=tracer)
+
+        with tracing.round_trips() as trace:
+            with client.pipeline(transaction=False) as pipe:
+                pipe.hgetall("link:one")
+                pipe.hgetall("link:two")
+                pipe.execute()
+
+        self.assertEqual(trace.round_trips, 1)
+        self.assertEqual(trace.commands, 2)
+        self.assertEqual(trace.breakdown()['HGETALL'][0], 2)
+        self.assertIn('PIPELINE', tracer.snapshot()['commands'])
+
+    @patch.object(redis.client.Pipeline, 'execute', return_value=[1])
+    def test_transaction(self, mocked_execute):
+
+        client = tracing.TracedRedis()
+
+        with tracing.round_trips() as trace:
+            with client.pipeline() as pipe:
+                pipe.zadd("sorted:date", {"one": 1})
+                pipe.execute()
+
+        self.assertEqual(trace.calls[0][0], ['MULTI', 'ZADD', 'EXEC'])
+
+    @patch.object(redis.StrictRedis, 'execute_command', return_value=None)
+    def test_over_budget(self, mocked_execute):
+
+        client = tracing.TracedRedis()
+
+        with self.assertRaises(AssertionError) as raised:
+            with tracing.round_trips(budget=1):
+                client.hgetall("link:one")
+                client.hgetall("link:two")
+
+        self.assertIn("2 redis round trips, the budget is 1", str(raised.exception))
+
+
+class RouteNameTest(unittest.TestCase):
+    """
+    Testing tracing.route_name
+    """
+
+    def route(self, path):
+        return tracing.route_name({'PATH_INFO': path, 'linkapp.path_prefix': '/linkapp/'})
+
+    def test_routes(self):
+
+        self.assertEqual(self.route("/linkapp/"), "listing")
+        self.assertEqual(self.route("/linkapp/tag/python,2"), "tag")
+        self.assertEqual(self.route("/linkapp/view/abc"), "view")
+        self.assertEqual(self.route("/linkapp/reading-list"), "reading-list")
+        self.assertEqual(self.route("/linkapp/reading-list/add/abc"), "reading-list/add")
+        self.assertEqual(self.route("/linkapp/api/v1/links/abc"), "api/v1/links")
+
+
+class RoundTripBudgetTest(unittest.TestCase):
+    """
+    Round trip budgets for pages, so an N+1 doesn't sneak in.
+    """
+
+    def replies(self, *args, **options):
+        return {'ZCARD': 2, 'ZREVRANGE': ["one", "two"]}[args[0]]
+
+    @patch.object(redis.client.Pipeline, 'execute')
+    @patch.object(redis.StrictRedis, 'execute_command')
+    def test_listing(self, mocked_execute, mocked_pipeline):
+
+        mocked_execute.side_effect = self.replies
+        mocked_pipeline.return_value = [["title", "desc", "http://example.com", "one", "me", "", "a"]] * 2
+
+        app = TestApp(wsgilinkapp.AppFactory(path_prefix="/", debug=True))
+
+        with tracing.round_trips(budget=3) as trace:
+            resp = app.get("/")
+
+        self.assertEqual(trace.round_trips, 3)
+        self.assertEqual(trace.commands, 4)
+
+        # the page is streamed, the links are fetched after the headers.
+        self.assertEqual(resp.headers['X-Redis-Round-Trips'], "2")
+        self.assertEqual(resp.headers['X-Redis-Commands'], "2")
+
+
+class ResponseBodyTest(unittest.TestCase):
+    """
+    Testing tracing.ResponseBody
+    """
+
+    def test_finish_on_close(self):
+
+        finished = []
+        trace = tracing.Trace()
+
+        def chunks():
+            yield tracing.current_trace.get()
+
+        body = tracing.ResponseBody(chunks(), lambda: finished.append(True), trace)
+
+        # the trace is current while the body is made, not after.
+        self.assertIs(next(body), trace)
+        self.assertIsNone(tracing.current_trace.get())
+        self.assertEqual(finished, [])
+
+        body.close()
+        body.close()
+
+        self.assertEqual(finished, [True])
@@ -3,42 +3,32 @@ Testing the WSGI app
 """
 
 import unittest
+import zlib
 import wsgilinkapp
+from webob import Request
 from webtest import TestApp
+from hashing import PoolBusy
 from unittest.mock import patch
 from unittest.mock import MagicMock
 
-class UtilitiesTest(unittest.TestCase):
+
+def routed_app(**environ):
     """
-    Tests for helper functions for the WSGI apps.
+    Every page routed like AppFactory does, logged in as test_name.
     """
-    def test_check_path_happy_path_start_false(self):
-        
-        environ = {'linkapp.path_prefix':'/linkapp/', 'PATH_INFO':'/linkapp/'}
-        
-        self.assertTrue(wsgilinkapp.check_path(environ, ""))
-        self.assertFalse(wsgilinkapp.check_path(environ, "goober"))
-
-        environ['PATH_INFO'] = "/linkapp/edit"
-        self.assertTrue(wsgilinkapp.check_path(environ, "edit"))
-        
-        environ['PATH_INFO'] = "/linkapp/edit/"
-        self.assertFalse(wsgilinkapp.check_path(environ, "edit"))
-        
-        
-    def test_check_path_happy_path_start_true(self):
-        
-        environ = {'linkapp.path_prefix':'/linkapp/', 'PATH_INFO':'/linkapp/'}
-        
-        self.assertFalse(wsgilinkapp.check_path(environ, "goober"))
+    extra_environ = {
+        'linkapp.path_prefix': '/linkapp/',
+        'linkapp.user_manager': MagicMock(),
+        'beaker.session': {},
+    }
+    extra_environ.update(environ)
+    
+    app = TestApp(wsgilinkapp.routes('/linkapp/'), extra_environ=extra_environ)
+    app.authorization = ('Basic', ('test_name', 'password'))
+    
+    return app
+    
 
-        environ['PATH_INFO'] = "/linkapp/edit/stuffhere"
-        self.assertTrue(wsgilinkapp.check_path(environ, "edit", True))
-        
-        environ['PATH_INFO'] = "/linkapp/edit/"
-        self.assertTrue(wsgilinkapp.check_path(environ, "edit", True))
-        
-        
 class AuthenticationMiddlewareTest(unittest.TestCase):
     """
     Testing the Authentication Middleware.
@@ -55,7 +45,7 @@ class AuthenticationMiddlewareTest(unittest.TestCase):
             
         mid_wrap = wsgilinkapp.AuthenticationMiddleware(application)
         mocked_um = MagicMock()
-        return mocked_um, TestApp(mid_wrap, extra_environ={'linkapp.user_manager': mocked_um})
+        return mocked_um, TestApp(mid_wrap, extra_environ={'linkapp.user_manager': mocked_um, 'beaker.session': {}})
         
         
     def test_access_without_cred(self):
@@ -82,6 +72,15 @@ class AuthenticationMiddlewareTest(unittest.TestCase):
         resp = app.get("/path", status=401)
         self.assertEqual(resp.status_int, 401)
         
+    
+    def test_access_when_hashing_busy(self):
+        
+        um, app = self.mocked_app()
+        um.authenticate.side_effect = PoolBusy(3)
+        app.authorization = ('Basic', ('user', 'password'))
+        resp = app.get("/path", status=503)
+        self.assertEqual(resp.headers['Retry-After'], "3")
+        
         
 class NewTest(unittest.TestCase):
     """
@@ -98,10 +97,11 @@ class NewTest(unittest.TestCase):
         
     def test_new_wrong_method(self):
         
-        app = TestApp(wsgilinkapp.new, extra_environ={'linkapp.path_prefix': '/linkapp/'})
+        app = routed_app()
         
-        resp = app.post("/path", status='4**')
-        self.assertEqual(resp.status_int, 400)
+        resp = app.post("/linkapp/new", status='4**')
+        self.assertEqual(resp.status_int, 405)
+        self.assertEqual(resp.headers['Allow'], "GET")
         
         
 class EditTest(unittest.TestCase):
@@ -112,10 +112,7 @@ class EditTest(unittest.TestCase):
     def mocked_app(self):
         mocked_lm = MagicMock()
         
-        app = TestApp(wsgilinkapp.edit, 
-            extra_environ={
-                'linkapp.path_prefix': '/linkapp/', 
-                'linkapp.link_manager': mocked_lm})
+        app = routed_app(**{'linkapp.link_manager': mocked_lm})
         
         return mocked_lm, app
     
@@ -124,23 +121,27 @@ class EditTest(unittest.TestCase):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.get("/path/" + ("x"*32))
+        resp = app.get("/linkapp/edit/" + ("x"*32))
         self.assertEqual(resp.status_int, 200)
+        mocked_lm.list_one.assert_called_once_with("x"*32, memo=None)
         
         
     def test_edit_wrong_method(self):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.post("/path", status='4**')
-        self.assertEqual(resp.status_int, 400)
+        resp = app.post("/linkapp/edit/" + ("x"*32), status='4**')
+        self.assertEqual(resp.status_int, 405)
         
         
     def test_edit_wrong_key(self):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.get("/path", status='4**')
+        resp = app.get("/linkapp/edit", status='4**')
+        self.assertEqual(resp.status_int, 404)
+        
+        resp = app.get("/linkapp/edit/not-an-id", status='4**')
         self.assertEqual(resp.status_int, 404)
         
         
@@ -152,11 +153,7 @@ class SaveTest(unittest.TestCase):
     def mocked_app(self):
         mocked_lm = MagicMock()
         
-        app = TestApp(wsgilinkapp.save, 
-            extra_environ={
-                'linkapp.path_prefix': '/linkapp/',
-                'linkapp.loggedin': 'test_name',
-                'linkapp.link_manager': mocked_lm})
+        app = routed_app(**{'linkapp.link_manager': mocked_lm})
         
         return mocked_lm, app
         
@@ -165,16 +162,51 @@ class SaveTest(unittest.TestCase):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.get("/path", status='4**')
+        resp = app.get("/linkapp/save/", status='4**')
+        self.assertEqual(resp.status_int, 405)
+        self.assertEqual(resp.headers['Allow'], "POST")
+
+
+    def test_save_too_large(self):
+
+        mocked_lm = MagicMock()
+        app = routed_app(**{'linkapp.link_manager': mocked_lm, 'linkapp.max_form_bytes': 100})
+
+        resp = app.post("/linkapp/save/", {'page_title': "x" * 200}, status='4**')
+        self.assertEqual(resp.status_int, 413)
+        mocked_lm.add.assert_not_called()
+
+
+    def test_save_not_a_form(self):
+
+        mocked_lm, app = self.mocked_app()
+
+        resp = app.post("/linkapp/save/", "{}", content_type="application/json", status='4**')
         self.assertEqual(resp.status_int, 400)
-        
+
+
+    def test_save_multipart(self):
+
+        mocked_lm, app = self.mocked_app()
+        mocked_lm.url_owner.return_value = None
+
+        resp = app.post("/linkapp/save/",
+            {'page_title': "Something as a Title",
+             'desc_text': "Whole bunch of things.",
+             'url_address': "http://www.sillygooses.com",
+             'tags': "one|two"
+            }, content_type="multipart/form-data")
+        self.assertEqual(resp.status_int, 302)
+        self.assertEqual(mocked_lm.add.call_args[1]['page_title'], "Something as a Title")
+        self.assertEqual(mocked_lm.add.call_args[1]['tags'], {"one", "two"})
+
         
     def test_happy_path_save_add(self):
         
         mocked_lm, app = self.mocked_app()
-        mocked_lm.url_exists.return_value = False
+        mocked_lm.url_owner.return_value = None
         
-        resp = app.post("/path", 
+        resp = app.post("/linkapp/save/", 
             {'page_title': "Something as a Title",
                 'desc_text': "Whole bunch of things. Talking about stuff.",
                 'url_address': "http://www.sillygooses.com",
@@ -186,10 +218,10 @@ class SaveTest(unittest.TestCase):
     def test_happy_path_save_edit(self):
         
         mocked_lm, app = self.mocked_app()
-        mocked_lm.url_exists.return_value = False
+        mocked_lm.url_owner.return_value = None
         mocked_lm.url_url_changed.return_value = False
         
-        resp = app.post("/path/" + ("x"*32), 
+        resp = app.post("/linkapp/save/" + ("x"*32), 
             {'page_title': "Something as a Title",
                 'desc_text': "Whole bunch of things. Talking about stuff.",
                 'url_address': "http://www.sillygooses.com",
@@ -202,10 +234,10 @@ class SaveTest(unittest.TestCase):
     def test_save_no_data_edit(self):
         
         mocked_lm, app = self.mocked_app()
-        mocked_lm.url_exists.return_value = False
+        mocked_lm.url_owner.return_value = None
         mocked_lm.url_url_changed.return_value = False
         
-        resp = app.post("/path/" + ("x"*32), {})
+        resp = app.post("/linkapp/save/" + ("x"*32), {})
         resp.mustcontain("errors")
         self.assertEqual(resp.status_int, 200)
         mocked_lm.modify.assert_not_called()
@@ -214,11 +246,11 @@ class SaveTest(unittest.TestCase):
     def test_save_empty_data_edit(self):
         
         mocked_lm, app = self.mocked_app()
-        mocked_lm.url_exists.return_value = False
+        mocked_lm.url_owner.return_value = None
         mocked_lm.url_url_changed.return_value = False
         
         resp = app.post(
-            "/path/" + ("x"*32),
+            "/linkapp/save/" + ("x"*32),
             {'page_title': "",
              'desc_text': "",
              'url_address': "",
@@ -233,11 +265,11 @@ class SaveTest(unittest.TestCase):
     def test_save_duplicate_url_edit(self):
         
         mocked_lm, app = self.mocked_app()
-        mocked_lm.url_exists.return_value = True
+        mocked_lm.url_owner.return_value = "y"*32
         mocked_lm.url_url_changed.return_value = False
         
         resp = app.post(
-            "/path/" + ("x"*32),
+            "/linkapp/save/" + ("x"*32),
             {'page_title': "Lions Eat Apples",
              'desc_text': "Are they hungry for apples Jerry?",
              'url_address': "http://www.thesame.com",
@@ -249,13 +281,47 @@ class SaveTest(unittest.TestCase):
         mocked_lm.modify.assert_not_called()
         
         
+    def test_save_own_url_edit(self):
+        
+        mocked_lm, app = self.mocked_app()
+        mocked_lm.url_owner.return_value = "x"*32
+        
+        resp = app.post(
+            "/linkapp/save/" + ("x"*32),
+            {'page_title': "Lions Eat Apples",
+             'desc_text': "Are they hungry for apples Jerry?",
+             'url_address': "http://www.thesame.com",
+             'tags': "tag1"
+            })
+        
+        self.assertEqual(resp.status_int, 302)
+        mocked_lm.modify.assert_called_once()
+        
+        
+    def test_save_duplicate_url_links_existing(self):
+        
+        mocked_lm, app = self.mocked_app()
+        mocked_lm.url_owner.return_value = "y"*32
+        
+        resp = app.post(
+            "/linkapp/save/",
+            {'page_title': "Lions Eat Apples",
+             'desc_text': "Are they hungry for apples Jerry?",
+             'url_address': "http://www.thesame.com",
+             'tags': "tag1"
+            })
+        
+        resp.mustcontain("/linkapp/view/" + ("y"*32))
+        mocked_lm.url_owner.assert_called_once_with("http://www.thesame.com")
+        
+        
     def test_save_no_data_add(self):
         
         mocked_lm, app = self.mocked_app()
-        mocked_lm.url_exists.return_value = False
+        mocked_lm.url_owner.return_value = None
         mocked_lm.url_url_changed.return_value = False
         
-        resp = app.post("/path", {})
+        resp = app.post("/linkapp/save/", {})
         resp.mustcontain("errors")
         self.assertEqual(resp.status_int, 200)
         mocked_lm.add.assert_not_called()
@@ -264,11 +330,11 @@ class SaveTest(unittest.TestCase):
     def test_save_empty_data_add(self):
         
         mocked_lm, app = self.mocked_app()
-        mocked_lm.url_exists.return_value = False
+        mocked_lm.url_owner.return_value = None
         mocked_lm.url_url_changed.return_value = False
         
         resp = app.post(
-            "/path",
+            "/linkapp/save/",
             {'page_title': "",
              'desc_text': "",
              'url_address': "",
@@ -283,11 +349,11 @@ class SaveTest(unittest.TestCase):
     def test_save_duplicate_url_add(self):
         
         mocked_lm, app = self.mocked_app()
-        mocked_lm.url_exists.return_value = True
+        mocked_lm.url_owner.return_value = "y"*32
         mocked_lm.url_url_changed.return_value = False
         
         resp = app.post(
-            "/path",
+            "/linkapp/save/",
             {'page_title': "Lions Eat Apples",
              'desc_text': "Are they hungry for apples Jerry?",
              'url_address': "http://www.thesame.com",
@@ -307,10 +373,7 @@ class ListingTest(unittest.TestCase):
     def mocked_app(self):
         mocked_lm = MagicMock()
         
-        app = TestApp(wsgilinkapp.listing, 
-            extra_environ={
-                'linkapp.path_prefix': '/linkapp/',
-                'linkapp.link_manager': mocked_lm})
+        app = routed_app(**{'linkapp.link_manager': mocked_lm})
         
         return mocked_lm, app
         
@@ -318,30 +381,34 @@ class ListingTest(unittest.TestCase):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.get("/path")
+        resp = app.get("/linkapp/")
+        self.assertEqual(resp.status_int, 200)
+        
+        resp = app.get("/linkapp/page/3")
         self.assertEqual(resp.status_int, 200)
+        self.assertEqual(mocked_lm.iter_listing.call_args[1]['start'], 20)
         
         
     def test_listing_wrong_method(self):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.post("/path", status='4**')
-        self.assertEqual(resp.status_int, 400)
+        resp = app.post("/linkapp/", status='4**')
+        self.assertEqual(resp.status_int, 405)
         
     def test_listing_bad_page_number(self):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.get("/-1", status='3**')
+        resp = app.get("/linkapp/page/-1", status='3**')
         self.assertEqual(resp.status_int, 302)
         
-        resp = app.get("/0", status='3**')
+        resp = app.get("/linkapp/page/0", status='3**')
         self.assertEqual(resp.status_int, 302)
         
-        # Should default to main page if a non-integer is given.
-        resp = app.get("/a", status='2**')
-        self.assertEqual(resp.status_int, 200)
+        # page numbers are typed, anything else isn't a page.
+        resp = app.get("/linkapp/page/a", status='4**')
+        self.assertEqual(resp.status_int, 404)
         
         
 class ListingByTagTest(unittest.TestCase):
@@ -352,10 +419,7 @@ class ListingByTagTest(unittest.TestCase):
     def mocked_app(self):
         mocked_lm = MagicMock()
         
-        app = TestApp(wsgilinkapp.listing_by_tag, 
-            extra_environ={
-                'linkapp.path_prefix': '/linkapp/',
-                'linkapp.link_manager': mocked_lm})
+        app = routed_app(**{'linkapp.link_manager': mocked_lm})
         
         return mocked_lm, app
         
@@ -363,34 +427,47 @@ class ListingByTagTest(unittest.TestCase):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.get("/path/tagged")
+        resp = app.get("/linkapp/tag/tagged")
         self.assertEqual(resp.status_int, 200)
+        mocked_lm.count.assert_called_once_with("tagged")
+        
+        resp = app.get("/linkapp/tag/tagged,2")
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(mocked_lm.iter_listing.call_args[1]['start'], 10)
+        
+        
+    def test_listing_by_tag_unicode(self):
+        
+        mocked_lm, app = self.mocked_app()
+        
+        app.get("/linkapp/tag/%F0%9F%90%8D")
+        mocked_lm.count.assert_called_once_with("\U0001f40d")
         
         
     def test_listing_by_tag_wrong_method(self):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.post("/path/tagged", status='4**')
-        self.assertEqual(resp.status_int, 400)
+        resp = app.post("/linkapp/tag/tagged", status='4**')
+        self.assertEqual(resp.status_int, 405)
         
         
     def test_listing_by_tag_bad_page_number(self):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.get("/path/tagged,-1", status='3**')
+        resp = app.get("/linkapp/tag/tagged,-1", status='3**')
         self.assertEqual(resp.status_int, 302)
         
-        resp = app.get("/path/tagged,0", status='3**')
+        resp = app.get("/linkapp/tag/tagged,0", status='3**')
         self.assertEqual(resp.status_int, 302)
         
-        # Should default to main page if a non-integer is given.
-        resp = app.get("/path/tagged,a", status='2**')
-        self.assertEqual(resp.status_int, 200)
+        # page numbers are typed, anything else isn't a page.
+        resp = app.get("/linkapp/tag/tagged,a", status='4**')
+        self.assertEqual(resp.status_int, 404)
         
-        resp = app.get("/path/tagged,", status='2**')
-        self.assertEqual(resp.status_int, 200)
+        resp = app.get("/linkapp/tag/tagged,", status='4**')
+        self.assertEqual(resp.status_int, 404)
         
         
 class OnePostTest(unittest.TestCase):
@@ -401,10 +478,7 @@ class OnePostTest(unittest.TestCase):
     def mocked_app(self):
         mocked_lm = MagicMock()
         
-        app = TestApp(wsgilinkapp.one_post, 
-            extra_environ={
-                'linkapp.path_prefix': '/linkapp/', 
-                'linkapp.link_manager': mocked_lm})
+        app = routed_app(**{'linkapp.link_manager': mocked_lm})
         
         return mocked_lm, app
     
@@ -413,7 +487,7 @@ class OnePostTest(unittest.TestCase):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.get("/path/" + ("x"*32))
+        resp = app.get("/linkapp/view/" + ("x"*32))
         self.assertEqual(resp.status_int, 200)
         
         
@@ -421,13 +495,235 @@ class OnePostTest(unittest.TestCase):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.post("/path", status='4**')
-        self.assertEqual(resp.status_int, 400)
+        resp = app.post("/linkapp/view/" + ("x"*32), status='4**')
+        self.assertEqual(resp.status_int, 405)
         
         
     def test_one_post_wrong_key(self):
         
         mocked_lm, app = self.mocked_app()
         
-        resp = app.get("/path", status='4**')
-        self.assertEqual(resp.status_int, 404)
\ No newline at end of file
+        resp = app.get("/linkapp/view/", status='4**')
+        self.assertEqual(resp.status_int, 404)
+        
+        
+class MyReadingListTest(unittest.TestCase):
+    """
+    Testing wsgilinkapp.my_reading_list
+    """
+    
+    def mocked_app(self):
+        mocked_rl = MagicMock()
+        mocked_rl.count.return_value = 45
+        mocked_rl.iter_to_read.return_value = iter([])
+        
+        app = routed_app(**{'linkapp.rl_manager': mocked_rl})
+        
+        return mocked_rl, app
+        
+    def test_reading_list_happy_path(self):
+        
+        mocked_rl, app = self.mocked_app()
+        
+        resp = app.get("/linkapp/reading-list")
+        self.assertEqual(resp.status_int, 200)
+        resp.mustcontain("/linkapp/reading-list/page/2")
+        self.assertEqual(mocked_rl.iter_to_read.call_args[1]['start'], 0)
+        
+        
+    def test_reading_list_page(self):
+        
+        mocked_rl, app = self.mocked_app()
+        
+        resp = app.get("/linkapp/reading-list/page/3")
+        self.assertEqual(resp.status_int, 200)
+        resp.mustcontain("/linkapp/reading-list/page/2")
+        self.assertEqual(mocked_rl.iter_to_read.call_args[1]['start'], 40)
+        self.assertEqual(mocked_rl.iter_to_read.call_args[1]['stop'], 59)
+        
+        
+    def test_reading_list_bad_page_number(self):
+        
+        mocked_rl, app = self.mocked_app()
+        
+        resp = app.get("/linkapp/reading-list/page/0", status='3**')
+        self.assertEqual(resp.status_int, 302)
+        
+    def test_whole_reading_list(self):
+        
+        mocked_rl, app = self.mocked_app()
+        mocked_rl.iter_all_to_read.return_value = iter([
+            [{'key': "one", 'page_title': "First"}],
+            [{'key': "two", 'page_title': "Second"}, {'key': "three", 'page_title': "Third"}],
+        ])
+        
+        resp = app.get("/linkapp/reading-list/all")
+        
+        resp.mustcontain("First", "Second", "Third", "45 unread")
+        self.assertNotIn("reading-list/page/", resp.text)
+        mocked_rl.iter_all_to_read.assert_called_once_with('test_name', fields=wsgilinkapp.LINK_FIELDS)
+        
+        
+class StreamPageTest(unittest.TestCase):
+    """
+    Testing wsgilinkapp.stream_page
+    """
+    
+    def test_same_as_whole_page(self):
+        
+        links = [{'key': "k%d" % (x,), 'page_title': "Title %d" % (x,), 'tags': [{'name': "t"}]} for x in range(5)]
+        context = {'prefix': "/linkapp/", 'count': 5, 'last': 1, 'tag': "t"}
+        
+        streamed = b"".join(wsgilinkapp.stream_page('list', context, [links[:2], [], links[2:]]))
+        whole = wsgilinkapp.renderer.render_name('list', dict(context, links=links))
+        
+        self.assertEqual(streamed.decode('utf-8'), whole)
+        
+    def test_head_before_links(self):
+        
+        def batches():
+            raise AssertionError("fetched the links before sending the head")
+            yield
+            
+        chunks = wsgilinkapp.stream_page('reading-list', {'user': "someone"}, batches())
+        
+        self.assertIn(b"Reading List: <em>someone</em>", next(chunks))
+        
+        with self.assertRaises(AssertionError):
+            next(chunks)
+            
+    def test_head_sent_through_app_factory(self):
+        
+        batches = []
+        
+        def iter_listing(*args, **kwargs):
+            batches.append("started")
+            yield []
+            
+        factory = wsgilinkapp.AppFactory(path_prefix="/")
+        factory.link_manager = MagicMock()
+        factory.link_manager.count.return_value = 20
+        factory.link_manager.iter_listing.side_effect = iter_listing
+        
+        environ = Request.blank("/", headers={'Accept-Encoding': 'gzip'}).environ
+        start_response = MagicMock()
+        body = factory(environ, start_response)
+        
+        try:
+            first = next(iter(body))
+            
+            # compressed, and out before the first batch of links is fetched.
+            self.assertEqual(start_response.call_args[0][0], "200 OK")
+            self.assertIn(('Content-Encoding', 'gzip'), start_response.call_args[0][1])
+            self.assertIn(b"<html>", zlib.decompressobj(31).decompress(first))
+            self.assertEqual(batches, [])
+        finally:
+            body.close()
+
+
+class ReadingListLinkTest(unittest.TestCase):
+    """
+    Testing wsgilinkapp.add_to_my_reading_list and mark_read
+    """
+
+    def mocked_app(self):
+        mocked_lm = MagicMock()
+        mocked_lm.list_one.return_value = [{'key': "jR5zE"}]
+        mocked_rl = MagicMock()
+
+        app = routed_app(**{
+            'linkapp.link_manager': mocked_lm,
+            'linkapp.rl_manager': mocked_rl})
+
+        return mocked_rl, app
+
+    def test_add(self):
+
+        mocked_rl, app = self.mocked_app()
+
+        resp = app.get("/linkapp/reading-list/add/jR5zE", status='3**')
+        self.assertEqual(resp.headers['Location'], "http://localhost:80/linkapp/reading-list")
+        mocked_rl.add.assert_called_once_with("test_name", "jR5zE")
+
+    def test_read(self):
+
+        mocked_rl, app = self.mocked_app()
+
+        app.get("/linkapp/reading-list/read/jR5zE", status='3**')
+        mocked_rl.read.assert_called_once_with("test_name", "jR5zE")
+
+
+class LinksBatchTest(unittest.TestCase):
+    """
+    Testing wsgilinkapp.links_batch
+    """
+    
+    def mocked_app(self):
+        mocked_lm = MagicMock()
+        
+        app = routed_app(**{'linkapp.link_manager': mocked_lm})
+        
+        return mocked_lm, app
+        
+    def test_batch(self):
+        
+        mocked_lm, app = self.mocked_app()
+        mocked_lm.add_many.return_value = [{'key': "one", 'error': None}]
+        mocked_lm.retag_many.return_value = [{'key': "two", 'error': None}]
+        
+        resp = app.post_json("/linkapp/api/links:batch", {
+            'add': [{'url_address': "http://www.sillygooses.com", 'tags': ["one"]}],
+            'retag': {'keys': ["two"], 'add': ["blue"]}
+        })
+        
+        self.assertEqual(resp.json, {
+            'add': [{'key': "one", 'error': None}],
+            'retag': [{'key': "two", 'error': None}]})
+        mocked_lm.add_many.assert_called_once_with(
+            [{'url_address': "http://www.sillygooses.com", 'tags': ["one"]}], 
+            author="test_name")
+        mocked_lm.retag_many.assert_called_once_with(["two"], add=["blue"], remove=[])
+        mocked_lm.delete_many.assert_not_called()
+        
+    def test_bad_json(self):
+        
+        mocked_lm, app = self.mocked_app()
+        
+        resp = app.post("/linkapp/api/links:batch", "not json", status='4**')
+        self.assertEqual(resp.status_int, 400)
+        
+        resp = app.get("/linkapp/api/links:batch", status='4**')
+        self.assertEqual(resp.status_int, 405)
+        
+    def test_too_large(self):
+        
+        mocked_lm = MagicMock()
+        app = routed_app(**{'linkapp.link_manager': mocked_lm, 'linkapp.max_form_bytes': 100})
+        
+        resp = app.post_json("/linkapp/api/links:batch", {'delete': ["x" * 10] * 20}, status='4**')
+        
+        self.assertEqual(resp.status_int, 413)
+        mocked_lm.delete_many.assert_not_called()
+
+
+class StaticTest(unittest.TestCase):
+    """
+    Testing the static files
+    """
+    
+    def test_static(self):
+        
+        app = routed_app()
+        response = app.get('/linkapp/static/style.css')
+        
+        with open('static/style.css', 'rb') as asset:
+            self.assertEqual(response.body, asset.read())
+            
+        self.assertEqual(response.headers['Content-Type'], 'text/css')
+        self.assertEqual(response.headers['Content-Length'], str(len(response.body)))
+        self.assertTrue(response.headers['ETag'].startswith('"'))
+        
+    def test_no_such_file(self):
+        
+        app = routed_app()
+        app.get('/linkapp/static/nothing.css', status=404)
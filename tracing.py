@@ -0,0 +1,373 @@
+"""
+Module for counting and timing the redis commands each request makes.
+
+A page's cost in redis isn't obvious from its code, a tag page is a ZCARD,
+then ZINTERSTORE/ZREVRANGE/DEL in a transaction, then the links in another
+pipeline. A Tracer swaps the managers' clients for TracedRedis clients
+(sharing their connection pools) which note every command and every round
+trip (a pipeline is one round trip however many commands it has):
+
+    >>> tracer = Tracer()
+    >>> app = AppFactory(tracer=tracer, debug=True)
+
+Each request gets a Trace with its counts. The tracer keeps latency
+histograms per redis command (pipelines go under PIPELINE and MULTI) and
+per route, see Tracer.snapshot(). With debug=True the counts go out in
+X-Redis-Commands, X-Redis-Round-Trips and X-Redis-Time response headers.
+
+The headers are added when the page calls start_response, so they only
+count the commands made before that. That's all of them for most pages,
+the streamed ones (see wsgilinkapp.stream_page) go on fetching links while
+they send the body, which is still counted in the request's Trace.
+
+For tests there's round_trips(), which traces whatever TracedRedis clients
+do inside it:
+
+    >>> with round_trips(budget=3) as trace:
+    ...     app.get("/tag/python")
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+import redis
+
+# the Trace for the request being handled in this thread (or task).
+current_trace = contextvars.ContextVar('linkapp_redis_trace', default=None)
+
+# upper bounds in seconds, the last bucket is everything slower.
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Trace:
+    """
+    The redis calls made during one request, calls being a list of
+    (command names, seconds) with one entry per round trip. Calls are passed
+    on to parent too (the trace that was current when this one was made),
+    so round_trips() sees what a traced app does.
+    """
+    __slots__ = ('commands', 'round_trips', 'seconds', 'calls', 'parent')
+
+    def __init__(self, parent=None):
+        self.commands = 0
+        self.round_trips = 0
+        self.seconds = 0.0
+        self.calls = []
+        self.parent = parent
+
+    def add(self, names, seconds):
+        self.commands += len(names)
+        self.round_trips += 1
+        self.seconds += seconds
+        self.calls.append((names, seconds))
+
+        if self.parent is not None:
+            self.parent.add(names, seconds)
+
+    def breakdown(self):
+        """
+        {command name: [times run, seconds]}, pipelines counted per command
+        in them with the pipeline's time split evenly.
+        """
+        commands = {}
+
+        for names, seconds in self.calls:
+            for name in names:
+                entry = commands.setdefault(name, [0, 0.0])
+                entry[0] += 1
+                entry[1] += seconds / len(names)
+
+        return commands
+
+    def describe(self):
+        """
+        The round trips, one per line, for assertion messages.
+        """
+        return "\n".join(
+            "%d. %s (%.2fms)" % (number, " ".join(names), seconds * 1000)
+            for number, (names, seconds) in enumerate(self.calls, 1))
+
+
+class Histogram:
+    """
+    Counts of timings per bucket in BUCKETS, plus their total.
+    """
+    __slots__ = ('counts', 'total', 'seconds')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0
+        self.seconds = 0.0
+
+    def observe(self, seconds):
+        for number, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            number = len(BUCKETS)
+
+        self.counts[number] += 1
+        self.total += 1
+        self.seconds += seconds
+
+    def to_dict(self):
+        return {
+            'buckets': dict(zip([str(x) for x in BUCKETS] + ['+Inf'], self.counts)),
+            'count': self.total,
+            'seconds': self.seconds
+        }
+
+
+def route_name(environ):
+    """
+    Something to group a request's timings under: its path without the
+    prefix and without ids or page numbers, e.g. "tag" or "reading-list/add".
+    """
+    if 'linkapp.route' in environ:
+        return environ['linkapp.route']
+
+    path = environ.get('PATH_INFO', '')[len(environ.get('linkapp.path_prefix', '/')):]
+    parts = path.split('/')
+
+    if parts[0] in ('reading-list', 'api') and len(parts) > 1:
+        if parts[1] == 'v1' and len(parts) > 2:
+            return "/".join(parts[:3])
+
+        return "/".join(parts[:2])
+
+    return parts[0] or 'listing'
+
+
+class ResponseBody:
+    """
+    The body an app returned, calling finish() once the server closes it,
+    for middleware measuring the whole response now that some pages keep
+    working while their body is sent (see wsgilinkapp.stream_page). With a
+    trace, it's the current one while each chunk is made.
+    """
+    def __init__(self, result, finish, trace=None):
+        self.result = result
+        self.chunks = iter(result)
+        self.finish = finish
+        self.trace = trace
+        self.finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.trace is None:
+            return next(self.chunks)
+
+        token = current_trace.set(self.trace)
+
+        try:
+            return next(self.chunks)
+        finally:
+            current_trace.reset(token)
+
+    def close(self):
+        try:
+            if hasattr(self.result, 'close'):
+                self.result.close()
+        finally:
+            if not self.finished:
+                self.finished = True
+                self.finish()
+
+
+def record(tracer, names, seconds):
+    trace = current_trace.get()
+
+    if trace is not None:
+        trace.add(names, seconds)
+
+    if tracer is not None:
+        tracer.record_call(names, seconds)
+
+
+class TracedPipeline(redis.client.Pipeline):
+    """
+    A pipeline that reports each execute() as one round trip.
+    """
+    def __init__(self, tracer, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tracer = tracer
+
+    def execute(self, raise_on_error=True):
+        names = [x[0][0] for x in self.command_stack]
+
+        if self.transaction or self.explicit_transaction:
+            names = ['MULTI'] + names + ['EXEC']
+
+        started = time.perf_counter()
+
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            if names:
+                record(self.tracer, names, time.perf_counter() - started)
+
+    def immediate_execute_command(self, *args, **options):
+        # WATCH, and anything run before MULTI while watching
+        started = time.perf_counter()
+
+        try:
+            return super().immediate_execute_command(*args, **options)
+        finally:
+            record(self.tracer, [args[0]], time.perf_counter() - started)
+
+
+class TracedRedis(redis.StrictRedis):
+    """
+    A client that reports every command it runs to a Tracer (and to the
+    current request's Trace, if there is one).
+    """
+    def __init__(self, tracer=None, **kwargs):
+        super().__init__(**kwargs)
+        self.tracer = tracer
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            record(self.tracer, [args[0]], time.perf_counter() - started)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return TracedPipeline(
+            self.tracer, self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class Tracer:
+    """
+    Histograms of redis command and request timings, for the whole process.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = {}
+        self.routes = {}
+
+    def instrument(self, *managers):
+        """
+        Give each manager a TracedRedis client using its connection pool.
+        """
+        for manager in managers:
+            manager.connection = TracedRedis(
+                tracer=self, connection_pool=manager.connection.connection_pool)
+
+    def record_call(self, names, seconds):
+        if len(names) == 1:
+            name = names[0].upper()
+        elif names[0] == 'MULTI':
+            name = 'MULTI'
+        else:
+            name = 'PIPELINE'
+
+        with self.lock:
+            if name not in self.commands:
+                self.commands[name] = Histogram()
+
+            self.commands[name].observe(seconds)
+
+    def record_request(self, route, trace, seconds):
+        with self.lock:
+            if route not in self.routes:
+                self.routes[route] = {
+                    'requests': Histogram(),
+                    'redis': Histogram(),
+                    'round_trips': 0,
+                    'commands': 0,
+                }
+
+            entry = self.routes[route]
+            entry['requests'].observe(seconds)
+            entry['redis'].observe(trace.seconds)
+            entry['round_trips'] += trace.round_trips
+            entry['commands'] += trace.commands
+
+    def snapshot(self):
+        """
+        Everything recorded so far, as plain dictionaries. For each route:
+        request and redis time histograms and total round trips/commands.
+        """
+        with self.lock:
+            return {
+                'commands': {x: y.to_dict() for x, y in self.commands.items()},
+                'routes': {
+                    route: {
+                        'requests': entry['requests'].to_dict(),
+                        'redis': entry['redis'].to_dict(),
+                        'round_trips': entry['round_trips'],
+                        'commands': entry['commands'],
+                    }
+                    for route, entry in self.routes.items()
+                },
+            }
+
+    def middleware(self, application, headers=False):
+        return TracingMiddleware(application, self, headers)
+
+
+class TracingMiddleware:
+    """
+    Gives each request a Trace, records it with the tracer afterwards and
+    (if headers is True) adds the counts to the response headers.
+    """
+    def __init__(self, application, tracer, headers=False):
+        self.application = application
+        self.tracer = tracer
+        self.headers = headers
+
+    def __call__(self, environ, start_response):
+        trace = Trace(current_trace.get())
+        token = current_trace.set(trace)
+        started = time.perf_counter()
+
+        environ['linkapp.redis_trace'] = trace
+
+        def traced_start_response(status, headers, exc_info=None):
+            if self.headers:
+                headers = headers + [
+                    ('X-Redis-Commands', str(trace.commands)),
+                    ('X-Redis-Round-Trips', str(trace.round_trips)),
+                    ('X-Redis-Time', "%.3fms" % (trace.seconds * 1000,)),
+                ]
+
+            return start_response(status, headers, exc_info)
+
+        def finish():
+            self.tracer.record_request(route_name(environ), trace, time.perf_counter() - started)
+
+        try:
+            result = self.application(environ, traced_start_response)
+        except BaseException:
+            finish()
+            raise
+        finally:
+            current_trace.reset(token)
+
+        return ResponseBody(result, finish, trace)
+
+
+@contextmanager
+def round_trips(budget=None):
+    """
+    Trace the TracedRedis calls made inside the with block. If budget is
+    given, raise AssertionError if there were more round trips than that.
+    """
+    trace = Trace(current_trace.get())
+    token = current_trace.set(trace)
+
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+    if budget is not None and trace.round_trips > budget:
+        raise AssertionError("%d redis round trips, the budget is %d:\n%s" % (
+            trace.round_trips, budget, trace.describe()))
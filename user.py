@@ -4,14 +4,19 @@ Module to handle users.
 
 import redis
 from passlib.hash import pbkdf2_sha256
+from changes import record_change
 
 class UserManager:
     
-    def __init__(self, host="localhost", port=6379, db=0):
+    def __init__(self, host="localhost", port=6379, db=0, hash_pool=None):
         self.host = host
         self.port = port
         self.db = db
         
+        # optional hashing.HashPool to hash/check passwords in, raises 
+        # hashing.PoolBusy when it's full.
+        self.hash_pool = hash_pool
+        
         self.connection = redis.StrictRedis(
             decode_responses=True,
             host=self.host, 
@@ -24,12 +29,17 @@ class UserManager:
         
     def encrypt(self, password):
         """Encrypts the password for saving in database."""
+        if self.hash_pool is not None:
+            return self.hash_pool.hash(password)
+            
         return pbkdf2_sha256.hash(password)
         
     def authenticate(self, username, password):
         """Verifying that the user entered the correct password"""
         user = self.list_one(username)
-        if user:
+        if user and self.hash_pool is not None:
+            return self.hash_pool.verify(password, user['password'])
+        elif user:
             return pbkdf2_sha256.verify(password, user['password'])
         else:
             return False
@@ -41,25 +51,34 @@ class UserManager:
         if not encrypted:
             password = self.encrypt(password)
             
-        self.connection.hmset(redis_key, {
-            'username':username,
-            'password':password
-        })
+        with self.connection.pipeline() as pipe:
+            pipe.hset(redis_key, mapping={
+                'username':username,
+                'password':password
+            })
+            record_change(pipe, "user", "add", username)
+            pipe.execute()
         
         return username
         
     def delete(self, username):
         """Deleting a user from the database."""
-        self.connection.delete(self.prefix_key(username))
+        with self.connection.pipeline() as pipe:
+            pipe.delete(self.prefix_key(username))
+            record_change(pipe, "user", "delete", username)
+            pipe.execute()
         
     def modify(self, username, password, encrypted=False):
         """Modify an existing user in the database."""
         if not encrypted:
             password = self.encrypt(password)
 
-        self.connection.hmset(
-            self.prefix_key(username), 
-            {'password':password})
+        with self.connection.pipeline() as pipe:
+            pipe.hset(
+                self.prefix_key(username), 
+                mapping={'password':password})
+            record_change(pipe, "user", "modify", username, fields=['password'])
+            pipe.execute()
         
     def list_one(self, username):
         """Retrieves a single user from the database"""
@@ -67,7 +86,7 @@ class UserManager:
         
     def listing(self):
         """Retrieving a list of users from database."""
-        keys = self.connection.keys("user:*")
+        keys = self.connection.scan_iter(self.prefix_key("*"), count=1000)
         
         with self.connection.pipeline() as pipe:
             for key in keys:
@@ -1,95 +1,71 @@
-import cgi
 import io
 import pprint
 import pystache
-from edit import LinkManager, ReadingListManager
+from edit import LinkManager, ReadingListManager, LINK_FIELDS
 import os.path
 import mimetypes
 import base64
 import user
-import re
 import math
+import json
+import time
+import api
+import forms
 from http.cookies import SimpleCookie
 from beaker.middleware import SessionMiddleware
+from hashing import PoolBusy
+from tracing import Tracer
+from metrics import LinkMemo, Metrics, MetricsMiddleware
+from profiling import SlowRequestLog
+from routing import Router
+from compression import CompressedCache, CompressionMiddleware
 
 
 renderer = pystache.Renderer(search_dirs='./templates', file_extension='html')
 
-def check_path(environ, path, start=False):
-    """
-    Return true if path is requested in the given environ dictionary.
-    
-    If start is True, match if path provided is the BEGINNING of the path info.
-       useful if you are doing something with the parts of the path AFTER the 
-       initial path (e.g. /edit/[id of thing to edit])
-    """
-    check = "%s%s" % (environ['linkapp.path_prefix'], path)
-    
-    if start:
-        if environ['PATH_INFO'].startswith(check+"/"):
-            return True
-        else:
-            return False
-    else:
-        if environ['PATH_INFO'] == check:
-            return True
-        else:
-            return False
+# parsed templates for stream_page, which renders them over and over.
+parsed_templates = {}
 
-class LinkWrapper:
-    """
-    Convenience class for wrapping raw redis data for Mustache use
-    """
-    def __init__(self, tags='', **kwargs):
-        self._tags = tags
+
+def parsed_template(name):
+    if name not in parsed_templates:
+        parsed_templates[name] = pystache.parse(renderer.load_template(name))
         
-        for key, value in kwargs.items():
-            setattr(self, key, value)
-            
-    @property
-    def tags(self):
-        """
-        Making it easy to get a list out of the tags property.
-        """
-        return [{"name": x} for x in self._tags.split("|")]
-        
-def hash_to_linkwrapper(response, **options):
+    return parsed_templates[name]
+    
+    
+def stream_page(name, context, batches):
     """
-    Takes a redis response list (result from HGETALL) and returns a LinkWrapper
-    object that can be used in Mustache templates in place of the typical 
-    dictionary that redis-py returns.
+    Render a list page a piece at a time, for returning as the body: the
+    name-head template straight away (before any links are fetched), then
+    name-entry for each link as each batch of them comes from redis, then
+    name-foot. name.html is the same page in one go, made of the three.
+    
+    Only one batch of links is held at a time however long the page. If 
+    redis fails part way the page is cut short, the headers are sent by then.
     """
-    # if the response is false, an empty string or empty list, etc, 
-    # return a dictionary - this is OK for mustache
-    if not response:
-        return {}
-        
-    # cleverness level up! CHEEKY
-    # if you pass the same iter object to zip(), it will take the even items in
-    # the iterator and use them for keys, and the odd ones for values.
-    # 
-    # NOTE: if that seems weird, remember that list indices start with 0 :)
-    #
-    it = iter(response)
+    yield renderer.render(parsed_template(name + '-head'), context).encode('utf-8')
     
-    # SUPER CHEEKY
-    attributes = dict(zip(it, it))
-
-    # make each member of the dictionary into a keyword argument to pass
-    # to the LinkWrapper constructor.
-    # equilivent to:
-    #   LinkWrapper(author='admin', page_title='Testing Number Two', tags='new|test|tags', etc)
-    return LinkWrapper(**attributes)
+    entry = parsed_template(name + '-entry')
     
+    for links in batches:
+        if links:
+            yield "".join(renderer.render(entry, context, x) for x in links).encode('utf-8')
+            
+    yield renderer.render(parsed_template(name + '-foot'), context).encode('utf-8')
     
+
 class AuthenticationMiddleware:
     """
     This will wrap a wsgi app to require a username and password.
     """
+    # for admission.is_expensive, requests with a password cost a pbkdf2.
+    checks_password = True
+    
     def __init__(self, application):
         self.application = application
 
-    def __call__(self, environ, start_response):
+    def __call__(self, environ, start_response, **params):
         
         session = environ['beaker.session']
 
@@ -97,12 +73,26 @@ class AuthenticationMiddleware:
             auth_type, hashed_pass = environ['HTTP_AUTHORIZATION'].split(' ')
             decoded = base64.b64decode(hashed_pass)
             username, password = decoded.decode('utf-8').split(':')
-            if environ['linkapp.user_manager'].authenticate(username, password):
+            
+            started = time.perf_counter()
+            
+            try:
+                authenticated = environ['linkapp.user_manager'].authenticate(username, password)
+            except PoolBusy as e:
+                # too many passwords being checked already, see hashing.
+                start_response('503 Service Unavailable', [('Content-Type', 'text/plain'), ('Retry-After', str(e.retry_after))])
+                return [b'Service Unavailable, Try Again Shortly']
+                
+            if 'linkapp.metrics' in environ:
+                environ['linkapp.metrics'].auth_seconds.labels(
+                    "ok" if authenticated else "failed").observe(time.perf_counter() - started)
+                
+            if authenticated:
                 
                 session['logged_in'] = True
                 session['username'] = username
                 
-                return self.application(environ, start_response)
+                return self.application(environ, start_response, **params)
                 
             else:
                 session['logged_in'] = False
@@ -115,10 +105,6 @@ class AuthenticationMiddleware:
 
 def new(environ, start_response):
     """This wsgi app gives the form to be filled out."""
-    if environ['REQUEST_METHOD'] != 'GET':
-        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
-        return [b'Bad Request, Method Not Supported']
-        
     context = {
        'prefix': environ['linkapp.path_prefix'], 
        'link':True
@@ -129,26 +115,15 @@ def new(environ, start_response):
     start_response('200 OK', [('Content-Type', 'text/html')])
     return [html.encode('utf-8')]
 
-def edit(environ, start_response):
+def edit(environ, start_response, key):
     """This wsgi app gives the form to be filled out.
-    
+
     TODO: If key is passed but not found in the database it should return a 404.
     """
-    if environ['REQUEST_METHOD'] != 'GET':
-        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
-        return [b'Bad Request, Method Not Supported']
-
-    match = re.search("/([^/]+)$", environ['PATH_INFO'])
-    
-    if not match:
-        start_response('404 Not Found', [('Content-Type', 'text/plain')])
-        return [b'Not Found']
-    
-    # the first grouping in the regex is the id of the link post.
     context = {
-        'link': environ['linkapp.link_manager'].list_one(match.group(1)),
+        'link': environ['linkapp.link_manager'].list_one(key, memo=environ.get('linkapp.link_memo')),
         'prefix': environ['linkapp.path_prefix'],
-        'key': match.group(1)
+        'key': key
     }
     
     html = renderer.render_name('form', context)
@@ -156,26 +131,15 @@ def edit(environ, start_response):
     start_response('200 OK', [('Content-Type', 'text/html')])
     return [html.encode('utf-8')]
     
-def one_post(environ, start_response):
+def one_post(environ, start_response, key):
     """This wsgi app gives one post at a time for viewing.
-    
+
     TODO: If key is passed but not found in the database it should return a 404.
     """
-    if environ['REQUEST_METHOD'] != 'GET':
-        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
-        return [b'Bad Request, Method Not Supported']
-
-    match = re.search("/([^/]+)$", environ['PATH_INFO'])
-    
-    if not match:
-        start_response('404 Not Found', [('Content-Type', 'text/plain')])
-        return [b'Not Found']
-    
-    # the first grouping in the regex is the id of the link post.
     context = {
-        'one_post': environ['linkapp.link_manager'].list_one(match.group(1)),
+        'one_post': environ['linkapp.link_manager'].list_one(key, fields=LINK_FIELDS, memo=environ.get('linkapp.link_memo')),
         'prefix': environ['linkapp.path_prefix'],
-        'key': match.group(1)
+        'key': key
     }
     
     html = renderer.render_name('one_post', context)
@@ -184,49 +148,45 @@ def one_post(environ, start_response):
     return [html.encode('utf-8')]
     
 
-def save(environ, start_response):
+# the fields the link form sends, nothing else in the body is decoded.
+SAVE_FIELDS = ('page_title', 'desc_text', 'url_address', 'tags')
+
+def save(environ, start_response, key=None):
     """This wsgi app sends the collected data back to the client."""
-    if environ['REQUEST_METHOD'] != 'POST':
-        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
-        return [b'Bad Request, Method Not Supported']
-    
     # if there's a key presented after /save, we need to use modify(), since
     # we're changing a link. Otherwise, we need to use add()
-    theres_a_key = re.search("/([^/]+)$", environ['PATH_INFO'])
-    
-    if theres_a_key:
-        key = theres_a_key.group(1)
-    else:
-        key = None
-    
-    post = cgi.FieldStorage(
-            fp=environ['wsgi.input'],
-            environ=environ,
-            keep_blank_values=True
-        )
+    try:
+        post = forms.parse_form(environ, SAVE_FIELDS, environ.get('linkapp.max_form_bytes', forms.MAX_FORM_BYTES))
+    except forms.FormTooLarge:
+        start_response('413 Content Too Large', [('Content-Type', 'text/plain'), ('Connection', 'close')])
+        return [b'Content Too Large']
+    except forms.FormError:
+        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
+        return [b'Bad Request, Expected A Form']
 
     errors = []
     
-    page_title = post.getvalue('page_title', None)
+    page_title = post.get('page_title')
     if page_title is None or page_title == '':
         errors.append({'message':b'Page Title Required'})
     
-    desc_text = post.getvalue('desc_text', None)
+    desc_text = post.get('desc_text')
     if desc_text is None or desc_text == '':
         errors.append({'message':b'Description Required'})
     
-    url_address = post.getvalue('url_address', None)
+    url_address = post.get('url_address')
     if url_address is None or url_address == '':
         errors.append({'message':b'URL is a required field'})
         
     if url_address:
-        if theres_a_key:
-            if environ['linkapp.link_manager'].url_changed(key, url_address) and environ['linkapp.link_manager'].url_exists(url_address):
-                errors.append({'message':b'URL has already been posted'})
-        elif environ['linkapp.link_manager'].url_exists(url_address):
-            errors.append({'message':b'URL has already been posted'})
+        # one lookup tells us if the url is taken and by which link, when 
+        # editing it's fine if the link that has it is this one.
+        existing = environ['linkapp.link_manager'].url_owner(url_address)
+        
+        if existing is not None and existing != key:
+            errors.append({'message':b'URL has already been posted', 'existing': existing})
     
-    tags = post.getvalue('tags', None)
+    tags = post.get('tags')
     
     if tags is None or tags == '':
         errors.append({'message':b'Please enter at least one tag.'})
@@ -251,7 +211,7 @@ def save(environ, start_response):
         start_response('200 OK', [('Content-Type', 'text/html')])
         return [html.encode('utf-8')]
     else:
-        if theres_a_key:
+        if key is not None:
             environ['linkapp.link_manager'].modify(
                 key, 
                 page_title=page_title, 
@@ -272,20 +232,10 @@ def save(environ, start_response):
         start_response('302 Found', [('Location', redirect_to)])
         return [redirect_to.encode('utf-8')]
     
-def listing(environ, start_response):
-    
-    if environ['REQUEST_METHOD'] != 'GET':
-        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
-        return [b'Bad Request, Method Not Supported']
-    
+def listing(environ, start_response, page=1):
+
     per_page = 10
-    page = environ['PATH_INFO'].split("/")[-1]
-    
-    try:
-        page = int(page)
-    except ValueError:
-        page = 1
-        
+
     if page <= 0:
         redirect_to = 'http://%s%s' % (environ['HTTP_HOST'], environ['linkapp.path_prefix']) 
         start_response('302 Found', [('Location', redirect_to)])
@@ -301,7 +251,6 @@ def listing(environ, start_response):
     last = int(math.ceil(count/per_page))
         
     context = { 
-        'links': environ['linkapp.link_manager'].listing(tag_func=hash_to_linkwrapper, start=start, stop=stop),
         'count': count,
         'last': last,
         'prefix': environ['linkapp.path_prefix'],
@@ -314,36 +263,15 @@ def listing(environ, start_response):
     if page != last:
         context['next'] = str(next)
     
-    html = renderer.render_name('list', context)
+    links = environ['linkapp.link_manager'].iter_listing(start=start, stop=stop, fields=LINK_FIELDS)
 
     start_response('200 OK', [('Content-Type', 'text/html')])
-    return [html.encode('utf-8')]
-    
-def listing_by_tag(environ, start_response):
-    
-    if environ['REQUEST_METHOD'] != 'GET':
-        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
-        return [b'Bad Request, Method Not Supported']
-        
-    # To support unicode paths (e.g. emoji in tags), 
-    # we need to un-encode the path, then re-encode it as uft-8
-    # source: https://bugs.python.org/msg177450
-    encoded = environ['PATH_INFO'].encode("ISO-8859-1")
-    new_path = encoded.decode('utf-8')
-    
-    tag = new_path.split("/")[-1]
-    
-    if "," in tag:
-        tag, page = tag.split(",", 1)
-        
-        try:
-            page = int(page)
-        except ValueError:
-            page = 1
-    else:
-        page = 1
-        
+    return stream_page('list', context, links)
     
+def listing_by_tag(environ, start_response, tag, page=1):
+
+    # the router un-encodes the tag so it can be unicode (e.g. emoji in
+    # tags) and takes the page off the end of it, see routing.tag_param.
     per_page = 10
 
     stop = page*per_page-1
@@ -362,7 +290,6 @@ def listing_by_tag(environ, start_response):
     last = int(math.ceil(count/per_page))
     
     context = { 
-        'links': environ['linkapp.link_manager'].listing(tag, tag_func=hash_to_linkwrapper, start=start, stop=stop),
         'prefix': environ['linkapp.path_prefix'],
         'tag': tag,
         'last': last,
@@ -376,32 +303,32 @@ def listing_by_tag(environ, start_response):
     if page != last:
         context['next'] = str(next)
     
-    
-    html = renderer.render_name('list', context)
+    links = environ['linkapp.link_manager'].iter_listing(tag, start=start, stop=stop, fields=LINK_FIELDS)
 
     start_response('200 OK', [('Content-Type', 'text/html')])
-    return [html.encode('utf-8')]
+    return stream_page('list', context, links)
     
 
 
     
-def static(environ, start_response):
+def static(environ, start_response, path):
     
     # TODO: decide how we want the browser to cache the static content
     #       see: cache-control headers.
     
-    path = environ['PATH_INFO'].replace(environ['linkapp.path_prefix'], "", 1)
-    parts = path.split("/")
-    parts = parts[1:]
-    
     # TODO: let the static directory be specified in configuration
-    # TODO: make sure you can't load arbitrary files!
-    to_get = os.path.join("./static", *parts)
+    # the router doesn't let .. into path, see routing.path_param.
+    to_get = os.path.join("./static", *path)
     
     if os.path.isfile(to_get):
         content_type, encoding = mimetypes.guess_type(to_get)
+        stat = os.stat(to_get)
         
-        start_response('200 OK', [('Content-Type', content_type)])
+        # the ETag lets compression keep the file compressed, see compression.
+        start_response('200 OK', [
+            ('Content-Type', content_type),
+            ('Content-Length', str(stat.st_size)),
+            ('ETag', '"%x-%x"' % (stat.st_mtime_ns, stat.st_size))])
         
         block_size = 4096
         
@@ -420,26 +347,16 @@ def static(environ, start_response):
             # Except that it doesn't get a name and gets garbage collected
             # when it's no longer used.
             
-            return iter(lambda: asset.read(block_size), '')
+            return iter(lambda: asset.read(block_size), b'')
     else:
         start_response('404 Not Found', [('Content-Type', 'text/plain')])
         return [b'Not Found']
         
         
         
-def add_to_my_reading_list(environ, start_response):
+def add_to_my_reading_list(environ, start_response, key):
     
-    if environ['REQUEST_METHOD'] != 'GET':
-        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
-        return [b'Bad Request, Method Not Supported']
-
-    match = re.search("/([^/]{32})$", environ['PATH_INFO'])
-    
-    if not match:
-        start_response('404 Not Found', [('Content-Type', 'text/plain')])
-        return [b'Not Found']
-    
-    link = environ['linkapp.link_manager'].list_one(match.group(1))[0]
+    link = environ['linkapp.link_manager'].list_one(key, memo=environ.get('linkapp.link_memo'))[0]
     
     if not link:
         start_response('404 Not Found', [('Content-Type', 'text/plain')])
@@ -453,39 +370,67 @@ def add_to_my_reading_list(environ, start_response):
     start_response('302 Found', [('Location', redirect_to)])
     return [redirect_to.encode('utf-8')]
 
-def my_reading_list(environ, start_response):
+def my_reading_list(environ, start_response, page=1):
     
-    if environ['REQUEST_METHOD'] != 'GET':
-        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
-        return [b'Bad Request, Method Not Supported']
+    per_page = 20
+
+    if page <= 0:
+        redirect_to = 'http://%s%sreading-list' % (environ['HTTP_HOST'], environ['linkapp.path_prefix']) 
+        start_response('302 Found', [('Location', redirect_to)])
+        return []
         
+    stop = page*per_page-1
+    start = page*per_page-per_page
+    
+    next = page+1
+    previous = page-1
+    
     user = environ['beaker.session']['username']
+    
+    count = environ['linkapp.rl_manager'].count(user)
+    last = int(math.ceil(count/per_page))
+    
     context = {
         "user":user,
         'prefix': environ['linkapp.path_prefix'],
-        "links": environ['linkapp.rl_manager'].to_read(user, tag_func=hash_to_linkwrapper)
+        'count': count,
+        'last': last,
     }
-    html = renderer.render_name('reading-list', context)
-    
     
+    if page > 1:
+        # making previous a string so mustache won't think its false.
+        context['previous'] = str(previous)
+        
+    if page < last:
+        context['next'] = str(next)
+        
+    links = environ['linkapp.rl_manager'].iter_to_read(user, start=start, stop=stop, fields=LINK_FIELDS)
     
     start_response('200 OK', [('Content-Type', 'text/html')])
-    return [html.encode('utf-8')]
+    return stream_page('reading-list', context, links)
     
-
-def mark_read(environ, start_response):
+def my_whole_reading_list(environ, start_response):
     
-    if environ['REQUEST_METHOD'] != 'GET':
-        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
-        return [b'Bad Request, Method Not Supported']
-
-    match = re.search("/([^/]{32})$", environ['PATH_INFO'])
+    # the whole list on one page, however long. It's streamed, so that's
+    # one batch of links in memory at a time, see stream_page.
+    user = environ['beaker.session']['username']
     
-    if not match:
-        start_response('404 Not Found', [('Content-Type', 'text/plain')])
-        return [b'Not Found']
+    context = {
+        "user":user,
+        'prefix': environ['linkapp.path_prefix'],
+        'count': environ['linkapp.rl_manager'].count(user),
+        'last': 1,
+    }
+    
+    links = environ['linkapp.rl_manager'].iter_all_to_read(user, fields=LINK_FIELDS)
+    
+    start_response('200 OK', [('Content-Type', 'text/html')])
+    return stream_page('reading-list', context, links)
+    
+
+def mark_read(environ, start_response, key):
     
-    link = environ['linkapp.link_manager'].list_one(match.group(1))[0]
+    link = environ['linkapp.link_manager'].list_one(key, memo=environ.get('linkapp.link_memo'))[0]
     
     if not link:
         start_response('404 Not Found', [('Content-Type', 'text/plain')])
@@ -499,50 +444,172 @@ def mark_read(environ, start_response):
     start_response('302 Found', [('Location', redirect_to)])
     return [redirect_to.encode('utf-8')]
 
+def links_batch(environ, start_response):
+    """
+    JSON API for changing many links at once, POST a JSON object with any of:
+    
+        "add": [{"page_title", "desc_text", "url_address", "tags", "created"}, ...]
+        "delete": [id, ...]
+        "retag": {"keys": [id, ...], "add": [tag, ...], "remove": [tag, ...]}
+        
+    The reply has the same keys, each a list with a {"key", "error"} result 
+    per link (error is null if it worked), see LinkManager.add_many etc.
+    Bodies over the form size limit get a 413 like save.
+    """
+    try:
+        chunks = forms.body_chunks(environ, environ.get('linkapp.max_form_bytes', forms.MAX_FORM_BYTES))
+        body = json.loads(b''.join(chunks).decode('utf-8'))
+        
+        if not isinstance(body, dict):
+            raise ValueError("expected a JSON object")
+            
+        retag = body.get('retag')
+        if retag is not None and not isinstance(retag, dict):
+            raise ValueError("retag must be a JSON object")
+            
+    except forms.FormTooLarge:
+        start_response('413 Content Too Large', [('Content-Type', 'text/plain'), ('Connection', 'close')])
+        return [b'Content Too Large']
+        
+    except ValueError:
+        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
+        return [b'Bad Request, Expected A JSON Object']
+        
+    link_manager = environ['linkapp.link_manager']
+    result = {}
+    
+    try:
+        if 'add' in body:
+            result['add'] = link_manager.add_many(
+                body['add'], author=environ['beaker.session']['username'])
+            
+        if 'delete' in body:
+            result['delete'] = link_manager.delete_many(body['delete'])
+            
+        if retag is not None:
+            result['retag'] = link_manager.retag_many(
+                retag.get('keys', []), 
+                add=retag.get('add', []), 
+                remove=retag.get('remove', []))
+                
+    except (TypeError, AttributeError):
+        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
+        return [b'Bad Request, Malformed Batch']
+            
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return [json.dumps(result).encode('utf-8')]
+
+def show_metrics(environ, start_response):
+    """
+    The metrics for every worker in the Prometheus text format, if the app
+    has metrics (see AppFactory).
+    """
+    if 'linkapp.metrics' not in environ:
+        start_response('404 Not Found', [('Content-Type', 'text/plain')])
+        return [b'Not Found']
+        
+    body = environ['linkapp.metrics'].render().encode('utf-8')
+    
+    start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')])
+    return [body]
+
 auth_new = AuthenticationMiddleware(new)
 auth_save = AuthenticationMiddleware(save)
 auth_edit = AuthenticationMiddleware(edit)
 auth_add_to_my_reading_list = AuthenticationMiddleware(add_to_my_reading_list)
 auth_mark_read = AuthenticationMiddleware(mark_read)
 auth_my_reading_list = AuthenticationMiddleware(my_reading_list)
+auth_my_whole_reading_list = AuthenticationMiddleware(my_whole_reading_list)
+auth_links_batch = AuthenticationMiddleware(links_batch)
+auth_api_reading_list = AuthenticationMiddleware(api.reading_list)
     
-def main(environ, start_response):
-    if check_path(environ, ""):
-        return listing(environ, start_response)
-    if check_path(environ, "page", True):
-        return listing(environ, start_response)
-    elif check_path(environ, "tag", True):
-        return listing_by_tag(environ, start_response)
-    elif environ['PATH_INFO'].startswith("%sstatic" % (environ['linkapp.path_prefix'],)):
-        return static(environ, start_response)
-    elif check_path(environ, "new"):
-        return auth_new(environ, start_response)
-    elif check_path(environ, "save", True):
-        return auth_save(environ, start_response)
-    elif check_path(environ, "edit", True):
-        return auth_edit(environ, start_response)
-    elif check_path(environ, "view", True):
-        return one_post(environ, start_response)
-    elif check_path(environ, "reading-list", False):
-        return auth_my_reading_list(environ, start_response)
-    elif check_path(environ, "reading-list/add", True):
-        return auth_add_to_my_reading_list(environ, start_response)
-    elif check_path(environ, "reading-list/read", True):
-        return auth_mark_read(environ, start_response)
-    else:
-        start_response('404 Not Found', [('Content-Type', 'text/plain')])
-        return [b'Not Found']
+def routes(path_prefix):
+    """
+    The router for every page, see routing. Built once by AppFactory.
+    """
+    router = Router(path_prefix)
+    
+    router.add("", listing, name="listing")
+    router.add("page/{page}", listing, name="listing")
+    router.add("tag/{tag}", listing_by_tag)
+    router.add("static/{path:path}", static)
+    router.add("new", auth_new)
+    router.add("save/", auth_save, methods=('POST',))
+    router.add("save/{key:id}", auth_save, methods=('POST',))
+    router.add("edit/{key:id}", auth_edit)
+    router.add("view/{key:id}", one_post)
+    router.add("reading-list", auth_my_reading_list)
+    router.add("reading-list/page/{page}", auth_my_reading_list, name="reading-list")
+    router.add("reading-list/all", auth_my_whole_reading_list)
+    router.add("reading-list/add/{key:id}", auth_add_to_my_reading_list)
+    router.add("reading-list/read/{key:id}", auth_mark_read)
+    router.add("api/links:batch", auth_links_batch, methods=('POST',))
+    router.add("api/v1/links", api.links)
+    router.add("api/v1/links/{raw_id:id}", api.one_link)
+    router.add("api/v1/tags/{tags:path}", api.links)
+    router.add("api/v1/counts", api.counts)
+    router.add("api/v1/reading-list", auth_api_reading_list)
+    router.add("api/v1/{path:path}", api.not_found, name="api/v1")
+    router.add("metrics", show_metrics)
+    
+    return router
     
 class AppFactory:
     """
     Configure and return the main WSGI app for this application.
-    """
     
-    def __init__(self, redis_host='localhost', redis_port=6379, redis_db=0, path_prefix="/linkapp/", session_opts=None):
+    Pass a tracing.Tracer as tracer to count and time redis commands per 
+    request, with debug=True the counts are sent as response headers too 
+    (and a Tracer is made if there isn't one).
+    
+    Pass a metrics.Metrics as metrics to record requests and serve them at
+    /metrics.
+    
+    Pass a profiling.Profiler as profiler to profile requests that ask for it
+    (or a sample of them), and slow_request_seconds to log requests slower 
+    than that with their redis breakdown (which needs a Tracer, one is made 
+    if there isn't one).
+
+    max_form_bytes is the most a form POSTed to save (or a batch POSTed to 
+    api/links:batch) can be, bigger ones get a 413 (see forms).
+    
+    Responses are gzipped for clients that take it (see compression), pass
+    compress=False if something in front of the app does that already.
+    
+    Pass an admission.AdmissionControl as admission to shed expensive 
+    requests when the worker is overloaded and answer listings from their 
+    last copy when redis is slow, the thresholds are its arguments (it needs
+    a Tracer for the redis times, one is made if there isn't one).
+    """
+
+    def __init__(self, redis_host='localhost', redis_port=6379, redis_db=0, path_prefix="/linkapp/", session_opts=None, hash_pool=None, tracer=None, debug=False, metrics=None, profiler=None, slow_request_seconds=None, max_form_bytes=forms.MAX_FORM_BYTES, compress=True, admission=None):
         self.link_manager = LinkManager(redis_host, redis_port, redis_db)
-        self.um = user.UserManager(redis_host, redis_port, redis_db)
+        self.um = user.UserManager(redis_host, redis_port, redis_db, hash_pool=hash_pool)
         self.rl = ReadingListManager(redis_host, redis_port, redis_db)
         self.path_prefix = path_prefix
+        self.router = routes(path_prefix)
+        self.debug = debug
+        
+        if tracer is None and (debug or slow_request_seconds is not None or admission is not None):
+            tracer = Tracer()
+            
+        self.tracer = tracer
+        
+        if tracer is not None:
+            tracer.instrument(self.link_manager, self.um, self.rl)
+            
+        self.metrics = metrics
+        self.profiler = profiler
+        self.slow_request_seconds = slow_request_seconds
+        self.max_form_bytes = max_form_bytes
+        self.compressed_cache = CompressedCache() if compress else None
+        self.admission = admission
+        
+        if metrics is not None:
+            metrics.watch_pools(
+                links=self.link_manager.connection.connection_pool,
+                users=self.um.connection.connection_pool,
+                reading_lists=self.rl.connection.connection_pool)
         
         if session_opts is None:
             session_opts = {
@@ -556,12 +623,38 @@ class AppFactory:
         environ['linkapp.link_manager'] = self.link_manager
         environ['linkapp.rl_manager'] = self.rl
         environ['linkapp.path_prefix'] = self.path_prefix
+        environ['linkapp.max_form_bytes'] = self.max_form_bytes
         environ['linkapp.user_manager'] = self.um 
         
-        app = SessionMiddleware(main, self.session_opts)
+        # links fetched during this request, see edit.hydrate_links
+        environ['linkapp.link_memo'] = {}
+        
+        app = SessionMiddleware(self.router, self.session_opts)
+        
+        if self.compressed_cache is not None:
+            app = CompressionMiddleware(app, cache=self.compressed_cache)
+            
+        # outside compression, so the copies it keeps are already compressed.
+        if self.admission is not None:
+            app = self.admission.middleware(app, self.router)
+            
+        if self.tracer is not None:
+            app = self.tracer.middleware(app, headers=self.debug)
+            
+        if self.metrics is not None:
+            environ['linkapp.metrics'] = self.metrics
+            environ['linkapp.link_memo'] = LinkMemo()
+            app = MetricsMiddleware(app, self.metrics)
+            
+        if self.slow_request_seconds is not None:
+            app = SlowRequestLog(app, self.slow_request_seconds)
+            
+        if self.profiler is not None:
+            app = self.profiler.middleware(app)
+            
         return app(environ, start_response)
         
         
 
-app = AppFactory(path_prefix="/")
+app = AppFactory(path_prefix="/", metrics=Metrics.from_environment())
 